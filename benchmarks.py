@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+
+"""Benchmarks for the esq1 module.
+
+Each benchmark is run at several scales (a single patch, an 'all program
+dump' bank of 40 patches, and a library of 100,000 patches), and reports its
+throughput and peak memory use as JSON, so results can be compared between
+releases:
+
+    python benchmarks.py --output results.json
+    python benchmarks.py --scale single --scale bank --benchmark serialize
+"""
+
+import argparse
+from collections import OrderedDict
+from copy import deepcopy
+import gc
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from esq1 import (ESQ1Patch, Oscillator, BANK_SIZE, esq1_patches_to_sysex,
+                  load_sysex, sysex_to_esq1_patches)
+from esq1_export import write_json_lines, write_npy
+
+
+SCALES = OrderedDict([
+    ('single', 1),
+    ('bank', BANK_SIZE),
+    ('library', 100000),
+])
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(function=None, setup=None):
+    """Register a benchmark. The function is passed a Context and performs
+    the measured work on every one of its patches.
+
+    setup -- a function passed the Context before each measured run, for work
+      that should not be measured.
+    """
+    if function is None:
+        return lambda function: benchmark(function, setup)
+
+    function.setup = setup
+    BENCHMARKS[function.__name__] = function
+
+    return function
+
+
+def banks(patches):
+    """Split a list of patches into lists of at most 40 patches."""
+    return [patches[i:i + BANK_SIZE] for i in range(0, len(patches),
+                                                    BANK_SIZE)]
+
+
+class Context(object):
+    """The inputs of a benchmark, prepared before it is measured.
+
+    Attributes:
+
+    count -- the number of patches.
+
+    patches -- a list of count randomized patches.
+
+    others -- a copy of each patch, for comparisons.
+
+    records -- the serialized bytes of each patch.
+
+    directory -- a temporary directory for SYSEX files.
+
+    sysex_filenames -- SYSEX files containing the patches, 40 per file.
+    """
+
+    def __init__(self, count):
+        self.count = count
+        self.patches = []
+
+        for i in range(count):
+            patch = ESQ1Patch()
+            patch.randomize()
+            self.patches.append(patch)
+
+        self.others = deepcopy(self.patches)
+        self.records = [bytes(patch.serialize()) for patch in self.patches]
+        self.directory = tempfile.mkdtemp()
+        self.sysex_filenames = []
+
+        for i, bank in enumerate(banks(self.patches)):
+            filename = os.path.join(self.directory, 'read-%d.syx' % i)
+            esq1_patches_to_sysex(bank, filename)
+            self.sysex_filenames.append(filename)
+
+    def restore(self):
+        """Restore patches and others to their original values, after a
+        benchmark has changed them.
+        """
+        for patch, other, record in zip(self.patches, self.others,
+                                        self.records):
+            patch.deserialize(iter(record))
+            other.deserialize(iter(record))
+
+    def close(self):
+        shutil.rmtree(self.directory)
+
+
+@benchmark
+def construct(context):
+    for i in range(context.count):
+        ESQ1Patch()
+
+
+@benchmark
+def randomize(context):
+    for patch in context.patches:
+        patch.randomize()
+
+
+@benchmark
+def serialize(context):
+    for patch in context.patches:
+        patch.serialize()
+
+
+def _serialize_and_edit(context):
+    for patch in context.patches:
+        patch.serialize()
+
+    context.patches[0].oscillators[0].waveform.value = Oscillator.SAW
+
+
+@benchmark(setup=_serialize_and_edit)
+def serialize_after_edit(context):
+    """Serialize every patch, when only one parameter of one patch has
+    changed since they were last serialized.
+    """
+    for patch in context.patches:
+        patch.serialize()
+
+
+@benchmark
+def deserialize(context):
+    patch = ESQ1Patch()
+
+    for record in context.records:
+        patch.deserialize(iter(record))
+
+
+@benchmark
+def equal(context):
+    for patch, other in zip(context.patches, context.others):
+        patch == other
+
+
+@benchmark
+def copy_deepcopy(context):
+    for patch in context.patches:
+        deepcopy(patch)
+
+
+@benchmark
+def copy_clone(context):
+    for patch in context.patches:
+        patch.clone()
+
+
+@benchmark
+def read_sysex(context):
+    for filename in context.sysex_filenames:
+        sysex_to_esq1_patches(filename)
+
+
+@benchmark
+def read_sysex_names(context):
+    for filename in context.sysex_filenames:
+        load_sysex(filename).names
+
+
+@benchmark
+def write_sysex(context):
+    filename = os.path.join(context.directory, 'write.syx')
+
+    for bank in banks(context.patches):
+        esq1_patches_to_sysex(bank, filename)
+
+
+@benchmark
+def export_json_lines(context):
+    write_json_lines(context.patches,
+                     os.path.join(context.directory, 'export.jsonl'))
+
+
+@benchmark
+def export_npy(context):
+    write_npy(context.patches, os.path.join(context.directory, 'export.npy'))
+
+
+def measure(function, context, repeat):
+    """Return the fastest of repeat runs of function, in seconds, and the
+    peak memory allocated during one traced run, in bytes.
+    """
+    timings = []
+
+    for i in range(repeat):
+        context.restore()
+
+        if function.setup is not None:
+            function.setup(context)
+
+        gc.collect()
+        start = time.perf_counter()
+        function(context)
+        timings.append(time.perf_counter() - start)
+
+    context.restore()
+
+    if function.setup is not None:
+        function.setup(context)
+
+    gc.collect()
+    tracemalloc.start()
+    function(context)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return min(timings), peak
+
+
+def run(benchmarks, scales, repeat):
+    """Run each benchmark at each scale and return a list of results."""
+    results = []
+
+    for scale in scales:
+        count = SCALES[scale]
+        context = Context(count)
+
+        try:
+            for name in benchmarks:
+                # large scales take long enough to time in one run.
+                seconds, peak = measure(BENCHMARKS[name], context,
+                                        repeat if count < 1000 else 1)
+
+                results.append(OrderedDict([
+                    ('benchmark', name),
+                    ('scale', scale),
+                    ('patches', count),
+                    ('seconds', seconds),
+                    ('patches_per_second', count / seconds),
+                    ('peak_memory_bytes', peak),
+                ]))
+
+                sys.stderr.write('%-20s %-8s %12.0f patches/s %12d bytes\n' %
+                                 (name, scale, count / seconds, peak))
+        finally:
+            context.close()
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--benchmark', action='append',
+                        choices=list(BENCHMARKS),
+                        help='benchmark to run (default: all).')
+    parser.add_argument('--scale', action='append', choices=list(SCALES),
+                        help='scale to run at (default: all).')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of timed runs, of which the fastest is '
+                             'reported (default: 5).')
+    parser.add_argument('--output', help='write the JSON results to a file '
+                                         'rather than stdout.')
+    arguments = parser.parse_args(argv)
+
+    results = run(arguments.benchmark or list(BENCHMARKS),
+                  arguments.scale or list(SCALES), arguments.repeat)
+
+    report = OrderedDict([
+        ('python', platform.python_version()),
+        ('implementation', platform.python_implementation()),
+        ('platform', platform.platform()),
+        ('results', results),
+    ])
+
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
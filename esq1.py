@@ -1,4 +1,85 @@
-from random import randint
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+import hashlib
+import heapq
+import mmap
+from multiprocessing import shared_memory
+from multiprocessing.util import Finalize
+import os
+import random
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is only required by PatchBank.
+    np = None
+
+
+# the length, in bytes, of one patch's Program Control Block.
+PCB_LENGTH = 102
+
+# the location of (part of) a parameter's value within the PCB.
+#
+# path -- the parameter's path relative to its section (or the patch), such as
+#   'levels[0]' or 'oscillators[1].waveform'.
+# offset -- the byte offset.
+# mask -- the bits of the byte holding the value.
+# shift -- the number of bits the value is shifted left within the byte.
+# position -- the bit position within the value of the bits stored in the
+#   byte. Only the LFO's modulation source is split across two bytes.
+# signed -- True if the value is stored using display_to_pcb().
+PCBField = namedtuple('PCBField',
+                      ['path', 'offset', 'mask', 'shift', 'position',
+                       'signed'])
+
+
+def _field(path, offset, mask, shift=0, position=0, signed=False):
+    return PCBField(path, offset, mask, shift, position, signed)
+
+
+_PATH_TOKEN = re.compile(r'\.?([A-Za-z_][A-Za-z0-9_]*)|\[(\d+)\]')
+_parsed_paths = {}
+
+
+def parse_path(path):
+    """Split a path such as 'oscillators[1].waveform' into a tuple of
+    attribute names and list indexes, such as ('oscillators', 1, 'waveform').
+    """
+    try:
+        return _parsed_paths[path]
+    except KeyError:
+        pass
+
+    parts = []
+    position = 0
+
+    for match in _PATH_TOKEN.finditer(path):
+        if match.start() != position:
+            break
+
+        name, index = match.groups()
+        parts.append(name if name is not None else int(index))
+        position = match.end()
+
+    if not parts or position != len(path):
+        raise ValueError('Invalid path - %s' % path)
+
+    _parsed_paths[path] = parts = tuple(parts)
+
+    return parts
+
+
+def resolve_path(obj, path):
+    """Return the attribute of obj (a patch or section) found at path."""
+    for part in parse_path(path):
+        if isinstance(part, int):
+            obj = obj[part]
+        else:
+            obj = getattr(obj, part)
+
+    return obj
 
 
 def simple_patch():
@@ -17,12 +98,57 @@ def simple_patch():
     return patch
 
 
+ParameterSpec = namedtuple('ParameterSpec', ['minimum', 'maximum', 'default'])
+
+_parameter_specs = {}
+
+
+def parameter_spec(minimum, maximum, default):
+    """Return the ParameterSpec for the given range and default. Specs are
+    shared between every parameter with the same range and default.
+    """
+    key = (minimum, maximum, default)
+
+    try:
+        return _parameter_specs[key]
+    except KeyError:
+        spec = _parameter_specs[key] = ParameterSpec(*key)
+
+        return spec
+
+
+def random_source(rng=None):
+    """Return something to draw random numbers from: the random module if rng
+    is None, a random.Random seeded with rng if it is a seed, or rng itself.
+    """
+    if rng is None:
+        return random
+    elif isinstance(rng, (int, str, bytes)):
+        return random.Random(rng)
+
+    return rng
+
+
+def patch_rng(seed, index):
+    """Return the random.Random used for the patch at index of a run of
+    random patches seeded with seed.
+
+    Each patch has its own stream, depending only on the seed and the index,
+    so any part of a run can be generated independently (for example, by
+    different processes) and still be identical.
+    """
+    return random.Random('esq1:%s:%d' % (seed, index))
+
+
 class Parameter(object):
     """A patch parameter.
 
     Prevents the user from specifying an out-of-range value and allows the
     parameter to be set to its minimum, maximum, default, or random value.
 
+    To keep patches small, each instance only stores its value and a shared
+    ParameterSpec (see parameter_spec()) holding its range and default.
+
     Attributes:
 
     minimum -- the minimum value. Must be <= maximum.
@@ -33,23 +159,71 @@ class Parameter(object):
         and <= maximum.
 
     value -- the current value.
+
+    owner -- the ParameterCollection the parameter belongs to, a tuple of them
+        if it is shared, or None. Set when the parameter is assigned to one.
     """
 
+    __slots__ = ('spec', '_value', 'owner')
+
     def __init__(self, minimum, maximum, default=None):
         if minimum > maximum:
             raise ValueError('Minimum (%d) must be less than maximum (%d).' %
                              (minimum, maximum))
 
-        self.minimum = minimum
-        self.maximum = maximum
+        if default is None:
+            default = minimum
 
-        if default is not None:
-            self.default = default
-        else:
-            self.default = self.minimum
+        self.spec = parameter_spec(minimum, maximum, default)
+        self.owner = None
 
         self.reset()
 
+    def clone(self):
+        """Return a copy of the parameter, which is not owned by any
+        collection.
+        """
+        copy = self.__class__.__new__(self.__class__)
+        copy.spec = self.spec
+        copy._value = self._value
+        copy.owner = None
+
+        return copy
+
+    def __deepcopy__(self, memo):
+        # only keep the owner if it is being copied too.
+        copy = self.__class__.__new__(self.__class__)
+        copy.spec = self.spec
+        copy._value = self._value
+        copy.owner = _copied_owner(self.owner, memo)
+
+        return copy
+
+    @property
+    def minimum(self):
+        return self.spec.minimum
+
+    @minimum.setter
+    def minimum(self, minimum):
+        # specs are shared, so changing the range switches to another spec.
+        self.spec = parameter_spec(minimum, self.maximum, self.default)
+
+    @property
+    def maximum(self):
+        return self.spec.maximum
+
+    @maximum.setter
+    def maximum(self, maximum):
+        self.spec = parameter_spec(self.minimum, maximum, self.default)
+
+    @property
+    def default(self):
+        return self.spec.default
+
+    @default.setter
+    def default(self, default):
+        self.spec = parameter_spec(self.minimum, self.maximum, default)
+
     def __eq__(self, other):
         return self.value == other.value
 
@@ -69,21 +243,36 @@ class Parameter(object):
 
         value -- the new value. Must be >= minimum and <= maximum.
         """
-        if value < self.minimum:
+        spec = self.spec
+
+        if value < spec.minimum:
             raise ValueError('Value (%d) is less than minimum (%d).' %
-                             (value, self.minimum))
-        elif value > self.maximum:
+                             (value, spec.minimum))
+        elif value > spec.maximum:
             raise ValueError('Value (%d) is more than maximum (%d).' %
-                             (value, self.maximum))
+                             (value, spec.maximum))
         else:
             self._value = value
+            owner = self.owner
 
-    def randomize(self):
+            if owner is not None:
+                if type(owner) is tuple:
+                    _clear_cache(owner)
+                else:
+                    # bypass ParameterCollection.__setattr__, for speed.
+                    object.__setattr__(owner, '_pcb', None)
+
+    def randomize(self, rng=None):
         """Randomize the value property.
 
         Sets the value to a random number >= minimum and <= maximum.
+
+        rng -- a random.Random instance (or anything with a randint() method),
+          or a seed for one. Defaults to the random module.
         """
-        self.value = randint(self.minimum, self.maximum)
+        rng = random_source(rng)
+
+        self.value = rng.randint(self.minimum, self.maximum)
 
     def reset(self):
         """Reset the value property to its default value."""
@@ -120,6 +309,8 @@ class ModulationSource(Parameter):
     PRESS = 14  # aftertouch (not sent by ESQ-1!).
     OFF = 15
 
+    __slots__ = ()
+
     def __init__(self):
         super(ModulationSource, self).__init__(self.LFO_1, self.OFF, self.OFF)
 
@@ -127,6 +318,8 @@ class ModulationSource(Parameter):
 class ModulationAmount(Parameter):
     """A parameter representing a modulation amount."""
 
+    __slots__ = ()
+
     def __init__(self):
         super(ModulationAmount, self).__init__(-63, 63, 0)
 
@@ -134,6 +327,8 @@ class ModulationAmount(Parameter):
 class Boolean(Parameter):
     """A parameter representing a boolean."""
 
+    __slots__ = ()
+
     def __init__(self):
         super(Boolean, self).__init__(False, True)
 
@@ -168,27 +363,392 @@ def pcb_to_display(value):
         raise ValueError('PCB value (%d) must be <= 127.' % value)
 
 
+def _compile_serialize(layout, length):
+    """Return the source of a serialize() method for a section layout."""
+    lines = ['def serialize(self):',
+             '    pcb = self._pcb',
+             '    if pcb is not None:',
+             '        return bytearray(pcb)',
+             '    pcb = self._pcb = bytes((']
+
+    for offset in range(length):
+        parts = []
+
+        for field in layout:
+            if field.offset != offset:
+                continue
+
+            value = 'self.%s._value' % field.path
+
+            if field.signed:
+                # display_to_pcb() for a value between -63 and 63.
+                value = '(%s & 0x7F)' % value
+
+            if field.position:
+                value = '(%s >> %d)' % (value, field.position)
+
+            parts.append('((%s << %d) & 0x%02X)' % (value, field.shift,
+                                                    field.mask))
+
+        lines.append('        %s,' % (' | '.join(parts) or '0'))
+
+    lines.append('    ))')
+    lines.append('    return bytearray(pcb)')
+
+    return '\n'.join(lines)
+
+
+def _compile_deserialize(layout, length):
+    """Return the source of a deserialize() method for a section layout."""
+    lines = ['def deserialize(self, bytes):']
+    lines += ['    b%d = next(bytes)' % offset for offset in range(length)]
+    # values are set without the value setter, so clear the cached bytes
+    # first, in case an out-of-range value raises part way through.
+    lines.append('    set_attribute(self, "_pcb", None)')
+
+    for path in OrderedDict.fromkeys(field.path for field in layout):
+        fields = [field for field in layout if field.path == path]
+        parts = []
+
+        for field in fields:
+            part = '((b%d & 0x%02X) >> %d)' % (field.offset, field.mask,
+                                               field.shift)
+
+            if field.position:
+                part = '(%s << %d)' % (part, field.position)
+
+            parts.append(part)
+
+        value = ' | '.join(parts)
+
+        if fields[0].signed:
+            value = 'pcb_to_display(%s)' % value
+
+        # set the value directly when it is in range, otherwise use the
+        # value setter to raise the usual ValueError.
+        lines += ['    parameter = self.%s' % path,
+                  '    value = %s' % value,
+                  '    spec = parameter.spec',
+                  '    if spec.minimum <= value <= spec.maximum:',
+                  '        parameter._value = value',
+                  '        if parameter.owner is not self:',
+                  '            clear_cache(parameter.owner)',
+                  '    else:',
+                  '        parameter.value = value']
+
+    return '\n'.join(lines)
+
+
+def pcb_codec(cls):
+    """Class decorator generating serialize() and deserialize() methods for
+    a section from its PCB_LAYOUT and PCB_LENGTH.
+
+    The generated methods are straight-line code, with one expression per
+    byte or parameter, so the layout table is only interpreted once.
+    serialize() caches its result until a parameter of the section changes
+    (see ParameterCollection).
+    """
+    namespace = {'pcb_to_display': pcb_to_display,
+                 'set_attribute': object.__setattr__,
+                 'clear_cache': _clear_cache}
+
+    for source in [_compile_serialize(cls.PCB_LAYOUT, cls.PCB_LENGTH),
+                   _compile_deserialize(cls.PCB_LAYOUT, cls.PCB_LENGTH)]:
+        code = compile(source, '<%s PCB codec>' % cls.__name__, 'exec')
+        exec(code, namespace)
+
+    serialize = namespace['serialize']
+    serialize.__doc__ = "Serialize the class's attributes into a bytearray."
+    deserialize = namespace['deserialize']
+    deserialize.__doc__ = "Deserialize the bytearray into the class's " \
+        "attributes."
+
+    cls.serialize = serialize
+    cls.deserialize = deserialize
+
+    return cls
+
+
+def _owners(owner):
+    """Return a tuple of the collections of an owner attribute."""
+    if owner is None:
+        return ()
+    elif type(owner) is tuple:
+        return owner
+    else:
+        return (owner,)
+
+
+def _clear_cache(owner):
+    """Clear the cached serialized bytes of the collections of an owner
+    attribute.
+    """
+    for collection in _owners(owner):
+        object.__setattr__(collection, '_pcb', None)
+
+
+def _add_owner(obj, collection):
+    """Add collection to the owners of a Parameter or ParameterList."""
+    owners = _owners(obj.owner)
+
+    if any(owner is collection for owner in owners):
+        return
+
+    owners += (collection,)
+    obj.owner = owners[0] if len(owners) == 1 else owners
+
+
+def _adopt(value, collection):
+    """Add collection to the owners of a Parameter, or of a ParameterList and
+    the parameters in it.
+    """
+    if isinstance(value, Parameter):
+        _add_owner(value, collection)
+    elif isinstance(value, ParameterList):
+        _add_owner(value, collection)
+
+        for item in value:
+            if isinstance(item, Parameter):
+                _add_owner(item, collection)
+
+
+def _copied_owner(owner, memo):
+    """Return the copies of the collections of an owner attribute that are
+    in a deepcopy() memo, as an owner attribute.
+    """
+    owners = tuple(memo[id(collection)] for collection in _owners(owner)
+                   if id(collection) in memo)
+
+    if not owners:
+        return None
+
+    return owners[0] if len(owners) == 1 else owners
+
+
+class ParameterList(list):
+    """A list of parameters (or of collections) held by a ParameterCollection.
+
+    Lists assigned to a collection's attributes are converted to
+    ParameterLists, so that parameters added to the list are owned by the
+    collection, and changing the list clears the collection's cached
+    serialized bytes.
+
+    owner -- the ParameterCollection the list belongs to, a tuple of them if
+        it is shared, or None.
+    """
+
+    __slots__ = ('owner',)
+
+    def __init__(self, items=(), owner=None):
+        super(ParameterList, self).__init__(items)
+        self.owner = None
+
+        for collection in _owners(owner):
+            _adopt(self, collection)
+
+    def __reduce__(self):
+        return (self.__class__, (list(self), self.owner))
+
+    def _changed(self, items=()):
+        for collection in _owners(self.owner):
+            for item in items:
+                _adopt(item, collection)
+
+        _clear_cache(self.owner)
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        # only keep the owners that are being copied too.
+        copy = self.__class__.__new__(self.__class__)
+        memo[id(self)] = copy
+        copy.owner = _copied_owner(self.owner, memo)
+        list.extend(copy, [deepcopy(item, memo) for item in self])
+
+        return copy
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+            items = value
+        else:
+            items = (value,)
+
+        super(ParameterList, self).__setitem__(index, value)
+        self._changed(items)
+
+    def __delitem__(self, index):
+        super(ParameterList, self).__delitem__(index)
+        self._changed()
+
+    def __iadd__(self, items):
+        self.extend(items)
+
+        return self
+
+    def __imul__(self, count):
+        super(ParameterList, self).__imul__(count)
+        self._changed()
+
+        return self
+
+    def append(self, item):
+        super(ParameterList, self).append(item)
+        self._changed((item,))
+
+    def extend(self, items):
+        items = list(items)
+        super(ParameterList, self).extend(items)
+        self._changed(items)
+
+    def insert(self, index, item):
+        super(ParameterList, self).insert(index, item)
+        self._changed((item,))
+
+    def pop(self, index=-1):
+        item = super(ParameterList, self).pop(index)
+        self._changed()
+
+        return item
+
+    def remove(self, item):
+        super(ParameterList, self).remove(item)
+        self._changed()
+
+    def clear(self):
+        super(ParameterList, self).clear()
+        self._changed()
+
+    def reverse(self):
+        super(ParameterList, self).reverse()
+        self._changed()
+
+    def sort(self, *args, **kwargs):
+        super(ParameterList, self).sort(*args, **kwargs)
+        self._changed()
+
+
 class ParameterCollection(object):
     """A collection of parameters, grouped for easy randomization
     and comparison.
 
     A comparison between two instances will compare each instance's parameters
     when determining if they are equal.
+
+    Parameters assigned to an attribute (directly or in a list) are owned by
+    the collection, and changing their values clears the collection's cached
+    serialized bytes. Lists are converted to ParameterLists, so parameters
+    can also be replaced by assigning an item of a list. A parameter can be
+    owned by more than one collection, such as after copy.copy().
+
+    Attributes starting with an underscore are not parameters, and are ignored
+    when randomizing and comparing.
+
+    Collections are hashed by their serialized bytes. As with any mutable
+    object, a collection must not be changed while it is in a set or used as
+    a dictionary key.
     """
-    def randomize(self):
-        """Walk through each attribute and randomize."""
-        for attribute in self.__dict__:
+
+    # the cached result of serialize(), or None if a parameter has changed.
+    _pcb = None
+
+    def __setattr__(self, name, value):
+        if name[0] != '_':
+            if type(value) is list:
+                value = ParameterList(value, self)
+            else:
+                _adopt(value, self)
+
+            object.__setattr__(self, '_pcb', None)
+
+        object.__setattr__(self, name, value)
+
+    def _attributes(self):
+        return [attribute for attribute in self.__dict__
+                if attribute[0] != '_']
+
+    def randomize(self, rng=None):
+        """Walk through each attribute and randomize.
+
+        rng -- a random.Random instance, or a seed for one (see
+          Parameter.randomize()). Attributes are always randomized in the
+          same order, so the same seed always gives the same values.
+        """
+        rng = random_source(rng)
+
+        for attribute in self._attributes():
             attr = getattr(self, attribute)
 
             if getattr(attr, "randomize", None):
-                attr.randomize()
-            elif type(attr) is list:
+                attr.randomize(rng)
+            elif isinstance(attr, list):
                 for item in attr:
-                    item.randomize()
+                    item.randomize(rng)
+
+    def clone(self):
+        """Return a copy of the collection and its parameters.
+
+        Much faster than copy.deepcopy(), as only the values are copied - the
+        parameters' specs, and the cached serialized bytes, are shared.
+        """
+        cls = self.__class__
+        copy = cls.__new__(cls)
+        attributes = copy.__dict__
+
+        for name, value in self.__dict__.items():
+            if isinstance(value, Parameter):
+                value = value.clone()
+                value.owner = copy
+            elif isinstance(value, ParameterCollection):
+                value = value.clone()
+            elif isinstance(value, list):
+                items = []
+
+                for item in value:
+                    if isinstance(item, Parameter):
+                        item = item.clone()
+                        item.owner = copy
+                    elif isinstance(item, ParameterCollection):
+                        item = item.clone()
+
+                    items.append(item)
+
+                # the items are already owned by the copy.
+                value = ParameterList(items)
+                value.owner = copy
+
+            # set directly, to keep the cached bytes.
+            attributes[name] = value
+
+        return copy
+
+    def __copy__(self):
+        # the copy shares the parameters, so changing one must clear the
+        # cached bytes of both collections.
+        cls = self.__class__
+        copy = cls.__new__(cls)
+        copy.__dict__.update(self.__dict__)
+
+        for name, value in self.__dict__.items():
+            if name[0] != '_':
+                _adopt(value, copy)
+
+        return copy
+
+    def clone_many(self, count):
+        """Return a list of count clones of the collection."""
+        return [self.clone() for i in range(count)]
+
+    def __hash__(self):
+        """Hash the serialized bytes, so that collections with equal
+        parameters have equal hashes.
+        """
+        return hash(bytes(self.serialize()))
 
     def __eq__(self, other):
         """Comparison operator for one == two"""
-        for attribute in self.__dict__:
+        for attribute in self._attributes():
             if getattr(self, attribute) != getattr(other, attribute):
                 return False
 
@@ -196,13 +756,14 @@ class ParameterCollection(object):
 
     def __ne__(self, other):
         """Comparison operator for one != two"""
-        for attribute in self.__dict__:
+        for attribute in self._attributes():
             if getattr(self, attribute) != getattr(other, attribute):
                 return True
 
         return False
 
 
+@pcb_codec
 class Envelope(ParameterCollection):
     """The parameters for one envelope. There are four envelopes in each ESQ-1
     patch.
@@ -222,6 +783,22 @@ class Envelope(ParameterCollection):
     keyboard_decay_scaling -- the amount by which the envelope's time[1] and
       time[2] are decreased by the height of a note.
     """
+
+    PCB_LENGTH = 10
+
+    PCB_LAYOUT = (
+        _field('levels[0]', 0, 0b11111110, 1, signed=True),
+        _field('levels[1]', 1, 0b11111110, 1, signed=True),
+        _field('levels[2]', 2, 0b11111110, 1, signed=True),
+        _field('times[0]', 3, 0b11111111),
+        _field('times[1]', 4, 0b11111111),
+        _field('times[2]', 5, 0b11111111),
+        _field('times[3]', 6, 0b11111111),
+        _field('velocity_level', 7, 0b11111100, 2),
+        _field('velocity_attack_control', 8, 0b11111111),
+        _field('keyboard_decay_scaling', 9, 0b11111111),
+    )
+
     def __init__(self):
         self.levels = [ModulationAmount() for i in range(3)]
         self.times = [Parameter(0, 63) for i in range(4)]
@@ -229,35 +806,8 @@ class Envelope(ParameterCollection):
         self.velocity_attack_control = Parameter(0, 63)
         self.keyboard_decay_scaling = Parameter(0, 63)
 
-    def serialize(self):
-        """Serialize the class's attributes into a bytearray."""
-        bytes = bytearray()
-
-        for level in self.levels:
-            bytes.append(display_to_pcb(level.value) << 1)
-
-        for time in self.times:
-            bytes.append(time.value)
-
-        bytes.append(self.velocity_level.value << 2)
-        bytes.append(self.velocity_attack_control.value)
-        bytes.append(self.keyboard_decay_scaling.value)
-
-        return bytes
-
-    def deserialize(self, bytes):
-        """Deserialize the bytearray into the class's attributes."""
-        for level in self.levels:
-            level.value = pcb_to_display(next(bytes) >> 1)
-
-        for time in self.times:
-            time.value = next(bytes)
-
-        self.velocity_level.value = next(bytes) >> 2
-        self.velocity_attack_control.value = next(bytes)
-        self.keyboard_decay_scaling.value = next(bytes)
-
 
+@pcb_codec
 class LFO(ParameterCollection):
     """The parameters for one LFO. There are three LFOs in each ESQ-1 patch.
 
@@ -289,6 +839,20 @@ class LFO(ParameterCollection):
     SQR = 2
     NOISE = 3
 
+    PCB_LENGTH = 4
+
+    PCB_LAYOUT = (
+        _field('waveform', 0, 0b11000000, 6),
+        _field('frequency', 0, 0b00111111),
+        _field('modulation_source', 1, 0b11000000, 6, position=2),
+        _field('levels[0]', 1, 0b00111111),
+        _field('modulation_source', 2, 0b11000000, 6),
+        _field('levels[1]', 2, 0b00111111),
+        _field('reset', 3, 0b10000000, 7),
+        _field('humanize', 3, 0b01000000, 6),
+        _field('delay', 3, 0b00111111),
+    )
+
     def __init__(self):
         self.levels = [Parameter(0, 63), Parameter(0, 63)]
         self.frequency = Parameter(0, 63)
@@ -298,50 +862,8 @@ class LFO(ParameterCollection):
         self.delay = Parameter(0, 63)
         self.modulation_source = ModulationSource()
 
-    def serialize(self):
-        """Serialize the class's attributes into a bytearray."""
-        bytes = bytearray()
-
-        waveform = (self.waveform.value & 0b00000011) << 6
-        modulation_source_0 = (self.modulation_source.value & 0b00000011) << 6
-        modulation_source_1 = (self.modulation_source.value & 0b00001100) << 4
-        reset = (self.reset.value & 0b00000001) << 7
-        humanize = (self.humanize.value & 0b00000001) << 6
-
-        bytes.append(waveform + self.frequency.value)
-        bytes.append(modulation_source_1 + self.levels[0].value)
-        bytes.append(modulation_source_0 + self.levels[1].value)
-        bytes.append(reset + humanize + self.delay.value)
-
-        return bytes
-
-    def deserialize(self, bytes):
-        """Deserialize the bytearray into the class's attributes."""
-        byte = next(bytes)
-
-        self.waveform.value = (byte & 0b11000000) >> 6
-        self.frequency.value = byte & 0b00111111
-
-        byte = next(bytes)
-
-        modulation_source_0 = (byte & 0b11000000) >> 6
-        self.levels[0].value = byte & 0b00111111
-
-        byte = next(bytes)
-
-        modulation_source_1 = (byte & 0b11000000) >> 6
-        self.levels[1].value = byte & 0b00111111
-
-        self.modulation_source.value = modulation_source_1 +\
-            (modulation_source_0 << 2)
-
-        byte = next(bytes)
-
-        self.reset.value = (byte & 0b10000000) >> 7
-        self.humanize.value = (byte & 0b01000000) >> 6
-        self.delay.value = byte & 0b00111111
-
 
+@pcb_codec
 class Oscillator(ParameterCollection):
     """The parameters for one oscillator. There are three oscillators in each
     ESQ-1 patch.
@@ -406,6 +928,26 @@ class Oscillator(ParameterCollection):
     OCTAVE = 31
     OCT_5 = 32
 
+    PCB_LENGTH = 10
+
+    PCB_LAYOUT = (
+        _field('semitone', 0, 0b11111111),
+        _field('fine_tune', 1, 0b11111000, 3),
+        _field('frequency_modulation_sources[0]', 2, 0b00001111),
+        _field('frequency_modulation_sources[1]', 2, 0b11110000, 4),
+        _field('frequency_modulation_amounts[0]', 3, 0b11111110, 1,
+               signed=True),
+        _field('frequency_modulation_amounts[1]', 4, 0b11111110, 1,
+               signed=True),
+        _field('waveform', 5, 0b11111111),
+        _field('dca_enable', 6, 0b10000000, 7),
+        _field('dca_level', 6, 0b01111110, 1),
+        _field('dca_modulation_sources[0]', 7, 0b00001111),
+        _field('dca_modulation_sources[1]', 7, 0b11110000, 4),
+        _field('dca_modulation_amounts[0]', 8, 0b11111110, 1, signed=True),
+        _field('dca_modulation_amounts[1]', 9, 0b11111110, 1, signed=True),
+    )
+
     def __init__(self):
         self.semitone = Parameter(0, 96, 36)
         self.fine_tune = Parameter(0, 31)
@@ -426,80 +968,8 @@ class Oscillator(ParameterCollection):
         """Set the semitone value using an octave value (-3 to 5)."""
         self.semitone.value = (value + 3) * 12
 
-    def serialize(self):
-        """Serialize the class's attributes into a bytearray."""
-        bytes = bytearray()
-
-        fine_tune = self.fine_tune.value << 3
-
-        frequency_modulation_sources =\
-            (self.frequency_modulation_sources[1].value << 4) +\
-            self.frequency_modulation_sources[0].value
-
-        frequency_modulation_amounts = [
-            display_to_pcb(self.frequency_modulation_amounts[0].value) << 1,
-            display_to_pcb(self.frequency_modulation_amounts[1].value) << 1
-        ]
-
-        dca_enable = (self.dca_enable.value & 0b00000001) << 7
-        dca_level = self.dca_level.value << 1
-
-        dca_modulation_sources =\
-            (self.dca_modulation_sources[1].value << 4) +\
-            self.dca_modulation_sources[0].value
-
-        dca_modulation_amounts = [
-            display_to_pcb(self.dca_modulation_amounts[0].value) << 1,
-            display_to_pcb(self.dca_modulation_amounts[1].value) << 1
-        ]
-
-        bytes.append(self.semitone.value)
-        bytes.append(fine_tune)
-        bytes.append(frequency_modulation_sources)
-        bytes.append(frequency_modulation_amounts[0])
-        bytes.append(frequency_modulation_amounts[1])
-        bytes.append(self.waveform.value)
-        bytes.append(dca_enable + dca_level)
-        bytes.append(dca_modulation_sources)
-        bytes.append(dca_modulation_amounts[0])
-        bytes.append(dca_modulation_amounts[1])
-
-        return bytes
-
-    def deserialize(self, bytes):
-        """Deserialize the bytearray into the class's attributes."""
-        self.semitone.value = next(bytes)
-        self.fine_tune.value = next(bytes) >> 3
-
-        byte = next(bytes)
-
-        self.frequency_modulation_sources[1].value = byte >> 4
-        self.frequency_modulation_sources[0].value = byte & 0b00001111
-
-        self.frequency_modulation_amounts[0].value = pcb_to_display(
-            next(bytes) >> 1)
-
-        self.frequency_modulation_amounts[1].value = pcb_to_display(
-            next(bytes) >> 1)
-
-        self.waveform.value = next(bytes)
-
-        byte = next(bytes)
-
-        self.dca_enable.value = (byte & 0b10000000) >> 7
-        self.dca_level.value = (byte & 0b01111111) >> 1
-
-        byte = next(bytes)
-
-        self.dca_modulation_sources[1].value = byte >> 4
-        self.dca_modulation_sources[0].value = byte & 0b00001111
-
-        self.dca_modulation_amounts[0].value = pcb_to_display(
-            next(bytes) >> 1)
-        self.dca_modulation_amounts[1].value = pcb_to_display(
-            next(bytes) >> 1)
-
 
+@pcb_codec
 class Miscellaneous(ParameterCollection):
     """The miscellaneous section of the ESQ-1 patch.
 
@@ -561,6 +1031,38 @@ class Miscellaneous(ParameterCollection):
       split_layer_program
     """
 
+    PCB_LENGTH = 14
+
+    PCB_LAYOUT = (
+        _field('am', 0, 0b10000000, 7),
+        _field('dca4_modulation_amount', 0, 0b01111110, 1),
+        _field('sync', 1, 0b10000000, 7),
+        _field('frequency', 1, 0b01111111),
+        _field('resonance', 2, 0b11111111),
+        _field('filter_modulation_sources[0]', 3, 0b00001111),
+        _field('filter_modulation_sources[1]', 3, 0b11110000, 4),
+        _field('reset_voice', 4, 0b10000000, 7),
+        _field('filter_modulation_amount[0]', 4, 0b01111111, signed=True),
+        _field('mono', 5, 0b10000000, 7),
+        _field('filter_modulation_amount[1]', 5, 0b01111111, signed=True),
+        _field('reset_envelope', 6, 0b10000000, 7),
+        _field('filter_keyboard_tracking', 6, 0b01111110, 1),
+        _field('reset_oscillator', 7, 0b10000000, 7),
+        _field('glide', 7, 0b01111111),
+        _field('split_direction', 8, 0b10000000, 7),
+        _field('split_point', 8, 0b01111111),
+        _field('layer_flag', 9, 0b10000000, 7),
+        _field('layer_program', 9, 0b01111111),
+        _field('split_flag', 10, 0b10000000, 7),
+        _field('split_program', 10, 0b01111111),
+        _field('split_layer_flag', 11, 0b10000000, 7),
+        _field('split_layer_program', 11, 0b01111111),
+        _field('pan', 12, 0b11110000, 4),
+        _field('pan_modulation_source', 12, 0b00001111),
+        _field('cycle', 13, 0b10000000, 7),
+        _field('pan_modulation_amount', 13, 0b01111111, signed=True),
+    )
+
     def __init__(self):
         self.sync = Boolean()
         self.am = Boolean()
@@ -593,127 +1095,6 @@ class Miscellaneous(ParameterCollection):
         self.split_layer_flag = Boolean()
         self.split_layer_program = Parameter(0, 39)
 
-    def serialize(self):
-        """Serialize the class's attributes into a bytearray."""
-        bytes = bytearray()
-
-        am = (self.am.value & 0b00000001) << 7
-        dca4_modulation_amount = self.dca4_modulation_amount.value << 1
-        sync = (self.sync.value & 0b00000001) << 7
-
-        filter_modulation_sources = [
-            self.filter_modulation_sources[0].value,
-            self.filter_modulation_sources[1].value << 4
-        ]
-
-        reset_voice = (self.reset_voice.value & 0b00000001) << 7
-        mono = (self.mono.value & 0x01) << 7
-        reset_envelope = (self.reset_envelope.value & 0b00000001) << 7
-        filter_keyboard_tracking = self.filter_keyboard_tracking.value << 1
-        reset_oscillator = (self.reset_oscillator.value & 0b00000001) << 7
-        split_direction = (self.split_direction.value & 0b00000001) << 7
-        layer_flag = (self.layer_flag.value & 0b00000001) << 7
-        split_flag = (self.split_flag.value & 0b00000001) << 7
-        split_layer_flag = (self.split_layer_flag.value & 0b00000001) << 7
-        pan = self.pan.value << 4
-        cycle = (self.cycle.value & 0b00000001) << 7
-
-        bytes.append(am + dca4_modulation_amount)
-        bytes.append(sync + self.frequency.value)
-        bytes.append(self.resonance.value)
-
-        bytes.append(filter_modulation_sources[0] +
-                     filter_modulation_sources[1])
-
-        bytes.append(reset_voice + display_to_pcb(
-                     self.filter_modulation_amount[0].value))
-
-        bytes.append(mono + display_to_pcb(
-                     self.filter_modulation_amount[1].value))
-
-        bytes.append(reset_envelope + filter_keyboard_tracking)
-        bytes.append(reset_oscillator + self.glide.value)
-        bytes.append(split_direction + self.split_point.value)
-        bytes.append(layer_flag + self.layer_program.value)
-        bytes.append(split_flag + self.split_program.value)
-        bytes.append(split_layer_flag + self.split_layer_program.value)
-        bytes.append(pan + self.pan_modulation_source.value)
-        bytes.append(cycle +
-                     display_to_pcb(self.pan_modulation_amount.value))
-
-        return bytes
-
-    def deserialize(self, bytes):
-        """Deserialize the bytearray into the class's attributes."""
-        byte = next(bytes)
-
-        self.am.value = (byte & 0b10000000) >> 7
-        self.dca4_modulation_amount.value = (byte & 0b01111111) >> 1
-
-        byte = next(bytes)
-
-        self.sync.value = (byte & 0b10000000) >> 7
-        self.frequency.value = byte & 0b01111111
-
-        self.resonance.value = next(bytes)
-
-        byte = next(bytes)
-
-        self.filter_modulation_sources[0].value = byte & 0b00001111
-        self.filter_modulation_sources[1].value = byte >> 4
-
-        byte = next(bytes)
-
-        self.reset_voice.value = (byte & 0b10000000) >> 7
-        self.filter_modulation_amount[0].value = pcb_to_display(
-            byte & 0b01111111)
-
-        byte = next(bytes)
-
-        self.mono.value = (byte & 0b10000000) >> 7
-        self.filter_modulation_amount[1].value = pcb_to_display(
-            byte & 0b01111111)
-
-        byte = next(bytes)
-
-        self.reset_envelope.value = (byte & 0b10000000) >> 7
-        self.filter_keyboard_tracking.value = (byte & 0b01111111) >> 1
-
-        byte = next(bytes)
-
-        self.reset_oscillator.value = (byte & 0b10000000) >> 7
-        self.glide.value = byte & 0b01111111
-
-        byte = next(bytes)
-
-        self.split_direction.value = (byte & 0b10000000) >> 7
-        self.split_point.value = byte & 0b01111111
-
-        byte = next(bytes)
-
-        self.layer_flag.value = (byte & 0b10000000) >> 7
-        self.layer_program.value = byte & 0b01111111
-
-        byte = next(bytes)
-
-        self.split_flag.value = (byte & 0b10000000) >> 7
-        self.split_program.value = byte & 0b01111111
-
-        byte = next(bytes)
-
-        self.split_layer_flag.value = (byte & 0b10000000) >> 7
-        self.split_layer_program.value = byte & 0b01111111
-
-        byte = next(bytes)
-
-        self.pan.value = (byte & 0b11110000) >> 4
-        self.pan_modulation_source.value = byte & 0b00001111
-
-        byte = next(bytes)
-
-        self.cycle.value = (byte & 0b10000000) >> 7
-        self.pan_modulation_amount.value = pcb_to_display(byte & 0b01111111)
-
 
 class ESQ1Patch(ParameterCollection):
     """The entire ESQ-1 patch.
@@ -733,6 +1114,14 @@ class ESQ1Patch(ParameterCollection):
 
     NAME_LENGTH = 6  # name must be 6 characters long.
 
+    # the sections of the patch, in the order they are stored in the PCB.
+    SECTIONS = (
+        ('envelopes', Envelope, 4),
+        ('lfos', LFO, 3),
+        ('oscillators', Oscillator, 3),
+        ('miscellaneous', Miscellaneous, None),
+    )
+
     def __init__(self):
         self.name = '      '
         self.envelopes = [Envelope() for i in range(4)]
@@ -769,6 +1158,12 @@ class ESQ1Patch(ParameterCollection):
 
         return bytes
 
+    def fingerprint(self, include_name=True):
+        """Return a 16-byte digest of the serialized patch. See
+        pcb_fingerprint().
+        """
+        return pcb_fingerprint(self.serialize(), include_name)
+
     def deserialize(self, bytes):
         """Deserialize the bytearray into the class's attributes."""
         name = [chr(next(bytes)) for i in range(self.NAME_LENGTH)]
@@ -787,60 +1182,1189 @@ class ESQ1Patch(ParameterCollection):
         self.miscellaneous.deserialize(bytes)
 
 
-def sysex_to_esq1_patches(filename):
-    """Read a SYSEX file and return a list of patches.
+def _build_pcb_fields():
+    """Return the layout of every parameter within the patch's PCB."""
+    fields = []
+    offset = ESQ1Patch.NAME_LENGTH
 
-    If the SYSEX file is in the 'single program dump' format, the list will
-    contain one patch. If the SYSEX file is in the 'all program dump' format,
-    the list will contain 40 patches.
-    """
-    with open(filename, 'rb') as sysex_file:
-        sysex = iter(bytearray(sysex_file.read()))
+    for attribute, cls, count in ESQ1Patch.SECTIONS:
+        if count is None:
+            prefixes = [attribute]
+        else:
+            prefixes = ['%s[%d]' % (attribute, i) for i in range(count)]
 
-    # SYSEX, Ensoniq ID, ESQ-1 ID.
-    assert next(sysex) == 0xF0
-    assert next(sysex) == 0x0F
-    assert next(sysex) == 0x02
+        for prefix in prefixes:
+            for field in cls.PCB_LAYOUT:
+                fields.append(field._replace(
+                    path='%s.%s' % (prefix, field.path),
+                    offset=offset + field.offset))
 
-    # the channel is not used.
-    channel = next(sysex)
+            offset += cls.PCB_LENGTH
 
-    dump_type = next(sysex)
+    assert offset == PCB_LENGTH
 
-    if dump_type == 0x01:
-        # single program format.
-        patch_count = 1
-    elif dump_type == 0x02:
-        # all program dump.
-        patch_count = 40
-    else:
-        raise ValueError('Invalid dump type - %s' % dump_type)
+    return tuple(fields)
 
-    patches = []
 
-    # use a generator to combine the two bytes into one.
-    def _unpacker(sysex):
-        while True:
-            low = next(sysex)
-            high = next(sysex)
+# the location of every parameter within the PCB.
+PCB_FIELDS = _build_pcb_fields()
 
-            yield low + (high << 4)
+# the path of every parameter, in PCB order.
+PARAMETER_PATHS = tuple(OrderedDict.fromkeys(field.path
+                                             for field in PCB_FIELDS))
 
-    unpacker = _unpacker(sysex)
+# the fields of each parameter, keyed by path.
+PCB_FIELDS_BY_PATH = dict(
+    (path, tuple(field for field in PCB_FIELDS if field.path == path))
+    for path in PARAMETER_PATHS)
 
-    # create a patch and unpack the bytes into it.
-    for i in range(patch_count):
-        patch = ESQ1Patch()
+
+def _build_section_offsets():
+    """Return an OrderedDict of the path of each section of the PCB (such as
+    'envelopes[0]' or 'miscellaneous') to its offset and class.
+    """
+    sections = OrderedDict()
+    offset = ESQ1Patch.NAME_LENGTH
+
+    for attribute, cls, count in ESQ1Patch.SECTIONS:
+        if count is None:
+            paths = [attribute]
+        else:
+            paths = ['%s[%d]' % (attribute, i) for i in range(count)]
+
+        for path in paths:
+            sections[path] = (offset, cls)
+            offset += cls.PCB_LENGTH
+
+    return sections
+
+
+# the location of every section within the PCB, in PCB order.
+SECTION_OFFSETS = _build_section_offsets()
+
+
+def iter_random_patches(count, seed, start=0):
+    """Yield count randomized patches, the patches at indexes start to
+    start + count - 1 of the run seeded with seed (see patch_rng()).
+    """
+    for index in range(start, start + count):
+        patch = ESQ1Patch()
+        patch.randomize(patch_rng(seed, index))
+
+        yield patch
+
+
+def pcb_fingerprint(pcb, include_name=True):
+    """Return a 16-byte digest of the PCB bytes of one patch. Patches with the
+    same parameter values have the same fingerprint.
+
+    include_name -- if False, the name is ignored, so patches that only differ
+      by name have the same fingerprint.
+    """
+    if not include_name:
+        pcb = pcb[ESQ1Patch.NAME_LENGTH:]
+
+    return hashlib.blake2b(bytes(pcb), digest_size=16).digest()
+
+
+_prototype_parameters = {}
+
+
+def parameter_prototype(path):
+    """Return the Parameter at path in a default patch. Used to look up a
+    parameter's minimum, maximum and default by path.
+    """
+    if not _prototype_parameters:
+        patch = ESQ1Patch()
+
+        for parameter_path in PARAMETER_PATHS:
+            _prototype_parameters[parameter_path] = resolve_path(
+                patch, parameter_path)
+
+    return _prototype_parameters[path]
+
+
+def _decode_raw_value(pcb, fields):
+    """Return the value of a parameter as stored in the PCB bytes of one
+    patch.
+    """
+    value = 0
+
+    for field in fields:
+        value |= ((pcb[field.offset] & field.mask) >> field.shift) <<\
+            field.position
+
+    return value
+
+
+def decode_field_value(pcb, fields):
+    """Return the value of a parameter from the PCB bytes of one patch.
+
+    fields -- the parameter's PCBFields, from PCB_FIELDS_BY_PATH.
+    """
+    value = _decode_raw_value(pcb, fields)
+
+    if fields[0].signed:
+        value = pcb_to_display(value)
+
+    return value
+
+
+def encode_field_value(pcb, fields, value):
+    """Store the value of a parameter in the PCB bytes of one patch."""
+    if fields[0].signed:
+        value = display_to_pcb(value)
+
+    for field in fields:
+        part = ((value >> field.position) << field.shift) & field.mask
+        pcb[field.offset] = (pcb[field.offset] & ~field.mask & 0xFF) | part
+
+
+# a parameter whose value in a PCB record is out of its range, found by
+# validate_pcb() or PatchBank.validate().
+#
+# index -- the index of the record.
+# path -- the path of the parameter.
+# raw -- the value as stored in the PCB.
+InvalidField = namedtuple('InvalidField', ['index', 'path', 'raw'])
+
+
+def validate_pcb(pcb, repair=False, index=0):
+    """Return a list of InvalidFields for every parameter of the PCB bytes of
+    one patch whose value is out of its range (see PatchBank.validate(),
+    which validates many patches at once).
+
+    repair -- if True, also set each invalid value to the nearest value
+      within its range. pcb must then be writable, such as a bytearray.
+
+    index -- the index given to each InvalidField.
+    """
+    invalid = []
+
+    for path in PARAMETER_PATHS:
+        fields = PCB_FIELDS_BY_PATH[path]
+        prototype = parameter_prototype(path)
+        raw = value = _decode_raw_value(pcb, fields)
+
+        # a signed value stored as 64 becomes -64, which is out of range.
+        if fields[0].signed and value >= 64:
+            value -= 128
+
+        if prototype.minimum <= value <= prototype.maximum:
+            continue
+
+        invalid.append(InvalidField(index, path, raw))
+
+        if repair:
+            encode_field_value(pcb, fields, min(max(value, prototype.minimum),
+                                                prototype.maximum))
+
+    return invalid
+
+
+# a difference between two patches (or sections) found by diff().
+#
+# path -- the path of the parameter (or 'name').
+# old -- the value in the first patch.
+# new -- the value in the second patch.
+Difference = namedtuple('Difference', ['path', 'old', 'new'])
+
+
+def _build_paths_by_offset(fields):
+    paths_by_offset = {}
+
+    for field in fields:
+        paths = paths_by_offset.setdefault(field.offset, [])
+
+        if field.path not in paths:
+            paths.append(field.path)
+
+    return paths_by_offset
+
+
+# the paths of the parameters stored in each byte of the PCB.
+_PATHS_BY_OFFSET = _build_paths_by_offset(PCB_FIELDS)
+
+
+def diff(a, b):
+    """Return a list of Differences between the parameters of two patches, in
+    PCB order. The name is included (with the path 'name') if it differs.
+
+    a, b -- ESQ1Patches, ESQ1PatchViews, or PCB bytes, or two sections of the
+      same class (in which case paths are relative to the section).
+
+    Only the bytes that differ are decoded, so comparing equal or nearly
+    equal patches is fast.
+    """
+    a_pcb = a.serialize() if hasattr(a, 'serialize') else a
+    b_pcb = b.serialize() if hasattr(b, 'serialize') else b
+
+    if a_pcb == b_pcb:
+        return []
+
+    layout = getattr(a, 'PCB_LAYOUT', None)
+
+    if layout is not None:
+        if type(a) is not type(b):
+            raise TypeError('Cannot compare %s to %s.' %
+                            (type(a).__name__, type(b).__name__))
+
+        paths_by_offset = _build_paths_by_offset(layout)
+        fields_by_path = dict(
+            (path, tuple(field for field in layout if field.path == path))
+            for paths in paths_by_offset.values() for path in paths)
+        name_length = 0
+    else:
+        paths_by_offset = _PATHS_BY_OFFSET
+        fields_by_path = PCB_FIELDS_BY_PATH
+        name_length = ESQ1Patch.NAME_LENGTH
+
+    if len(a_pcb) != len(b_pcb):
+        raise ValueError('Cannot compare %d bytes to %d bytes.' %
+                         (len(a_pcb), len(b_pcb)))
+
+    differences = []
+    seen = set()
+
+    if a_pcb[:name_length] != b_pcb[:name_length]:
+        differences.append(Difference(
+            'name', bytes(a_pcb[:name_length]).decode('latin-1'),
+            bytes(b_pcb[:name_length]).decode('latin-1')))
+
+    for offset in range(name_length, len(a_pcb)):
+        if a_pcb[offset] == b_pcb[offset]:
+            continue
+
+        for path in paths_by_offset[offset]:
+            if path in seen:
+                continue
+
+            seen.add(path)
+            fields = fields_by_path[path]
+            old = decode_field_value(a_pcb, fields)
+            new = decode_field_value(b_pcb, fields)
+
+            if old != new:
+                differences.append(Difference(path, old, new))
+
+    return differences
+
+
+def diff_banks(a, b):
+    """Return a list of (index, differences) tuples, one for each position at
+    which two lists of patches (or PCB bytes, or PatchBanks) differ. See
+    diff().
+    """
+    if isinstance(a, PatchBank) and isinstance(b, PatchBank):
+        if a.records.shape != b.records.shape:
+            raise ValueError('Cannot compare banks of different sizes.')
+
+        changed = np.flatnonzero((a.records != b.records).any(axis=1))
+
+        return [(int(index), diff(a.records[index].tobytes(),
+                                  b.records[index].tobytes()))
+                for index in changed]
+
+    a = list(a)
+    b = list(b)
+
+    if len(a) != len(b):
+        raise ValueError('Cannot compare banks of different sizes.')
+
+    results = []
+
+    for index, (a_patch, b_patch) in enumerate(zip(a, b)):
+        differences = diff(a_patch, b_patch)
+
+        if differences:
+            results.append((index, differences))
+
+    return results
+
+
+class BufferParameter(Parameter):
+    """A parameter whose value is stored in a PCB buffer rather than in the
+    instance. Reading the value decodes it from the buffer and setting the
+    value encodes it into the buffer.
+    """
+
+    __slots__ = ('buffer', 'fields')
+
+    def __init__(self, buffer, path):
+        self.spec = parameter_prototype(path).spec
+        self.owner = None
+        self.buffer = buffer
+        self.fields = PCB_FIELDS_BY_PATH[path]
+
+    @property
+    def _value(self):
+        return decode_field_value(self.buffer, self.fields)
+
+    @_value.setter
+    def _value(self, value):
+        # as Parameter._value, this does not check the range.
+        encode_field_value(self.buffer, self.fields, value)
+
+    @property
+    def value(self):
+        return decode_field_value(self.buffer, self.fields)
+
+    @value.setter
+    def value(self, value):
+        if value < self.minimum:
+            raise ValueError('Value (%d) is less than minimum (%d).' %
+                             (value, self.minimum))
+        elif value > self.maximum:
+            raise ValueError('Value (%d) is more than maximum (%d).' %
+                             (value, self.maximum))
+        else:
+            encode_field_value(self.buffer, self.fields, value)
+
+    def clone(self):
+        """Return a Parameter containing a copy of the value, rather than a
+        copy of the buffer.
+        """
+        copy = Parameter(self.minimum, self.maximum, self.default)
+        copy.value = self.value
+
+        return copy
+
+    def __deepcopy__(self, memo):
+        return self.clone()
+
+
+def _build_view_tree():
+    """Return a dictionary mapping the parts of each parameter path to the
+    path, and a dictionary mapping the parts of each section or list to the
+    number of items it contains (None for sections).
+    """
+    parameters = {}
+    containers = {}
+
+    for path in PARAMETER_PATHS:
+        parts = parse_path(path)
+        parameters[parts] = path
+
+        for i in range(len(parts)):
+            containers.setdefault(parts[:i], set()).add(parts[i])
+
+    lengths = {}
+
+    for parts, children in containers.items():
+        if all(isinstance(child, int) for child in children):
+            lengths[parts] = len(children)
+        else:
+            lengths[parts] = None
+
+    return parameters, lengths
+
+
+_VIEW_PARAMETERS, _VIEW_LENGTHS = _build_view_tree()
+
+# the parameters within each section or list, keyed by its parts, as a list
+# of the parts of each parameter relative to the section and its path.
+_VIEW_CHILDREN = dict(
+    (container, [(parts[len(container):], path)
+                 for parts, path in sorted(_VIEW_PARAMETERS.items(),
+                                           key=lambda item: PARAMETER_PATHS
+                                           .index(item[1]))
+                 if parts[:len(container)] == container])
+    for container in _VIEW_LENGTHS)
+
+
+def _resolve_parts(obj, parts):
+    """Return the attribute or item of obj at parts (see parse_path())."""
+    for part in parts:
+        if isinstance(part, int):
+            obj = obj[part]
+        else:
+            obj = getattr(obj, part)
+
+    return obj
+
+
+class PCBView(object):
+    """A section, or list of parameters or sections, of an ESQ1PatchView.
+
+    Attributes and items are looked up when accessed, returning either
+    another PCBView or a BufferParameter. Like the sections and lists of an
+    ESQ1Patch, views can be randomized and compared (with other views or
+    with ESQ1Patch sections and lists of the same shape). Methods are only
+    added where ESQ1Patch's sections have them, as a method would hide a
+    parameter of the same name (such as LFO.reset).
+    """
+
+    __slots__ = ('_buffer', '_parts')
+
+    def __init__(self, buffer, parts=()):
+        self._buffer = buffer
+        self._parts = parts
+
+    def _child(self, part):
+        parts = self._parts + (part,)
+        path = _VIEW_PARAMETERS.get(parts)
+
+        if path is not None:
+            return BufferParameter(self._buffer, path)
+        elif parts in _VIEW_LENGTHS:
+            return PCBView(self._buffer, parts)
+
+        raise KeyError(part)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        try:
+            return self._child(name)
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, index):
+        length = len(self)
+
+        if index < 0:
+            index += length
+
+        if not 0 <= index < length:
+            raise IndexError(index)
+
+        return self._child(index)
+
+    def __len__(self):
+        length = _VIEW_LENGTHS[self._parts]
+
+        if length is None:
+            raise TypeError('A section has no length.')
+
+        return length
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self._child(index)
+
+    def randomize(self, rng=None):
+        """Set every parameter to a random value, drawing values in the same
+        order as the equivalent ESQ1Patch section or list, so the same seed
+        gives the same values (see ParameterCollection.randomize()).
+        """
+        obj = _resolve_parts(ESQ1Patch(), self._parts)
+
+        if isinstance(obj, list):
+            rng = random_source(rng)
+
+            for item in obj:
+                item.randomize(rng)
+        else:
+            obj.randomize(rng)
+
+        for parts, path in _VIEW_CHILDREN[self._parts]:
+            encode_field_value(self._buffer, PCB_FIELDS_BY_PATH[path],
+                               _resolve_parts(obj, parts).value)
+
+    def __eq__(self, other):
+        try:
+            for parts, path in _VIEW_CHILDREN[self._parts]:
+                if (decode_field_value(self._buffer, PCB_FIELDS_BY_PATH[path])
+                        != _resolve_parts(other, parts).value):
+                    return False
+        except (AttributeError, IndexError, KeyError, TypeError):
+            return False
+
+        return True
+
+    def __ne__(self, other):
+        return not self == other
+
+    # views are mutable, so are not hashable.
+    __hash__ = None
+
+
+class ESQ1PatchView(PCBView):
+    """A view of the PCB bytes of one patch, with the same parameters as
+    ESQ1Patch. Besides the parameters, views support serialize(),
+    randomize() and comparison (with views or ESQ1Patches), but not the rest
+    of ESQ1Patch's methods - use to_patch() for those.
+
+    Parameters are only decoded when accessed, and setting a parameter's value
+    writes it straight back into the buffer. This avoids creating every
+    Parameter of an ESQ1Patch when only a few values are needed.
+
+    buffer -- the 102 PCB bytes of the patch. Any writable bytes-like object
+      (bytearray, a row of PatchBank.records, ...) can be used. Read-only
+      objects (such as bytes) can be viewed, but not changed.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, buffer):
+        buffer = memoryview(buffer)
+
+        if len(buffer) != PCB_LENGTH:
+            raise ValueError('Buffer must be %d bytes long.' % PCB_LENGTH)
+
+        super(ESQ1PatchView, self).__init__(buffer)
+
+    @property
+    def name(self):
+        name = self._buffer[:ESQ1Patch.NAME_LENGTH].tobytes()
+
+        return name.decode('latin-1')
+
+    @name.setter
+    def name(self, name):
+        patch = ESQ1Patch()
+        patch.name = name
+
+        self._buffer[:ESQ1Patch.NAME_LENGTH] = patch.clean_name()
+
+    def serialize(self):
+        """Return a copy of the PCB bytes as a bytearray."""
+        return bytearray(self._buffer)
+
+    def __eq__(self, other):
+        # compare names as they would be stored (see ESQ1Patch.clean_name()).
+        name = getattr(other, 'name', None)
+
+        if not isinstance(name, str) or name.ljust(ESQ1Patch.NAME_LENGTH)[
+                :ESQ1Patch.NAME_LENGTH].upper() != self.name:
+            return False
+
+        return super(ESQ1PatchView, self).__eq__(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def validate(self, repair=False):
+        """Return a list of InvalidFields for every out-of-range value (see
+        validate_pcb()), setting each to the nearest value within range if
+        repair is True.
+        """
+        return validate_pcb(self._buffer, repair)
+
+    def to_patch(self, repair=False):
+        """Return an ESQ1Patch containing the viewed values.
+
+        repair -- if True, values that are out of range are set to the
+          nearest value within range in the patch (but not in the buffer),
+          rather than raising ValueError.
+        """
+        pcb = bytearray(self._buffer)
+
+        if repair:
+            validate_pcb(pcb, repair=True)
+
+        patch = ESQ1Patch()
+        patch.deserialize(iter(pcb))
+
+        return patch
+
+
+# the number of patches in an 'all program dump'.
+BANK_SIZE = 40
+
+SINGLE_PROGRAM_DUMP = 0x01
+ALL_PROGRAM_DUMP = 0x02
+
+
+# SYSEX, Ensoniq ID, ESQ-1 ID.
+SYSEX_HEADER = b'\xF0\x0F\x02'
+
+# the number of patches in each type of dump.
+DUMP_PATCH_COUNTS = {
+    SINGLE_PROGRAM_DUMP: 1,
+    ALL_PROGRAM_DUMP: BANK_SIZE,
+}
+
+
+def dump_length(dump_type):
+    """Return the length in bytes of a SYSEX dump of dump_type, including
+    the header, channel, dump type and end of SYSEX.
+    """
+    return 5 + DUMP_PATCH_COUNTS[dump_type] * PCB_LENGTH * 2 + 1
+
+
+# translation tables splitting each byte into its low and high nibbles, and
+# moving a nibble into the high four bits of a byte.
+_LOW_NIBBLES = bytes(bytearray(byte & 0b00001111 for byte in range(256)))
+_HIGH_NIBBLES = bytes(bytearray(byte >> 4 for byte in range(256)))
+_NIBBLES_TO_HIGH = bytes(bytearray((byte << 4) & 0xFF
+                                   for byte in range(256)))
+
+
+def _is_nibbles(data):
+    """Return True if no byte of data is greater than 15."""
+    return not bytes(data).translate(_HIGH_NIBBLES).strip(b'\x00')
+
+
+def pack_nibbles(pcb):
+    """Split each PCB byte into two bytes, the low four bits followed by the
+    high four bits, as stored in a SYSEX dump. Return a bytearray.
+
+    The bytes are processed in bulk rather than one at a time.
+    """
+    pcb = bytes(pcb)
+    result = bytearray(len(pcb) * 2)
+
+    result[0::2] = pcb.translate(_LOW_NIBBLES)
+    result[1::2] = pcb.translate(_HIGH_NIBBLES)
+
+    return result
+
+
+def unpack_nibbles(nibbles):
+    """Combine each pair of bytes of a SYSEX dump (the low four bits followed
+    by the high four bits) into one PCB byte. Return a bytearray.
+
+    The bytes are processed in bulk rather than one at a time.
+    """
+    nibbles = bytes(nibbles)
+
+    if len(nibbles) % 2:
+        raise ValueError('Expected an even number of bytes.')
+    elif not _is_nibbles(nibbles):
+        raise ValueError('Each byte must be <= 15.')
+
+    low = nibbles[0::2]
+    high = nibbles[1::2].translate(_NIBBLES_TO_HIGH)
+
+    # the low and high bits do not overlap, so both halves can be combined
+    # with a single bitwise or.
+    combined = int.from_bytes(low, 'big') | int.from_bytes(high, 'big')
+
+    return bytearray(combined.to_bytes(len(low), 'big'))
+
+
+def _parse_sysex(sysex):
+    """Return the dump type of the ESQ-1 program dump at the start of sysex,
+    and the nibbles of its patches.
+
+    Raise ValueError if sysex does not start with a complete program dump.
+    """
+    # SYSEX, Ensoniq ID, ESQ-1 ID, channel, dump type.
+    if len(sysex) < 5 or sysex[:3] != SYSEX_HEADER:
+        raise ValueError('Not an ESQ-1 SYSEX file.')
+
+    # the channel (sysex[3]) is not used.
+    dump_type = sysex[4]
+
+    if dump_type not in DUMP_PATCH_COUNTS:
+        raise ValueError('Invalid dump type - %s' % dump_type)
+
+    length = dump_length(dump_type)
+
+    if len(sysex) < length:
+        raise ValueError('SYSEX file is truncated.')
+    elif sysex[length - 1] != 0xF7:
+        raise ValueError('SYSEX dump is not terminated.')
+
+    return dump_type, sysex[5:length - 1]
+
+
+def _repair_records(pcb):
+    """Set every out-of-range value of the PCB records in pcb (a bytearray)
+    to the nearest value within its range.
+    """
+    for start in range(0, len(pcb), PCB_LENGTH):
+        record = pcb[start:start + PCB_LENGTH]
+
+        if validate_pcb(record, repair=True):
+            pcb[start:start + PCB_LENGTH] = record
+
+
+def sysex_to_esq1_patches(filename, repair=False):
+    """Read a SYSEX file and return a list of patches.
+
+    If the SYSEX file is in the 'single program dump' format, the list will
+    contain one patch. If the SYSEX file is in the 'all program dump' format,
+    the list will contain 40 patches.
+
+    repair -- if True, values that are out of range are set to the nearest
+      value within range (see validate_pcb()), rather than raising
+      ValueError.
+    """
+    with open(filename, 'rb') as sysex_file:
+        sysex = sysex_file.read()
+
+    dump_type, nibbles = _parse_sysex(sysex)
+
+    # combine each pair of bytes into one.
+    pcb = unpack_nibbles(nibbles)
+
+    if repair:
+        _repair_records(pcb)
+
+    unpacker = iter(pcb)
+    patches = []
+
+    # create a patch and unpack the bytes into it.
+    for i in range(DUMP_PATCH_COUNTS[dump_type]):
+        patch = ESQ1Patch()
         patches.append(patch)
 
-        patch.deserialize(unpacker)
+        patch.deserialize(unpacker)
+
+    return patches
+
+
+class LazyPatchList(object):
+    """A read-only sequence of the patches of a SYSEX dump, each decoded
+    only when it is first accessed. Returned by load_sysex().
+
+    The raw nibbles of the dump are kept, and a name or patch is decoded
+    from its own bytes when asked for, so listing the names of a dump does
+    not deserialize any patches. Decoded patches are cached, and the same
+    ESQ1Patch is returned each time (including from slices of the list).
+
+    nibbles -- the bytes of the dump between the dump type and the end of
+      SYSEX.
+
+    repair -- if True, values that are out of range are set to the nearest
+      value within range when a patch is decoded, rather than raising
+      ValueError. record() always returns the bytes as stored.
+    """
+
+    def __init__(self, nibbles, indexes=None, cache=None, repair=False):
+        self._nibbles = nibbles
+        self._indexes = indexes if indexes is not None else \
+            range(len(nibbles) // (PCB_LENGTH * 2))
+        self._cache = cache if cache is not None else {}
+        self._repair = repair
+
+    def __len__(self):
+        return len(self._indexes)
+
+    def _unpack(self, index, length):
+        start = self._indexes[index] * PCB_LENGTH * 2
+
+        return unpack_nibbles(self._nibbles[start:start + length * 2])
+
+    def record(self, index):
+        """Return the PCB bytes of the patch at index."""
+        return bytes(self._unpack(index, PCB_LENGTH))
+
+    def name(self, index):
+        """Return the name of the patch at index, without decoding the rest
+        of the patch.
+        """
+        return self._unpack(index, ESQ1Patch.NAME_LENGTH).decode('latin-1')
+
+    @property
+    def names(self):
+        """A list of the name of each patch."""
+        return [self.name(i) for i in range(len(self))]
+
+    def validate(self):
+        """Return a list of InvalidFields, ordered by index, for every
+        out-of-range value of every patch (see validate_pcb()).
+        """
+        invalid = []
+
+        for i in range(len(self)):
+            invalid.extend(validate_pcb(self.record(i), index=i))
+
+        return invalid
+
+    def __getitem__(self, index):
+        """Return the ESQ1Patch at an integer index, or a LazyPatchList of a
+        slice of the patches (sharing this list's nibbles and cache).
+        """
+        if isinstance(index, slice):
+            return self.__class__(self._nibbles, self._indexes[index],
+                                  self._cache, self._repair)
+
+        key = self._indexes[index]
+        patch = self._cache.get(key)
+
+        if patch is None:
+            pcb = self._unpack(index, PCB_LENGTH)
+
+            if self._repair:
+                _repair_records(pcb)
+
+            patch = ESQ1Patch()
+            patch.deserialize(iter(pcb))
+            self._cache[key] = patch
+
+        return patch
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def load_sysex(filename, repair=False):
+    """Read a SYSEX file and return a LazyPatchList of its patches, which are
+    decoded as they are accessed (see sysex_to_esq1_patches(), which decodes
+    every patch at once). Patches with out-of-range values can be listed
+    with LazyPatchList.validate() before any are decoded.
+
+    repair -- if True, out-of-range values are set to the nearest value
+      within range as each patch is decoded.
+    """
+    with open(filename, 'rb') as sysex_file:
+        sysex = sysex_file.read()
+
+    return LazyPatchList(_parse_sysex(sysex)[1], repair=repair)
+
+
+def _iter_chunks(source, chunk_size):
+    """Yield successive chunks of bytes from a filename, a binary file-like
+    object or a bytes-like object (such as an mmap).
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as source_file:
+            for chunk in _iter_chunks(source_file, chunk_size):
+                yield chunk
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+
+            if not chunk:
+                break
+
+            yield chunk
+    else:
+        view = memoryview(source)
+
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+
+
+def _dump_records(dump):
+    """Return a list of the PCB records (bytes) of an ESQ-1 program dump, or
+    None if dump is not exactly one complete, valid dump.
+    """
+    try:
+        dump_type, nibbles = _parse_sysex(dump)
+    except ValueError:
+        return None
+
+    if len(dump) != dump_length(dump_type) or not _is_nibbles(nibbles):
+        return None
+
+    pcb = unpack_nibbles(nibbles)
+
+    return [bytes(pcb[i:i + PCB_LENGTH]) for i in range(0, len(pcb),
+                                                         PCB_LENGTH)]
+
+
+def _records_to_patches(records, repair=False):
+    """Return a list of an ESQ1Patch for each PCB record, or None for each
+    record with out-of-range values (unless repair is True, in which case
+    they are set to the nearest value within range).
+    """
+    patches = []
+
+    for record in records:
+        if repair:
+            record = bytearray(record)
+            validate_pcb(record, repair=True)
+
+        patch = ESQ1Patch()
 
-    # ensure the end of the SYSEX file has been reached.
-    assert next(sysex) == 0xF7
+        try:
+            patch.deserialize(iter(record))
+        except ValueError:
+            patch = None
+
+        patches.append(patch)
 
     return patches
 
 
+# a dump found by iter_sysex_dumps() or iter_embedded_dumps().
+#
+# offset -- the offset in the source of the dump's start of SYSEX (or, within
+#   a Standard MIDI File, of its SYSEX event).
+# channel -- the MIDI channel of the dump.
+# dump_type -- SINGLE_PROGRAM_DUMP or ALL_PROGRAM_DUMP.
+# patches -- a list of ESQ1Patch instances, or of PCB records (bytes).
+EmbeddedDump = namedtuple('EmbeddedDump',
+                          ['offset', 'channel', 'dump_type', 'patches'])
+
+
+def iter_sysex_dumps(source, raw=False, chunk_size=1 << 20, repair=False,
+                     details=False):
+    """Scan source for ESQ-1 dumps, yielding the patches of each dump as it is
+    found.
+
+    Only one dump is held in memory at a time, so source can be of any size.
+    Bytes that are not part of a dump (including dumps that are truncated or
+    not followed by an end of SYSEX) are skipped.
+
+    source -- a filename, a binary file-like object, or a bytes-like object
+      such as an mmap.
+
+    raw -- if True, yield a list of PCB records (bytes) for each dump rather
+      than a list of ESQ1Patch instances.
+
+    chunk_size -- the number of bytes read from source at a time.
+
+    repair -- if True, out-of-range values are set to the nearest value
+      within range. Otherwise a patch with out-of-range values is None in
+      its dump's list, and the scan continues (its record can be checked
+      with validate_pcb(), using raw=True).
+
+    details -- if True, yield an EmbeddedDump for each dump, with its offset
+      in source, channel and dump type, rather than just its patches.
+    """
+    buffer = bytearray()
+    chunks = _iter_chunks(source, chunk_size)
+    exhausted = False
+    # the offset in source of the start of buffer.
+    offset = 0
+
+    while True:
+        start = buffer.find(SYSEX_HEADER)
+
+        if start == -1:
+            # keep enough bytes to find a header split across two chunks.
+            start = max(len(buffer) - len(SYSEX_HEADER) + 1, 0)
+            length = None
+        elif start + 5 > len(buffer):
+            length = None
+        elif buffer[start + 4] in DUMP_PATCH_COUNTS:
+            length = dump_length(buffer[start + 4])
+        else:
+            # not a program dump.
+            start += 1
+            length = -1
+
+        del buffer[:start]
+        offset += start
+
+        if length == -1:
+            continue
+
+        if length is None or len(buffer) < length:
+            if exhausted and length is None:
+                break
+            elif exhausted:
+                # a truncated dump - resume scanning from the next byte.
+                del buffer[:1]
+                offset += 1
+                continue
+
+            try:
+                buffer += next(chunks)
+            except StopIteration:
+                exhausted = True
+
+            continue
+
+        records = _dump_records(buffer[:length])
+
+        if records is None:
+            # not a valid dump - resume scanning from the next byte.
+            del buffer[:1]
+            offset += 1
+            continue
+
+        channel, dump_type = buffer[3], buffer[4]
+        del buffer[:length]
+        patches = records if raw else _records_to_patches(records, repair)
+
+        if details:
+            yield EmbeddedDump(offset, channel, dump_type, patches)
+        else:
+            yield patches
+
+        offset += length
+
+
+def _varlen(value):
+    """Return value encoded as a Standard MIDI File variable-length
+    quantity.
+    """
+    encoded = bytearray([value & 0x7F])
+    value >>= 7
+
+    while value:
+        encoded.insert(0, 0x80 | (value & 0x7F))
+        value >>= 7
+
+    return bytes(encoded)
+
+
+def _read_varlen(data, position):
+    """Return the variable-length quantity at position in data, and the
+    position after it.
+    """
+    value = 0
+
+    for i in range(4):
+        if position >= len(data):
+            break
+
+        byte = data[position]
+        position += 1
+        value = (value << 7) | (byte & 0x7F)
+
+        if not byte & 0x80:
+            break
+
+    return value, position
+
+
+def _iter_pattern_dumps(data, pattern, skip):
+    """Yield (offset, dump) for each valid dump in data starting with
+    pattern, found with data.find().
+
+    skip -- the number of bytes of pattern, after its first, that are not
+      part of the dump (the length of an SMF SYSEX event).
+    """
+    position = data.find(pattern)
+
+    while position != -1:
+        start = position + 1 + skip
+
+        if start + 3 < len(data) and data[start + 3] in DUMP_PATCH_COUNTS:
+            length = dump_length(data[start + 3])
+            dump = b'\xF0' + data[start:start + length - 1]
+
+            if _dump_records(dump) is not None:
+                yield position, dump
+                position = data.find(pattern, start + length - 1)
+                continue
+
+        position = data.find(pattern, position + 1)
+
+
+def _iter_smf_sysex(data):
+    """Yield (offset, message) for each SYSEX message in the tracks of a
+    Standard MIDI File, joining messages split across several events.
+    """
+    position = 0
+
+    while position + 8 <= len(data):
+        chunk_type = data[position:position + 4]
+        end = position + 8 + int.from_bytes(data[position + 4:position + 8],
+                                            'big')
+        position, track_end = position + 8, min(end, len(data))
+
+        if chunk_type != b'MTrk':
+            position = end
+            continue
+
+        status = None
+        message = None
+
+        while position < track_end:
+            delta, position = _read_varlen(data, position)
+
+            if position >= track_end:
+                break
+
+            event = position
+            byte = data[position]
+
+            if byte == 0xFF:
+                length, position = _read_varlen(data, position + 2)
+                position += length
+            elif byte in (0xF0, 0xF7):
+                length, position = _read_varlen(data, position + 1)
+                packet = bytes(data[position:position + length])
+                position += length
+                status = None
+
+                if byte == 0xF0:
+                    message = bytearray(b'\xF0') + packet
+                    offset = event
+                elif message is not None:
+                    message += packet
+                elif packet[:1] == b'\xF0':
+                    # an escaped message, sent as is.
+                    message = bytearray(packet)
+                    offset = event
+
+                if message is not None and message[-1:] == b'\xF7':
+                    yield offset, bytes(message)
+                    message = None
+            else:
+                if byte & 0x80:
+                    status = byte
+                    position += 1
+                elif status is None:
+                    # corrupt track.
+                    break
+
+                position += 1 if (status & 0xF0) in (0xC0, 0xD0) else 2
+
+        position = end
+
+
+def iter_embedded_dumps(source, raw=False, repair=False):
+    """Find the ESQ-1 program dumps embedded anywhere in source, yielding an
+    EmbeddedDump for each, in order of offset.
+
+    Standard MIDI Files are read event by event, so dumps split across
+    several SYSEX events are found. Any other data is searched (with find(),
+    rather than a byte at a time) for the start of a dump, or of an SMF
+    SYSEX event containing a whole dump.
+
+    source -- a filename (which is memory-mapped), or a bytes-like object
+      with a find() method, such as bytes or an mmap.
+
+    raw -- if True, each EmbeddedDump's patches are PCB records (bytes)
+      rather than ESQ1Patch instances.
+
+    repair -- as for iter_sysex_dumps(): if False, a patch with out-of-range
+      values is None in its EmbeddedDump's patches.
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as source_file:
+            if not os.fstat(source_file.fileno()).st_size:
+                return
+
+            data = mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+            try:
+                for dump in iter_embedded_dumps(data, raw, repair):
+                    yield dump
+            finally:
+                data.close()
+
+        return
+
+    if source[:4] == b'MThd':
+        found = _iter_smf_sysex(source)
+    else:
+        # raw dumps, and unsplit SMF SYSEX events (whose length follows the
+        # start of SYSEX).
+        found = heapq.merge(_iter_pattern_dumps(source, SYSEX_HEADER, 0), *[
+            _iter_pattern_dumps(source, b'\xF0' + _varlen(
+                dump_length(dump_type) - 1) + SYSEX_HEADER[1:],
+                len(_varlen(dump_length(dump_type) - 1)))
+            for dump_type in sorted(DUMP_PATCH_COUNTS)])
+
+    for offset, dump in found:
+        records = _dump_records(dump)
+
+        if records is not None:
+            yield EmbeddedDump(offset, dump[3], dump[4], records if raw else
+                               _records_to_patches(records, repair))
+
+
+def pcb_to_sysex(pcb, dump_type, channel=0):
+    """Return a SYSEX dump (as a bytearray) of the PCB bytes of one patch
+    (dump_type SINGLE_PROGRAM_DUMP) or 40 patches (ALL_PROGRAM_DUMP).
+    """
+    # SYSEX, Ensoniq ID, ESQ-1 ID, channel, dump type.
+    result = bytearray(SYSEX_HEADER)
+    result += bytearray([channel, dump_type])
+
+    # last four bits, then first four bits, of each byte.
+    result += pack_nibbles(pcb)
+
+    # end of SYSEX.
+    result.append(0xF7)
+
+    return result
+
+
 def esq1_patches_to_sysex(patches, filename, channel=0):
     """Write a list of patches to the specified filename as a SYSEX file.
 
@@ -851,38 +2375,612 @@ def esq1_patches_to_sysex(patches, filename, channel=0):
     fewer than 40 patches, it will be padded with blank patches. If the list
     contains more than 40 patches, only the first 40 will be saved.
     """
-    # SYSEX, Ensoniq ID, ESQ-1 ID, channel.
-    result = bytearray([0xF0, 0x0F, 0x02, channel])
-
     # create copy of patches in local scope.
     patches = list(patches)
 
     if len(patches) == 1:
-        # single program dump.
-        result.append(0x01)
-
+        dump_type = SINGLE_PROGRAM_DUMP
         number_of_patches = 1
     elif len(patches) > 1:
-        # all program dump.
-        result.append(0x02)
-
-        number_of_patches = 40
+        dump_type = ALL_PROGRAM_DUMP
+        number_of_patches = BANK_SIZE
     else:
         raise ValueError('Must supply at least one patch.')
 
     # add blank patches, if necessary.
     patches += [ESQ1Patch() for i in range(number_of_patches - len(patches))]
 
-    # if there are more than 40 patches, ignore them.
-    for patch in patches[:40]:
-        for bytes in patch.serialize():
-            # append last four bits...
-            result.append(bytes & 0b00001111)
-            # ...then first four bits.
-            result.append(bytes >> 4)
+    pcb = bytearray()
 
-    # end of SYSEX.
-    result.append(0xF7)
+    # if there are more than 40 patches, ignore them.
+    for patch in patches[:BANK_SIZE]:
+        pcb += patch.serialize()
 
     with open(filename, 'wb') as output_file:
-        output_file.write(result)
+        output_file.write(pcb_to_sysex(pcb, dump_type, channel))
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('numpy is required for PatchBank.')
+
+
+# the number of patches generated from each stream of a seeded
+# PatchBank.random() run.
+RANDOM_BLOCK_SIZE = 4096
+
+
+def _random_columns(rng, count):
+    """Return a column of count random values for every parameter."""
+    columns = {}
+
+    for path in PARAMETER_PATHS:
+        prototype = parameter_prototype(path)
+        columns[path] = rng.integers(prototype.minimum, prototype.maximum + 1,
+                                     count, dtype=np.int16)
+
+    return columns
+
+
+def numpy_seed(seed):
+    """Return seed as something numpy.random.default_rng() accepts: strings
+    and bytes are hashed to an int, as random.Random does for patch_rng().
+    """
+    if isinstance(seed, str):
+        seed = seed.encode('utf-8')
+
+    if isinstance(seed, bytes):
+        return int.from_bytes(hashlib.sha512(seed).digest(), 'big')
+
+    return seed
+
+
+def _random_records(seed, start, count):
+    """Return the records of the patches at indexes start to start + count - 1
+    of the PatchBank.random() run seeded with seed.
+
+    A block's stream is drawn a patch at a time, with a value for each
+    parameter, so only the patches of a block up to the last one needed are
+    generated.
+    """
+    first = start // RANDOM_BLOCK_SIZE
+    last = (start + count - 1) // RANDOM_BLOCK_SIZE
+    minimums = np.array([parameter_prototype(path).minimum
+                         for path in PARAMETER_PATHS])
+    sizes = np.array([parameter_prototype(path).maximum + 1
+                      for path in PARAMETER_PATHS]) - minimums
+    blocks = [np.zeros((0, PCB_LENGTH), dtype=np.uint8)]
+
+    for block in range(first, last + 1):
+        block_start = block * RANDOM_BLOCK_SIZE
+        end = min(start + count - block_start, RANDOM_BLOCK_SIZE)
+        rng = np.random.default_rng(np.random.SeedSequence(
+            seed, spawn_key=(block,)))
+        values = minimums + (rng.random((end, len(PARAMETER_PATHS))) *
+                             sizes).astype(np.int16)
+        records = PatchBank.from_columns(dict(zip(PARAMETER_PATHS, values.T)),
+                                         count=end).records
+
+        blocks.append(records[max(start - block_start, 0):])
+
+    return np.concatenate(blocks)
+
+
+def _decode_column(records, fields, signed=True):
+    """Return an int16 array of the values of a parameter in each row of
+    records (a two-dimensional uint8 array).
+
+    signed -- if False, signed values are returned as stored in the PCB.
+
+    Raise ValueError if a signed value is stored as 64.
+    """
+    values = np.zeros(len(records), dtype=np.int16)
+
+    for field in fields:
+        part = (records[:, field.offset] & field.mask) >> field.shift
+        values |= part.astype(np.int16) << field.position
+
+    if signed and fields[0].signed:
+        invalid = np.flatnonzero(values == 64)
+
+        # as pcb_to_display(), which rejects the one stored value (64) that
+        # has no display value.
+        if len(invalid):
+            raise ValueError('PCB value must not be 64 (record %d).' %
+                             invalid[0])
+
+        values = _pcb_to_display_column(values)
+
+    return values
+
+
+def _pcb_to_display_column(values):
+    """Return an array of signed values as stored in the PCB converted to
+    display values, with a stored value of 64 becoming -64 (which is out of
+    every parameter's range).
+    """
+    return np.where(values >= 64, values - 128, values).astype(np.int16)
+
+
+def section_columns(sections, cls):
+    """Return a dictionary of the path of every parameter of a section class
+    (such as 'levels[0]' for Envelope) to an int16 array of its values in
+    each row of sections (a two-dimensional uint8 array of the section's PCB
+    bytes, such as that returned by PatchBank.section()).
+    """
+    _require_numpy()
+
+    sections = np.asarray(sections, dtype=np.uint8).reshape(
+        -1, cls.PCB_LENGTH)
+    paths = OrderedDict.fromkeys(field.path for field in cls.PCB_LAYOUT)
+
+    return dict((path, _decode_column(sections, [
+        field for field in cls.PCB_LAYOUT if field.path == path]))
+        for path in paths)
+
+
+class PatchBank(object):
+    """Any number of patches, stored as a two-dimensional numpy array of PCB
+    records (one 102-byte row per patch).
+
+    Parameters are decoded and encoded a column at a time, using PCB_FIELDS,
+    so that working with many patches does not require an ESQ1Patch (and its
+    Parameter instances) per patch. Paths are the same as the patch's
+    attributes, such as 'oscillators[1].waveform'.
+
+    Attributes:
+
+    records -- a uint8 array with the shape (number of patches, PCB_LENGTH).
+    """
+
+    def __init__(self, records=None):
+        _require_numpy()
+
+        if records is None:
+            records = np.zeros((0, PCB_LENGTH), dtype=np.uint8)
+        else:
+            records = np.asarray(records, dtype=np.uint8)
+
+            if records.ndim == 1:
+                records = records.reshape(-1, PCB_LENGTH)
+
+        if records.ndim != 2 or records.shape[1] != PCB_LENGTH:
+            raise ValueError('Records must have %d bytes each.' % PCB_LENGTH)
+
+        self.records = records
+
+    @classmethod
+    def blank(cls, count):
+        """Return a bank of count default patches."""
+        _require_numpy()
+
+        blank = np.frombuffer(bytes(ESQ1Patch().serialize()), dtype=np.uint8)
+
+        return cls(np.tile(blank, (count, 1)))
+
+    @classmethod
+    def from_columns(cls, columns, names=None, count=None):
+        """Return a bank encoded from a dictionary of paths to arrays of
+        values. Paths that are not supplied are set to their default value.
+        """
+        _require_numpy()
+
+        if count is None:
+            lengths = set(len(values) for values in columns.values())
+
+            if names is not None:
+                lengths.add(len(names))
+
+            if len(lengths) != 1:
+                raise ValueError('Columns must all have the same length.')
+
+            count = lengths.pop()
+
+        # encode into a column-major copy of the records, so that each byte
+        # column is contiguous.
+        bank = PatchBank(np.asfortranarray(PatchBank.blank(count).records))
+
+        for path, values in columns.items():
+            bank.set_column(path, values)
+
+        bank.records = np.ascontiguousarray(bank.records)
+
+        if names is not None:
+            bank.names = names
+
+        return cls(bank.records)
+
+    @classmethod
+    def from_patches(cls, patches):
+        """Return a bank containing a copy of each patch's values."""
+        _require_numpy()
+
+        # each section caches its serialized bytes, so this only encodes the
+        # sections that have changed since they were last serialized.
+        pcb = b''.join([bytes(patch.serialize()) for patch in patches])
+
+        return cls(np.frombuffer(pcb, dtype=np.uint8).reshape(-1, PCB_LENGTH)
+                   .copy())
+
+    @classmethod
+    def random(cls, count, rng=None, start=0, processes=1):
+        """Return a bank of count patches with every parameter set to a
+        random value between its minimum and maximum, as
+        ParameterCollection.randomize() would.
+
+        rng -- a seed (an int, str or bytes), or a numpy Generator. With a
+          seed (or None, for a random seed), the patches are those at indexes
+          start to start + count - 1 of the run seeded with that seed. Each
+          block of RANDOM_BLOCK_SIZE patches of a run has its own stream,
+          derived from the seed, so a run is identical however it is split
+          between calls or processes. A Generator is used as a single stream.
+
+        processes -- the number of worker processes to generate a seeded run
+          with.
+        """
+        _require_numpy()
+
+        if isinstance(rng, np.random.Generator):
+            return cls.from_columns(_random_columns(rng, count), count=count)
+
+        if rng is None:
+            rng = np.random.SeedSequence().entropy
+
+        rng = numpy_seed(rng)
+
+        if processes > 1 and count > RANDOM_BLOCK_SIZE:
+            # split the run on block boundaries, so no block is generated
+            # twice.
+            chunk = -(-count // (processes * 4))
+            chunk = -(-chunk // RANDOM_BLOCK_SIZE) * RANDOM_BLOCK_SIZE
+            edges = ([start] +
+                     list(range((start // chunk + 1) * chunk, start + count,
+                                chunk)) +
+                     [start + count])
+            jobs = [(rng, chunk_start, chunk_end - chunk_start)
+                    for chunk_start, chunk_end in zip(edges, edges[1:])]
+
+            with ProcessPoolExecutor(processes) as executor:
+                return cls(np.concatenate(list(
+                    executor.map(_random_records, *zip(*jobs)))))
+
+        return cls(_random_records(rng, start, count))
+
+    def to_sysex(self, filename, channel=0):
+        """Write the bank to filename as consecutive 'all program dumps' of 40
+        patches each. The final dump is padded with blank patches.
+        """
+        padding = -len(self) % BANK_SIZE
+        records = self.records
+
+        if padding:
+            records = np.concatenate([records,
+                                      PatchBank.blank(padding).records])
+
+        with open(filename, 'wb') as output_file:
+            for start in range(0, len(records), BANK_SIZE):
+                pcb = records[start:start + BANK_SIZE].tobytes()
+
+                output_file.write(pcb_to_sysex(pcb, ALL_PROGRAM_DUMP,
+                                               channel))
+
+    def to_patches(self):
+        """Return a list containing an ESQ1Patch for each record."""
+        columns = [(parse_path(path), self.column(path).tolist())
+                   for path in PARAMETER_PATHS]
+        patches = []
+
+        for index, name in enumerate(self.names):
+            patch = ESQ1Patch()
+            patch.name = name
+
+            for parts, values in columns:
+                obj = patch
+
+                for part in parts:
+                    if isinstance(part, int):
+                        obj = obj[part]
+                    else:
+                        obj = getattr(obj, part)
+
+                obj.value = values[index]
+
+            patches.append(patch)
+
+        return patches
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.to_patches())
+
+    def __getitem__(self, index):
+        """Return an ESQ1Patch for an integer index, or a bank sharing this
+        bank's records for a slice.
+        """
+        if isinstance(index, slice):
+            return PatchBank(self.records[index])
+
+        return PatchBank(self.records[index:index + 1 or None]).to_patches()[0]
+
+    def view(self, index):
+        """Return an ESQ1PatchView of the record at index. Changes made
+        through the view are made to the bank.
+        """
+        return ESQ1PatchView(self.records[index])
+
+    @property
+    def names(self):
+        """The name of each patch."""
+        name_bytes = self.records[:, :ESQ1Patch.NAME_LENGTH].tobytes()
+        length = ESQ1Patch.NAME_LENGTH
+
+        return [name_bytes[i:i + length].decode('latin-1')
+                for i in range(0, len(name_bytes), length)]
+
+    @names.setter
+    def names(self, names):
+        names = list(names)
+
+        if len(names) != len(self):
+            raise ValueError('Expected %d names, got %d.' %
+                             (len(self), len(names)))
+
+        patch = ESQ1Patch()
+        cleaned = bytearray()
+
+        for name in names:
+            patch.name = name
+            cleaned += patch.clean_name()
+
+        self.records[:, :ESQ1Patch.NAME_LENGTH] = np.frombuffer(
+            bytes(cleaned), dtype=np.uint8).reshape(-1, ESQ1Patch.NAME_LENGTH)
+
+    def section(self, path):
+        """Return the PCB bytes of the section at path (such as
+        'envelopes[3]') of every patch, as a uint8 array sharing the bank's
+        records, with a row per patch.
+        """
+        offset, cls = SECTION_OFFSETS[path]
+
+        return self.records[:, offset:offset + cls.PCB_LENGTH]
+
+    def raw_column(self, path):
+        """Return an int16 array of the values of the parameter at path, as
+        stored in the PCB.
+        """
+        return _decode_column(self.records, PCB_FIELDS_BY_PATH[path], False)
+
+    def column(self, path):
+        """Return an int16 array of the values of the parameter at path.
+        Raise ValueError if a signed value is stored as 64 (see validate()).
+        """
+        return _decode_column(self.records, PCB_FIELDS_BY_PATH[path])
+
+    def columns(self):
+        """Return a dictionary of every path to its column()."""
+        return dict((path, self.column(path)) for path in PARAMETER_PATHS)
+
+    def validate(self, repair=False):
+        """Return a list of InvalidFields, ordered by record, for every
+        parameter of every record whose value is out of its range (which
+        would raise a ValueError if deserialized). Signed values stored as 64
+        (-64) are invalid, as are values above the maximum of a parameter
+        that does not use all of its bits.
+
+        repair -- if True, also set each invalid value to the nearest value
+          within its range.
+        """
+        invalid = []
+
+        for path in PARAMETER_PATHS:
+            prototype = parameter_prototype(path)
+            raw = self.raw_column(path)
+
+            if PCB_FIELDS_BY_PATH[path][0].signed:
+                values = _pcb_to_display_column(raw)
+            else:
+                values = raw
+
+            out_of_range = ((values < prototype.minimum) |
+                            (values > prototype.maximum))
+
+            if not out_of_range.any():
+                continue
+
+            for index in np.flatnonzero(out_of_range).tolist():
+                invalid.append(InvalidField(index, path, int(raw[index])))
+
+            if repair:
+                self.set_column(path, np.clip(values, prototype.minimum,
+                                              prototype.maximum))
+
+        # sorting is stable, so each record's fields stay in the order of
+        # PARAMETER_PATHS.
+        invalid.sort(key=lambda field: field.index)
+
+        return invalid
+
+    def set_column(self, path, values):
+        """Set the parameter at path to values (an array with one value per
+        patch, or a single value for all of them).
+        """
+        prototype = parameter_prototype(path)
+        values = np.broadcast_to(np.asarray(values, dtype=np.int16),
+                                 (len(self),))
+
+        if len(values):
+            if values.min() < prototype.minimum:
+                raise ValueError('Value (%d) is less than minimum (%d).' %
+                                 (values.min(), prototype.minimum))
+            elif values.max() > prototype.maximum:
+                raise ValueError('Value (%d) is more than maximum (%d).' %
+                                 (values.max(), prototype.maximum))
+
+        fields = PCB_FIELDS_BY_PATH[path]
+
+        if fields[0].signed:
+            values = np.where(values < 0, values + 128, values)
+
+        for field in fields:
+            part = ((values >> field.position) << field.shift) & field.mask
+            column = self.records[:, field.offset]
+
+            self.records[:, field.offset] = (
+                (column & (~field.mask & 0xFF)) | part).astype(np.uint8)
+
+
+# the bytes before the records in a SharedPatchBank's shared memory, holding
+# the number of records.
+_SHARED_HEADER_SIZE = 8
+
+# the SharedPatchBanks attached to by this process's SharedPatchBank.map()
+# jobs, by name.
+_shared_banks = {}
+
+
+def _attach_shared_memory(name):
+    try:
+        # don't let this process's resource tracker remove the memory when
+        # it exits (Python 3.13 and later).
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name)
+
+
+def _close_shared_banks():
+    """Detach a worker process from the banks it has attached to."""
+    for bank in _shared_banks.values():
+        try:
+            bank.close()
+        except BufferError:
+            # the mapped function kept a view of the records.
+            pass
+
+    _shared_banks.clear()
+
+
+def _init_shared_worker():
+    # worker processes exit without running atexit handlers, but do run
+    # multiprocessing's finalizers.
+    Finalize(None, _close_shared_banks, exitpriority=0)
+
+
+def _call_shared(job):
+    name, function, indexes = job
+    bank = _shared_banks.get(name)
+
+    if bank is None:
+        bank = _shared_banks[name] = SharedPatchBank(name=name)
+
+    return [function(bank, index) for index in indexes]
+
+
+class SharedPatchBank(PatchBank):
+    """A PatchBank whose records are held in shared memory, so that worker
+    processes can read and change the patches without copying them.
+
+    A SharedPatchBank is pickled as the name of its shared memory, and
+    unpickled by attaching to it, so passing one to a worker process (or
+    using map()) sends only the name. Slices are PatchBanks that share the
+    memory.
+
+    records -- the records to copy into a new block of shared memory (see
+      PatchBank).
+
+    name -- the name of an existing SharedPatchBank's shared memory, to
+      attach to rather than creating a new one.
+
+    Attributes:
+
+    name -- the name of the shared memory.
+    """
+
+    def __init__(self, records=None, name=None):
+        _require_numpy()
+
+        if name is None:
+            records = PatchBank(records).records
+            self._memory = shared_memory.SharedMemory(
+                create=True, size=_SHARED_HEADER_SIZE + records.nbytes)
+            self._memory.buf[:_SHARED_HEADER_SIZE] = len(records).to_bytes(
+                _SHARED_HEADER_SIZE, 'little')
+        else:
+            self._memory = _attach_shared_memory(name)
+
+        self.owner = name is None
+        count = int.from_bytes(self._memory.buf[:_SHARED_HEADER_SIZE],
+                               'little')
+
+        super(SharedPatchBank, self).__init__(np.ndarray(
+            (count, PCB_LENGTH), dtype=np.uint8, buffer=self._memory.buf,
+            offset=_SHARED_HEADER_SIZE))
+
+        if name is None:
+            self.records[:] = records
+
+    @property
+    def name(self):
+        return self._memory.name
+
+    def __reduce__(self):
+        return (self.__class__, (None, self.name))
+
+    def close(self):
+        """Detach from the shared memory. Any slices or views of the records
+        must be deleted first.
+        """
+        self.records = None
+        self._memory.close()
+
+    def unlink(self):
+        """Free the shared memory, once every process has closed it. Only
+        the process that created the bank should do this.
+        """
+        self._memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+        if self.owner:
+            self.unlink()
+
+    def map(self, function, indexes=None, processes=None, chunksize=None):
+        """Return a list of function(bank, index) for each of indexes
+        (defaulting to every index), called in a pool of worker processes.
+
+        Each worker attaches to the bank once, so only the bank's name, the
+        function and the indexes are sent to it - function must be
+        picklable (defined at the top level of a module). Changes made to
+        the bank by workers are seen by every process.
+
+        processes -- the number of worker processes. Defaults to the number
+          of CPUs.
+
+        chunksize -- the number of indexes sent to a worker at a time.
+        """
+        if indexes is None:
+            indexes = range(len(self))
+
+        indexes = list(indexes)
+
+        if processes is None:
+            processes = os.cpu_count() or 1
+
+        if processes == 1 or len(indexes) <= 1:
+            return [function(self, index) for index in indexes]
+
+        if chunksize is None:
+            chunksize = max(1, -(-len(indexes) // (processes * 4)))
+
+        jobs = [(self.name, function, indexes[i:i + chunksize])
+                for i in range(0, len(indexes), chunksize)]
+
+        with ProcessPoolExecutor(
+                processes, initializer=_init_shared_worker) as executor:
+            return [result for results in executor.map(_call_shared, jobs)
+                    for result in results]
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+"""Validate every SYSEX file in a directory, and optionally write them to
+another directory, using a pool of processes:
+
+    python esq1_convert.py DIRECTORY [OUTPUT_DIRECTORY] --processes 4
+
+The same can be done from Python with find_sysex_files() and
+convert_sysex_files(), which return a ConversionResult for each file.
+"""
+
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import os
+import sys
+
+from esq1 import iter_sysex_dumps, pcb_to_sysex
+
+
+# the outcome of converting one SYSEX file with convert_sysex_files().
+#
+# source -- the SYSEX file read.
+# destination -- the SYSEX file written, or None.
+# patch_count -- the number of valid patches read.
+# error -- None, or a description of why the file could not be converted.
+ConversionResult = namedtuple('ConversionResult',
+                              ['source', 'destination', 'patch_count',
+                               'error'])
+
+
+def convert_sysex_file(source, destination=None):
+    """Read every dump in a SYSEX file, validate each patch by deserializing
+    it, and (if destination is given) write the dumps to destination again,
+    each with its original dump type and MIDI channel.
+
+    Errors (of any kind, so that one malformed file cannot stop a batch) are
+    returned in the ConversionResult rather than raised.
+    """
+    try:
+        dumps = list(iter_sysex_dumps(source, details=True))
+
+        if not dumps:
+            raise ValueError('No ESQ-1 dumps found.')
+
+        for index, dump in enumerate(dumps):
+            for position, patch in enumerate(dump.patches):
+                if patch is None:
+                    raise ValueError('Dump %d, patch %d has out-of-range '
+                                     'values.' % (index, position))
+
+        if destination is not None:
+            directory = os.path.dirname(destination)
+
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            with open(destination, 'wb') as output_file:
+                for dump in dumps:
+                    pcb = bytearray()
+
+                    for patch in dump.patches:
+                        pcb += patch.serialize()
+
+                    output_file.write(pcb_to_sysex(pcb, dump.dump_type,
+                                                   dump.channel))
+    except (EnvironmentError, ValueError) as e:
+        return ConversionResult(source, None, 0, str(e))
+    except Exception as e:
+        return ConversionResult(source, None, 0, '%s: %s' %
+                                (e.__class__.__name__, e))
+
+    return ConversionResult(source, destination,
+                            sum(len(dump.patches) for dump in dumps), None)
+
+
+def _convert_sysex_file(arguments):
+    return convert_sysex_file(*arguments)
+
+
+def convert_sysex_files(sources, output_directory=None, root=None,
+                        processes=None, chunksize=None):
+    """Convert many SYSEX files (see convert_sysex_file()) in parallel, using
+    a pool of processes. Return a list of ConversionResults, in the same
+    order as sources.
+
+    output_directory -- where to write the converted files. If None, files
+      are only read and validated.
+
+    root -- if given, each file is written to the same path relative to
+      output_directory as it has relative to root. Otherwise files are written
+      to output_directory using their base names, and a file with the same
+      base name as an earlier one is not converted (its result has an
+      error), rather than overwriting the earlier file's output.
+
+    processes -- the number of worker processes. Defaults to the number of
+      CPUs. If 1, files are converted in this process.
+
+    chunksize -- the number of files sent to a worker at a time. Defaults to
+      spreading the files into four chunks per worker.
+    """
+    jobs = []
+    results = []
+    destinations = {}
+
+    for source in sources:
+        if output_directory is None:
+            destination = None
+        elif root is not None:
+            destination = os.path.join(output_directory,
+                                       os.path.relpath(source, root))
+        else:
+            destination = os.path.join(output_directory,
+                                       os.path.basename(source))
+
+        key = destination and os.path.normcase(os.path.abspath(destination))
+
+        if key in destinations:
+            results.append(ConversionResult(
+                source, None, 0, 'Would overwrite the output of %s.' %
+                destinations[key]))
+        else:
+            if key is not None:
+                destinations[key] = source
+
+            results.append(None)
+            jobs.append((source, destination))
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    if processes == 1 or len(jobs) <= 1:
+        converted = [_convert_sysex_file(job) for job in jobs]
+    else:
+        if chunksize is None:
+            chunksize = max(1, len(jobs) // (processes * 4))
+
+        with ProcessPoolExecutor(processes) as executor:
+            converted = list(executor.map(_convert_sysex_file, jobs,
+                                          chunksize=chunksize))
+
+    # fill in the results of the files that were converted, in order.
+    converted = iter(converted)
+
+    return [result if result is not None else next(converted)
+            for result in results]
+
+
+def find_sysex_files(directory, extension='.syx'):
+    """Return a sorted list of the SYSEX files within directory and its
+    subdirectories.
+    """
+    filenames = []
+
+    for root, directories, names in os.walk(directory):
+        for name in names:
+            if name.lower().endswith(extension):
+                filenames.append(os.path.join(root, name))
+
+    return sorted(filenames)
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory')
+    parser.add_argument('output_directory', nargs='?')
+    parser.add_argument('--processes', type=int,
+                        help='number of worker processes (default: number '
+                             'of CPUs).')
+    arguments = parser.parse_args(argv)
+
+    sources = find_sysex_files(arguments.directory)
+    results = convert_sysex_files(sources, arguments.output_directory,
+                                  arguments.directory, arguments.processes)
+    failed = 0
+
+    for result in results:
+        if result.error is not None:
+            failed += 1
+            sys.stderr.write('%s: %s\n' % (result.source, result.error))
+
+    sys.stderr.write('%d file(s) converted, %d failed, %d patch(es).\n' %
+                     (len(results) - failed, failed,
+                      sum(result.patch_count for result in results)))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
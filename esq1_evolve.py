@@ -0,0 +1,243 @@
+"""A genetic algorithm for breeding ESQ-1 patches.
+
+Populations are PatchBanks, so mutation and crossover operate on the whole
+population's PCB records at once. Requires numpy.
+
+Example:
+
+    def brightness(patch):
+        # patch is an ESQ1PatchView.
+        return patch.miscellaneous.frequency.value
+
+    evolution = Evolution(brightness, PatchBank.random(200, rng=1), seed=1)
+    evolution.run(50)
+    patch, score = evolution.best()
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import time
+
+from esq1 import (ESQ1PatchView, PatchBank, PARAMETER_PATHS, PCB_LENGTH,
+                  SECTION_OFFSETS, np, numpy_seed, parameter_prototype)
+
+
+# the (start, length) of the bytes of each Envelope, LFO, Oscillator and the
+# Miscellaneous section.
+SECTION_SPANS = [(offset, cls.PCB_LENGTH)
+                 for offset, cls in SECTION_OFFSETS.values()]
+
+
+def mutate(bank, rates, rng):
+    """Return a copy of bank in which each parameter of each patch has been
+    replaced by a random value within its range, with a probability given by
+    rates.
+
+    rates -- a probability for every parameter, or a dictionary of paths to
+      probabilities (parameters that are not included are not mutated).
+
+    rng -- a numpy Generator.
+    """
+    if not isinstance(rates, dict):
+        rates = dict.fromkeys(PARAMETER_PATHS, rates)
+
+    mutated = PatchBank(bank.records.copy())
+    count = len(bank)
+
+    for path, rate in rates.items():
+        if not rate:
+            continue
+
+        selected = rng.random(count) < rate
+
+        if not selected.any():
+            continue
+
+        prototype = parameter_prototype(path)
+        values = mutated.column(path)
+        values[selected] = rng.integers(prototype.minimum,
+                                        prototype.maximum + 1,
+                                        selected.sum())
+
+        mutated.set_column(path, values)
+
+    return mutated
+
+
+def crossover(a, b, rng, rate=0.5):
+    """Return a bank in which each patch takes each whole section (Envelope,
+    LFO, Oscillator or Miscellaneous) from the patch at the same index in b
+    with a probability of rate, and otherwise from a. Names come from a.
+    """
+    if a.records.shape != b.records.shape:
+        raise ValueError('Cannot cross banks of different sizes.')
+
+    from_b = rng.random((len(a), len(SECTION_SPANS))) < rate
+    mask = np.zeros(a.records.shape, dtype=bool)
+
+    for section, (start, length) in enumerate(SECTION_SPANS):
+        mask[:, start:start + length] = from_b[:, section, np.newaxis]
+
+    return PatchBank(np.where(mask, b.records, a.records))
+
+
+def evaluate(fitness, records):
+    """Return a list of fitness(view) for a view of each PCB record."""
+    return [fitness(ESQ1PatchView(records[i:i + PCB_LENGTH]))
+            for i in range(0, len(records), PCB_LENGTH)]
+
+
+# statistics for one generation.
+GenerationStats = namedtuple('GenerationStats',
+                             ['generation', 'best', 'mean', 'seconds'])
+
+
+class Evolution(object):
+    """Evolves a population of patches to maximize a fitness function.
+
+    Each generation keeps the fittest patches (elite), then breeds the rest of
+    the population from parents chosen by tournament selection, using
+    section-level crossover and per-parameter mutation.
+
+    fitness -- a function passed an ESQ1PatchView and returning a number,
+      higher being fitter. Must be picklable (defined at the top level of a
+      module) when processes > 1.
+
+    population -- the initial PatchBank.
+
+    mutation_rate -- the probability of each parameter being mutated, or a
+      dictionary of paths to probabilities.
+
+    crossover_rate -- the probability of each section coming from the second
+      parent.
+
+    elite -- the number of fittest patches kept unchanged each generation.
+
+    tournament_size -- the number of patches competing to be each parent.
+
+    seed -- a seed (an int, str or bytes) for the numpy Generator.
+
+    processes -- the number of worker processes to evaluate fitness with.
+
+    Attributes:
+
+    population -- the current PatchBank.
+
+    scores -- the fitness of each patch of the population.
+
+    generation -- the number of generations bred so far.
+
+    history -- the GenerationStats of each generation.
+    """
+
+    def __init__(self, fitness, population, mutation_rate=0.02,
+                 crossover_rate=0.5, elite=2, tournament_size=3, seed=None,
+                 processes=1):
+        self.fitness = fitness
+        self.population = population
+        self.mutation_rate = mutation_rate
+        self.crossover_rate = crossover_rate
+        self.elite = elite
+        self.tournament_size = tournament_size
+        self.rng = np.random.default_rng(numpy_seed(seed))
+        self.processes = processes
+        self.generation = 0
+        self.history = []
+        self._executor = None
+        self.scores = self.evaluate(population)
+
+    def close(self):
+        """Stop the worker processes, if any."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def evaluate(self, bank):
+        """Return an array of the fitness of each patch of bank."""
+        records = bank.records.tobytes()
+
+        if self.processes <= 1 or len(bank) < self.processes:
+            return np.asarray(evaluate(self.fitness, records), dtype=float)
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.processes)
+
+        # one chunk of whole records per process.
+        chunk = -(-len(bank) // self.processes) * PCB_LENGTH
+        chunks = [records[i:i + chunk] for i in range(0, len(records), chunk)]
+        results = self._executor.map(evaluate, [self.fitness] * len(chunks),
+                                     chunks)
+
+        return np.asarray([score for scores in results for score in scores],
+                          dtype=float)
+
+    def _select(self, count):
+        """Return the indexes of count parents chosen by tournament."""
+        entrants = self.rng.integers(0, len(self.population),
+                                     (count, self.tournament_size))
+        winners = np.argmax(self.scores[entrants], axis=1)
+
+        return entrants[np.arange(count), winners]
+
+    def step(self):
+        """Breed one generation and return its GenerationStats."""
+        start = time.perf_counter()
+        size = len(self.population)
+        elite = min(self.elite, size)
+        count = size - elite
+
+        order = np.argsort(-self.scores, kind='stable')
+        kept = order[:elite]
+
+        a = PatchBank(self.population.records[self._select(count)])
+        b = PatchBank(self.population.records[self._select(count)])
+        children = mutate(crossover(a, b, self.rng, self.crossover_rate),
+                          self.mutation_rate, self.rng)
+
+        self.population = PatchBank(np.concatenate(
+            [self.population.records[kept], children.records]))
+        self.scores = np.concatenate([self.scores[kept],
+                                      self.evaluate(children)])
+        self.generation += 1
+
+        stats = GenerationStats(self.generation, float(self.scores.max()),
+                                float(self.scores.mean()),
+                                time.perf_counter() - start)
+        self.history.append(stats)
+
+        return stats
+
+    def run(self, generations, callback=None):
+        """Breed a number of generations, calling callback (if given) with
+        the GenerationStats of each. Return the list of GenerationStats.
+        """
+        stats = []
+
+        for i in range(generations):
+            stats.append(self.step())
+
+            if callback is not None:
+                callback(stats[-1])
+
+        return stats
+
+    @property
+    def generations_per_second(self):
+        """The average number of generations bred per second."""
+        seconds = sum(stats.seconds for stats in self.history)
+
+        return len(self.history) / seconds if seconds else 0.0
+
+    def best(self):
+        """Return the fittest patch of the population (an ESQ1Patch) and its
+        fitness.
+        """
+        index = int(np.argmax(self.scores))
+
+        return self.population[index], float(self.scores[index])
@@ -0,0 +1,360 @@
+"""Streaming export and import of ESQ-1 patches for other tools.
+
+Two formats are supported:
+
+JSON Lines -- one JSON object per patch, with its name and the full tree of
+  envelopes, lfos, oscillators and miscellaneous parameters, using the same
+  attribute names as ESQ1Patch.
+
+npy -- a numpy file of one fixed-width record per patch (see RECORD_DTYPE),
+  with a field for the name and for every parameter's decoded value. The
+  file can be memory-mapped and read a column at a time, such as
+  np.load(filename, mmap_mode='r')['miscellaneous.resonance'].
+
+Exports and imports are generators that work on chunks of patches at a
+time, so any number of patches can be converted in constant memory. Requires
+numpy.
+"""
+
+from collections import OrderedDict
+import json
+
+from esq1 import (ESQ1Patch, PatchBank, PARAMETER_PATHS, PCB_LENGTH, np,
+                  parameter_prototype, parse_path)
+
+
+# the number of patches encoded or decoded at a time.
+CHUNK_SIZE = 4096
+
+
+def _build_json_template():
+    """Return a %-format string for one patch's JSON object, with a %s for
+    the name followed by a %d for each parameter, and the path of each
+    parameter in the order of the %ds.
+    """
+    root = OrderedDict()
+
+    for path in PARAMETER_PATHS:
+        parts = parse_path(path)
+        node = root
+
+        for part in parts[:-1]:
+            node = node.setdefault(part, OrderedDict())
+
+        node[parts[-1]] = path
+
+    paths = []
+
+    def template(node):
+        if not isinstance(node, dict):
+            paths.append(node)
+            return '%d'
+        elif all(isinstance(part, int) for part in node):
+            return '[%s]' % ','.join(template(node[i]) for i in sorted(node))
+
+        return '{%s}' % ','.join('%s:%s' % (json.dumps(part), template(child))
+                                 for part, child in node.items())
+
+    return '{"name":%s,' + template(root)[1:], tuple(paths)
+
+
+_JSON_TEMPLATE, _JSON_PATHS = _build_json_template()
+
+_PARTS = [(path, parse_path(path), parameter_prototype(path))
+          for path in PARAMETER_PATHS]
+
+
+def _build_record_dtype():
+    fields = [('name', 'S%d' % ESQ1Patch.NAME_LENGTH)]
+
+    for path in PARAMETER_PATHS:
+        prototype = parameter_prototype(path)
+
+        if -128 <= prototype.minimum and prototype.maximum <= 127:
+            fields.append((path, np.int8))
+        else:
+            fields.append((path, np.int16))
+
+    return np.dtype(fields)
+
+
+# the numpy dtype of one patch in an npy export: the name as bytes, then a
+# field named by the path of every parameter, in PCB order.
+RECORD_DTYPE = _build_record_dtype() if np is not None else None
+
+
+def _records_to_bank(records):
+    """Return a PatchBank of a list of PCB records."""
+    return PatchBank(np.frombuffer(bytearray(b''.join(records)),
+                                   dtype=np.uint8))
+
+
+def _iter_banks(patches, chunk_size):
+    """Yield PatchBanks of up to chunk_size patches.
+
+    patches -- a PatchBank, or an iterable of ESQ1Patches, ESQ1PatchViews,
+      PCB records (bytes-like objects of PCB_LENGTH bytes) or PatchBanks.
+    """
+    if isinstance(patches, PatchBank):
+        patches = [patches]
+
+    pending = []
+
+    for patch in patches:
+        if isinstance(patch, PatchBank):
+            if pending:
+                yield _records_to_bank(pending)
+                pending = []
+
+            for start in range(0, len(patch), chunk_size):
+                yield patch[start:start + chunk_size]
+
+            continue
+
+        if hasattr(patch, 'serialize'):
+            record = bytes(patch.serialize())
+        else:
+            record = bytes(patch)
+
+            if len(record) != PCB_LENGTH:
+                raise ValueError('Records must have %d bytes each.' %
+                                 PCB_LENGTH)
+
+        pending.append(record)
+
+        if len(pending) == chunk_size:
+            yield _records_to_bank(pending)
+            pending = []
+
+    if pending:
+        yield _records_to_bank(pending)
+
+
+def iter_json_lines(patches, chunk_size=CHUNK_SIZE):
+    """Yield a line of JSON (ending with a newline) for each patch, such as:
+
+        {"name":"BRASS ","envelopes":[{"levels":[63,50,0],...},...],...}
+
+    patches -- a PatchBank, or an iterable of ESQ1Patches, ESQ1PatchViews,
+      PCB records or PatchBanks.
+    """
+    template = _JSON_TEMPLATE + '\n'
+
+    for bank in _iter_banks(patches, chunk_size):
+        rows = np.column_stack([bank.column(path) for path in _JSON_PATHS])
+
+        for name, row in zip(bank.names, rows.tolist()):
+            yield template % tuple([json.dumps(name)] + row)
+
+
+def _decode_json_line(line, number):
+    """Return the name and the value of every parameter (in the order of
+    PARAMETER_PATHS) of a line of JSON. Raise ValueError if a value is not an
+    int within its parameter's range, or the name is not a string.
+    """
+    try:
+        patch = json.loads(line)
+    except ValueError as error:
+        raise ValueError('Line %d: %s' % (number, error))
+
+    if not isinstance(patch, dict):
+        raise ValueError('Line %d: expected an object.' % number)
+
+    values = []
+
+    for path, parts, prototype in _PARTS:
+        value = patch
+
+        try:
+            for part in parts:
+                value = value[part]
+        except (KeyError, IndexError, TypeError):
+            value = int(prototype.default)
+        else:
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise ValueError('Line %d: %s must be an integer, not %s.' %
+                                 (number, path, json.dumps(value)))
+
+            if not prototype.minimum <= value <= prototype.maximum:
+                raise ValueError('Line %d: %s (%d) must be between %d and '
+                                 '%d.' % (number, path, value,
+                                          prototype.minimum,
+                                          prototype.maximum))
+
+        values.append(value)
+
+    name = patch.get('name', '')
+
+    if not isinstance(name, str):
+        raise ValueError('Line %d: name must be a string, not %s.' %
+                         (number, json.dumps(name)))
+
+    return name, values
+
+
+def _rows_to_bank(names, rows, first, last):
+    """Return a PatchBank of the names and values decoded from lines first
+    to last.
+    """
+    try:
+        values = np.array(rows, dtype=np.int16).reshape(
+            len(rows), len(PARAMETER_PATHS))
+
+        return PatchBank.from_columns(
+            dict(zip(PARAMETER_PATHS, values.T)), names=names)
+    except (OverflowError, TypeError, ValueError) as error:
+        raise ValueError('Lines %d to %d: %s' % (first, last, error))
+
+
+def iter_json_banks(lines, chunk_size=CHUNK_SIZE):
+    """Yield PatchBanks of up to chunk_size patches decoded from lines of
+    JSON, as written by iter_json_lines(). Blank lines are skipped, and
+    parameters that are missing are set to their default value. Raise
+    ValueError if a line is not valid or a value is out of range.
+
+    lines -- an iterable of strings, such as an open file.
+    """
+    names = []
+    rows = []
+    first = 1
+
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+
+        if not rows:
+            first = number
+
+        name, values = _decode_json_line(line, number)
+        names.append(name)
+        rows.append(values)
+
+        if len(rows) == chunk_size:
+            yield _rows_to_bank(names, rows, first, number)
+            names = []
+            rows = []
+
+    if rows:
+        yield _rows_to_bank(names, rows, first, number)
+
+
+def write_json_lines(patches, filename, chunk_size=CHUNK_SIZE):
+    """Write a line of JSON for each patch (see iter_json_lines()) to
+    filename. Return the number of patches written.
+    """
+    count = 0
+
+    with open(filename, 'w') as output_file:
+        for line in iter_json_lines(patches, chunk_size):
+            output_file.write(line)
+            count += 1
+
+    return count
+
+
+def read_json_lines(filename, chunk_size=CHUNK_SIZE):
+    """Yield PatchBanks of up to chunk_size patches read from a JSON Lines
+    file (see iter_json_banks()).
+    """
+    with open(filename) as input_file:
+        for bank in iter_json_banks(input_file, chunk_size):
+            yield bank
+
+
+def iter_npy_records(patches, chunk_size=CHUNK_SIZE):
+    """Yield arrays of up to chunk_size records of RECORD_DTYPE, one for
+    each patch.
+
+    patches -- a PatchBank, or an iterable of ESQ1Patches, ESQ1PatchViews,
+      PCB records or PatchBanks.
+    """
+    for bank in _iter_banks(patches, chunk_size):
+        records = np.empty(len(bank), dtype=RECORD_DTYPE)
+        records['name'] = bank.records[:, :ESQ1Patch.NAME_LENGTH].copy() \
+            .view('S%d' % ESQ1Patch.NAME_LENGTH)[:, 0]
+
+        for path in PARAMETER_PATHS:
+            records[path] = bank.column(path)
+
+        yield records
+
+
+# the most digits the number of records can have in an npy header.
+_COUNT_DIGITS = 20
+
+
+def _npy_header(count):
+    """Return the header of an npy file of count records of RECORD_DTYPE.
+
+    The header is padded to the same length whatever count is, so the
+    header can be written before the records are counted and rewritten
+    afterwards.
+    """
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+        np.lib.format.dtype_to_descr(RECORD_DTYPE), count)
+    header += ' ' * (_COUNT_DIGITS - len(str(count)))
+
+    # version 1.0 files store the header's length in two bytes, 2.0 in four.
+    if len(header) < 0xFFFF - 64:
+        version, length_bytes = (1, 0), 2
+    else:
+        version, length_bytes = (2, 0), 4
+
+    # the records must start on a multiple of 64 bytes, after a newline.
+    prefix = len(np.lib.format.magic(*version)) + length_bytes
+    header += ' ' * (-(prefix + len(header) + 1) % 64) + '\n'
+    length = len(header).to_bytes(length_bytes, 'little')
+
+    return np.lib.format.magic(*version) + length + header.encode('latin-1')
+
+
+def write_npy(patches, filename, chunk_size=CHUNK_SIZE):
+    """Write a record of RECORD_DTYPE for each patch to filename, as an npy
+    file that can be read with np.load(). Return the number of patches
+    written.
+    """
+    count = 0
+
+    with open(filename, 'wb') as output_file:
+        output_file.write(_npy_header(0))
+
+        for records in iter_npy_records(patches, chunk_size):
+            output_file.write(records.tobytes())
+            count += len(records)
+
+        output_file.seek(0)
+        output_file.write(_npy_header(count))
+
+    return count
+
+
+def read_npy(filename, chunk_size=CHUNK_SIZE):
+    """Yield PatchBanks of up to chunk_size patches read from an npy file
+    of records (see write_npy()). The file is memory-mapped, and fields that
+    are missing are set to their default value. Raise ValueError if the file
+    has fields that are not parameters, or a value is out of range.
+    """
+    records = np.load(filename, mmap_mode='r')
+    names = records.dtype.names
+
+    if records.ndim != 1 or names is None:
+        raise ValueError('Expected a one-dimensional array of records.')
+
+    unknown = set(names) - set(PARAMETER_PATHS) - set(['name'])
+
+    if unknown:
+        raise ValueError('Unknown field(s): %s.' % ', '.join(sorted(unknown)))
+
+    paths = [path for path in PARAMETER_PATHS if path in names]
+
+    for start in range(0, len(records), chunk_size):
+        chunk = records[start:start + chunk_size]
+        patch_names = None
+
+        if 'name' in names:
+            patch_names = [name.decode('latin-1')
+                           for name in chunk['name'].tolist()]
+
+        yield PatchBank.from_columns(
+            dict((path, chunk[path]) for path in paths), names=patch_names,
+            count=len(chunk))
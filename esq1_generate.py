@@ -0,0 +1,195 @@
+"""Constrained random generation of ESQ-1 patches.
+
+Candidate patches are generated a batch at a time as columns of values, and
+the constraints are applied to whole columns at once. Requires numpy.
+
+Example:
+
+    generator = PatchGenerator(
+        {'oscillators[0].waveform': {Oscillator.SAW: 1, Oscillator.BELL: 3}},
+        constraints=[is_audible, in_range('miscellaneous.frequency', 40)],
+        rng=1)
+    bank = generator.generate(1000)
+"""
+
+from esq1 import (PatchBank, PARAMETER_PATHS, PCB_FIELDS_BY_PATH, PCB_LENGTH,
+                  RANDOM_BLOCK_SIZE, np, numpy_seed, parameter_prototype)
+
+
+def is_audible(columns):
+    """A PatchGenerator constraint, true for patches that make a sound: at
+    least one oscillator is enabled with a level above zero, the final DCA's
+    envelope (envelope 4) reaches a level above zero, and its modulation
+    amount is above zero.
+    """
+    oscillators = np.logical_or.reduce(
+        [(columns['oscillators[%d].dca_enable' % i] != 0) &
+         (columns['oscillators[%d].dca_level' % i] > 0) for i in range(3)])
+    # the final DCA's level is clipped at zero, so negative levels are silent.
+    envelope = np.logical_or.reduce(
+        [columns['envelopes[3].levels[%d]' % i] > 0 for i in range(3)])
+
+    return (oscillators & envelope &
+            (columns['miscellaneous.dca4_modulation_amount'] > 0))
+
+
+def in_range(path, minimum=None, maximum=None):
+    """Return a PatchGenerator constraint, true for patches whose parameter at
+    path is >= minimum and <= maximum (either may be None).
+    """
+    def constraint(columns):
+        accepted = np.ones(len(columns[path]), dtype=bool)
+
+        if minimum is not None:
+            accepted &= columns[path] >= minimum
+
+        if maximum is not None:
+            accepted &= columns[path] <= maximum
+
+        return accepted
+
+    return constraint
+
+
+def _sampler(path, distribution):
+    """Return a function passed a numpy Generator and a count, returning count
+    values of the parameter at path drawn from distribution (see
+    PatchGenerator).
+    """
+    prototype = parameter_prototype(path)
+
+    if distribution is None:
+        minimum, maximum = prototype.minimum, prototype.maximum
+    elif callable(distribution):
+        return distribution
+    elif isinstance(distribution, dict):
+        values = np.array(sorted(distribution), dtype=np.int16)
+        weights = np.array([distribution[value] for value in sorted(
+            distribution)], dtype=float)
+
+        if not len(values) or weights.sum() <= 0:
+            raise ValueError('Weights for %s must not all be zero.' % path)
+        elif values.min() < prototype.minimum:
+            raise ValueError('Value (%d) is less than minimum (%d).' %
+                             (values.min(), prototype.minimum))
+        elif values.max() > prototype.maximum:
+            raise ValueError('Value (%d) is more than maximum (%d).' %
+                             (values.max(), prototype.maximum))
+
+        weights /= weights.sum()
+
+        return lambda rng, count: rng.choice(values, count, p=weights)
+    else:
+        minimum, maximum = distribution
+
+        if minimum < prototype.minimum:
+            raise ValueError('Value (%d) is less than minimum (%d).' %
+                             (minimum, prototype.minimum))
+        elif maximum > prototype.maximum:
+            raise ValueError('Value (%d) is more than maximum (%d).' %
+                             (maximum, prototype.maximum))
+        elif minimum > maximum:
+            raise ValueError('Minimum must not be greater than maximum.')
+
+    return lambda rng, count: rng.integers(minimum, maximum + 1, count,
+                                           dtype=np.int16)
+
+
+class PatchGenerator(object):
+    """Generates random patches that satisfy a set of constraints.
+
+    Candidates are generated a batch at a time as columns of values, the
+    constraints are applied to whole columns at once, and only the candidates
+    that satisfy every constraint are encoded into PCB records.
+
+    distributions -- a dictionary of paths to the distribution of that
+      parameter's values. Each may be a (minimum, maximum) tuple, for values
+      spread evenly within a narrower range, a dictionary of values to their
+      relative weights, or a function passed a numpy Generator and a count
+      and returning that many values. Other parameters are spread evenly
+      across their whole range, as ParameterCollection.randomize() would.
+
+    constraints -- a list of functions, each passed a dictionary of every path
+      to an array of candidate values (one per candidate patch), and
+      returning an array of booleans, true for the candidates to keep. See
+      is_audible() and in_range().
+
+    rng -- a seed (an int, str or bytes), or a numpy Generator.
+
+    batch_size -- the number of candidates generated at a time.
+
+    Attributes:
+
+    generated -- the number of candidates generated so far.
+
+    accepted -- the number of candidates that satisfied every constraint.
+    """
+
+    def __init__(self, distributions=None, constraints=(), rng=None,
+                 batch_size=RANDOM_BLOCK_SIZE):
+        distributions = distributions or {}
+
+        for path in distributions:
+            if path not in PCB_FIELDS_BY_PATH:
+                raise ValueError('Unknown parameter: %s' % path)
+
+        self._samplers = [(path, _sampler(path, distributions.get(path)))
+                          for path in PARAMETER_PATHS]
+        self.constraints = list(constraints)
+        self.rng = np.random.default_rng(numpy_seed(rng))
+        self.batch_size = batch_size
+        self.generated = 0
+        self.accepted = 0
+
+    @property
+    def acceptance_rate(self):
+        """The fraction of candidates that have satisfied every constraint."""
+        return self.accepted / float(self.generated) if self.generated else 0.0
+
+    def batch(self):
+        """Generate one batch of candidates, and return a bank of those that
+        satisfy every constraint.
+        """
+        columns = dict((path, np.asarray(sampler(self.rng, self.batch_size),
+                                         dtype=np.int16))
+                       for path, sampler in self._samplers)
+        accepted = np.ones(self.batch_size, dtype=bool)
+
+        for constraint in self.constraints:
+            accepted &= constraint(columns)
+
+        count = int(accepted.sum())
+        self.generated += self.batch_size
+        self.accepted += count
+
+        return PatchBank.from_columns(
+            dict((path, values[accepted]) for path, values in
+                 columns.items()), count=count)
+
+    def generate(self, count, max_batches=1000):
+        """Return a bank of count patches that satisfy every constraint.
+
+        Raises ValueError if max_batches batches are generated without
+        finding count patches.
+        """
+        banks = []
+        found = 0
+
+        while found < count:
+            if len(banks) == max_batches:
+                raise ValueError('Only %d of %d candidate patches satisfied '
+                                 'the constraints.' %
+                                 (found, max_batches * self.batch_size))
+
+            bank = self.batch()
+            banks.append(bank.records)
+            found += len(bank)
+
+        return PatchBank(np.concatenate(
+            [np.zeros((0, PCB_LENGTH), dtype=np.uint8)] + banks)[:count])
+
+    def __iter__(self):
+        """Yield ESQ1Patches that satisfy every constraint, indefinitely."""
+        while True:
+            for patch in self.batch().to_patches():
+                yield patch
@@ -0,0 +1,515 @@
+"""Persistent indexes of ESQ-1 patch collections, stored in SQLite."""
+
+from collections import namedtuple
+from contextlib import contextmanager
+import os
+import re
+import sqlite3
+
+from esq1 import (ESQ1Patch, PatchBank, PARAMETER_PATHS, PCB_LENGTH,
+                  iter_sysex_dumps, np, pcb_fingerprint)
+from esq1_convert import find_sysex_files
+
+
+NAME_LENGTH = ESQ1Patch.NAME_LENGTH
+
+
+class PatchIndex(object):
+    """A persistent index of patch fingerprints, used to find duplicate
+    patches across many SYSEX files.
+
+    Every patch added is recorded with its fingerprint (see pcb_fingerprint())
+    and where it was found, so the index can answer whether a patch has been
+    seen before, and where, without reading any SYSEX files again.
+
+    filename -- the SQLite database to store the index in. Defaults to an
+      in-memory database.
+
+    include_name -- if False, patches that only differ by name are treated as
+      duplicates. Fixed when the index is created: defaults to False for a
+      new index and to the stored setting for an existing one, and raises
+      ValueError if it differs from the stored setting.
+    """
+
+    def __init__(self, filename=':memory:', include_name=None):
+        self.connection = sqlite3.connect(filename)
+        migrate = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'fingerprints'"
+        ).fetchone() is None
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS sources (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                modified REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS patches (
+                fingerprint BLOB NOT NULL,
+                source TEXT NOT NULL,
+                dump INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                name TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS patches_fingerprint
+                ON patches (fingerprint);
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                fingerprint BLOB PRIMARY KEY
+            );
+        ''')
+
+        with self.connection:
+            if migrate:
+                # indexes created before the fingerprints table was added.
+                self.connection.execute(
+                    'INSERT OR IGNORE INTO fingerprints '
+                    'SELECT fingerprint FROM patches')
+
+            self.connection.execute(
+                'INSERT OR IGNORE INTO settings VALUES (?, ?)',
+                ('include_name', str(int(bool(include_name)))))
+
+        row = self.connection.execute(
+            "SELECT value FROM settings WHERE key = 'include_name'").fetchone()
+
+        self.include_name = bool(int(row[0]))
+
+        if include_name is not None and \
+                bool(include_name) != self.include_name:
+            self.connection.close()
+
+            raise ValueError('The index was created with include_name=%s.' %
+                             self.include_name)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def fingerprint(self, patch):
+        """Return the fingerprint of an ESQ1Patch, ESQ1PatchView or PCB
+        bytes, as stored in this index.
+        """
+        if hasattr(patch, 'serialize'):
+            patch = patch.serialize()
+
+        return pcb_fingerprint(patch, self.include_name)
+
+    def add_records(self, records, source='', dump=0):
+        """Add PCB records to the index. Return the number of records that
+        had not been seen before.
+        """
+        with self.connection:
+            return self._insert(records, source, dump)
+
+    def _insert(self, records, source, dump):
+        rows = [(self.fingerprint(record), source, dump, position,
+                 bytes(record[:NAME_LENGTH]).decode('latin-1'))
+                for position, record in enumerate(records)]
+
+        # only fingerprints that have not been seen before are inserted.
+        changes = self.connection.total_changes
+        self.connection.executemany(
+            'INSERT OR IGNORE INTO fingerprints VALUES (?)',
+            [row[:1] for row in rows])
+        new = self.connection.total_changes - changes
+
+        self.connection.executemany(
+            'INSERT INTO patches VALUES (?, ?, ?, ?, ?)', rows)
+
+        return new
+
+    def add_sysex(self, filename):
+        """Add every patch of every dump in a SYSEX file to the index. Files
+        that have already been added, and have not changed since, are skipped.
+
+        Return the number of patches that had not been seen before.
+        """
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        row = self.connection.execute(
+            'SELECT size, modified FROM sources WHERE path = ?',
+            (path,)).fetchone()
+
+        if row == (stat.st_size, stat.st_mtime):
+            return 0
+
+        new = 0
+
+        with self.connection:
+            self._remove_source(path)
+
+            for dump, records in enumerate(iter_sysex_dumps(path, raw=True)):
+                new += self._insert(records, path, dump)
+
+            self.connection.execute(
+                'INSERT OR REPLACE INTO sources VALUES (?, ?, ?)',
+                (path, stat.st_size, stat.st_mtime))
+
+        return new
+
+    def add_directory(self, directory, extension='.syx'):
+        """Add every SYSEX file within directory (and its subdirectories).
+        Return the number of patches that had not been seen before.
+        """
+        new = 0
+
+        for filename in find_sysex_files(directory, extension):
+            new += self.add_sysex(filename)
+
+        return new
+
+    def _remove_source(self, path):
+        """Remove the patches added from path, and the fingerprints of any
+        that are no longer in the index.
+        """
+        fingerprints = self.connection.execute(
+            'SELECT DISTINCT fingerprint FROM patches WHERE source = ?',
+            (path,)).fetchall()
+
+        self.connection.execute('DELETE FROM patches WHERE source = ?',
+                                (path,))
+        self.connection.executemany(
+            'DELETE FROM fingerprints WHERE fingerprint = ? AND NOT EXISTS '
+            '(SELECT 1 FROM patches WHERE patches.fingerprint = '
+            'fingerprints.fingerprint)', fingerprints)
+
+    def _contains(self, fingerprint):
+        return self.connection.execute(
+            'SELECT 1 FROM fingerprints WHERE fingerprint = ?',
+            (fingerprint,)).fetchone() is not None
+
+    def __contains__(self, patch):
+        """Return True if the patch (or PCB bytes) has been seen before."""
+        return self._contains(self.fingerprint(patch))
+
+    def locations(self, patch):
+        """Return a list of (source, dump, position, name) tuples for every
+        time the patch (or PCB bytes) has been seen.
+        """
+        return self.connection.execute(
+            'SELECT source, dump, position, name FROM patches '
+            'WHERE fingerprint = ? ORDER BY rowid',
+            (self.fingerprint(patch),)).fetchall()
+
+    def duplicates(self):
+        """Yield a list of locations (see locations()) for each patch that has
+        been seen more than once.
+        """
+        cursor = self.connection.execute(
+            'SELECT fingerprint FROM patches GROUP BY fingerprint '
+            'HAVING COUNT(*) > 1')
+
+        for fingerprint, in cursor.fetchall():
+            yield self.connection.execute(
+                'SELECT source, dump, position, name FROM patches '
+                'WHERE fingerprint = ? ORDER BY rowid',
+                (fingerprint,)).fetchall()
+
+    def __len__(self):
+        """Return the number of unique patches."""
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM fingerprints').fetchone()[0]
+
+
+def column_name(path):
+    """Return the name of the PatchLibrary column of the parameter at path,
+    such as 'oscillators_1_waveform' for 'oscillators[1].waveform'.
+    """
+    return re.sub(r'\W+', '_', path).strip('_')
+
+
+_COLUMNS = dict((path, column_name(path)) for path in PARAMETER_PATHS)
+
+_INSERT = ('INSERT INTO library_patches (source, dump, position, name, pcb, '
+           '%s) VALUES (%s)' % (
+               ', '.join(_COLUMNS[path] for path in PARAMETER_PATHS),
+               ', '.join(['?'] * (len(PARAMETER_PATHS) + 5))))
+
+# the comparison operators a PatchLibrary query can use, and their SQL.
+OPERATORS = {
+    '==': '=',
+    '!=': '!=',
+    '<': '<',
+    '<=': '<=',
+    '>': '>',
+    '>=': '>=',
+}
+
+# a patch found by PatchLibrary.find().
+#
+# id -- the patch's id within the library.
+# source -- the SYSEX file (or other source) the patch was added from.
+# dump -- the index of the dump within the source.
+# position -- the index of the patch within the dump.
+# name -- the patch's name.
+LibraryEntry = namedtuple('LibraryEntry',
+                          ['id', 'source', 'dump', 'position', 'name'])
+
+
+class PatchLibrary(object):
+    """A persistent library of patches that can be searched by the values
+    of their parameters.
+
+    Each patch is stored with its PCB record and a column for every
+    parameter (see column_name()), and every parameter column is indexed, so
+    queries do not need to decode, or even read, every patch. Patches are
+    decoded a column at a time when they are added, so this requires numpy.
+
+    Records with out-of-range values (see PatchBank.validate()) are skipped
+    rather than added, so one bad patch does not stop a file or directory
+    from being added.
+
+    filename -- the SQLite database to store the library in. Defaults to an
+      in-memory database.
+
+    Attributes:
+
+    skipped -- the number of records skipped for having out-of-range values.
+    """
+
+    def __init__(self, filename=':memory:'):
+        self.connection = sqlite3.connect(filename)
+        self._bulk = 0
+        self.skipped = 0
+        columns = ''.join(',\n    %s INTEGER NOT NULL' % _COLUMNS[path]
+                          for path in PARAMETER_PATHS)
+
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS library_sources (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                modified REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS library_patches (
+                id INTEGER PRIMARY KEY,
+                source TEXT NOT NULL,
+                dump INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                pcb BLOB NOT NULL%s
+            );
+            CREATE INDEX IF NOT EXISTS library_source
+                ON library_patches (source);
+        ''' % columns)
+        self._create_indexes()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _create_indexes(self):
+        with self.connection:
+            for path in PARAMETER_PATHS:
+                self.connection.execute(
+                    'CREATE INDEX IF NOT EXISTS library_%s '
+                    'ON library_patches (%s)' % (_COLUMNS[path],
+                                                 _COLUMNS[path]))
+
+    @contextmanager
+    def bulk(self):
+        """Return a context manager for adding many patches at once.
+
+        The parameter indexes are dropped for its duration and rebuilt when
+        it exits, which is several times faster than updating every index
+        for every patch added, but queries made within it scan every patch.
+        """
+        if not self._bulk:
+            with self.connection:
+                for path in PARAMETER_PATHS:
+                    self.connection.execute('DROP INDEX IF EXISTS library_%s'
+                                            % _COLUMNS[path])
+
+        self._bulk += 1
+
+        try:
+            yield self
+        finally:
+            self._bulk -= 1
+
+            if not self._bulk:
+                self._create_indexes()
+
+    def add_records(self, records, source='', dump=0):
+        """Add PCB records (a PatchBank, or a list of bytes) to the library,
+        skipping those with out-of-range values. Return the number of records
+        added.
+        """
+        with self.connection:
+            return self._insert(records, source, dump)
+
+    def _insert(self, records, source, dump):
+        if not isinstance(records, PatchBank):
+            records = PatchBank(np.frombuffer(b''.join(records),
+                                              dtype=np.uint8))
+
+        valid = np.ones(len(records), dtype=bool)
+        valid[[field.index for field in records.validate()]] = False
+        positions = np.flatnonzero(valid).tolist()
+        self.skipped += len(records) - len(positions)
+
+        if len(positions) < len(records):
+            records = PatchBank(records.records[valid])
+
+        columns = [records.column(path).tolist() for path in PARAMETER_PATHS]
+        rows = [(source, dump, position, name, record.tobytes()) + values
+                for position, name, record, values in zip(
+                    positions, records.names, records.records, zip(*columns))]
+
+        self.connection.executemany(_INSERT, rows)
+
+        return len(rows)
+
+    def add_sysex(self, filename):
+        """Add every patch of every dump in a SYSEX file to the library. Files
+        that have already been added, and have not changed since, are
+        skipped; the patches of files that have changed are replaced.
+
+        Return the number of patches added.
+        """
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+
+        if not self._changed(path, stat):
+            return 0
+
+        added = 0
+
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM library_patches WHERE source = ?', (path,))
+
+            for dump, records in enumerate(iter_sysex_dumps(path, raw=True)):
+                added += self._insert(records, path, dump)
+
+            self.connection.execute(
+                'INSERT OR REPLACE INTO library_sources VALUES (?, ?, ?)',
+                (path, stat.st_size, stat.st_mtime))
+
+        return added
+
+    def _changed(self, path, stat):
+        """Return True if the file at path has not been added, or has
+        changed since it was.
+        """
+        return self.connection.execute(
+            'SELECT size, modified FROM library_sources WHERE path = ?',
+            (path,)).fetchone() != (stat.st_size, stat.st_mtime)
+
+    def add_directory(self, directory, extension='.syx'):
+        """Add every SYSEX file within directory (and its subdirectories)
+        that has not already been added, or has changed since. Return the
+        number of patches added.
+
+        When the new files hold more patches than the library already does,
+        they are added in bulk() mode.
+        """
+        filenames = []
+        size = 0
+
+        for filename in find_sysex_files(directory, extension):
+            stat = os.stat(filename)
+
+            if self._changed(os.path.abspath(filename), stat):
+                filenames.append(filename)
+                size += stat.st_size
+
+        # each patch takes up about PCB_LENGTH * 2 bytes of a SYSEX file.
+        if size // (PCB_LENGTH * 2) > len(self):
+            with self.bulk():
+                return sum(self.add_sysex(filename) for filename in filenames)
+
+        return sum(self.add_sysex(filename) for filename in filenames)
+
+    def _where(self, conditions):
+        """Return the SQL WHERE clause (or '') and its parameters for a list
+        of (path, operator, value) conditions (see find()).
+        """
+        clauses = []
+        parameters = []
+
+        for path, operator, value in conditions:
+            if operator not in OPERATORS:
+                raise ValueError('Invalid operator - %s' % operator)
+
+            if '[*]' in path:
+                # expand every [*], such as envelopes[*].levels[*].
+                pattern = re.compile(
+                    re.escape(path).replace(re.escape('[*]'), r'\[\d+\]'))
+                paths = [expanded for expanded in PARAMETER_PATHS
+                         if pattern.fullmatch(expanded)]
+            else:
+                paths = [path]
+
+            if not paths or paths[0] not in _COLUMNS:
+                raise ValueError('Unknown parameter: %s' % path)
+
+            clauses.append('(%s)' % ' OR '.join(
+                '%s %s ?' % (_COLUMNS[expanded], OPERATORS[operator])
+                for expanded in paths))
+            parameters.extend([value] * len(paths))
+
+        if not clauses:
+            return '', parameters
+
+        return ' WHERE ' + ' AND '.join(clauses), parameters
+
+    def find(self, conditions=()):
+        """Return a list of LibraryEntries for the patches meeting every one
+        of a list of (path, operator, value) conditions, in the order they
+        were added. For example:
+
+            library.find([('oscillators[*].waveform', '==', Oscillator.BELL),
+                          ('miscellaneous.resonance', '>', 20)])
+
+        operator is one of OPERATORS. A path may use [*] for any index, such
+        as 'oscillators[*].waveform' for any of the three oscillators, or
+        'envelopes[*].levels[*]' for any level of any envelope. Raise
+        ValueError if a path matches no parameter.
+        """
+        where, parameters = self._where(conditions)
+
+        return [LibraryEntry(*row) for row in self.connection.execute(
+            'SELECT id, source, dump, position, name FROM library_patches' +
+            where + ' ORDER BY id', parameters)]
+
+    def count(self, conditions=()):
+        """Return the number of patches meeting conditions (see find())."""
+        where, parameters = self._where(conditions)
+
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM library_patches' + where,
+            parameters).fetchone()[0]
+
+    def record(self, entry):
+        """Return the PCB bytes of a patch, given its LibraryEntry or id."""
+        row = self.connection.execute(
+            'SELECT pcb FROM library_patches WHERE id = ?',
+            (getattr(entry, 'id', entry),)).fetchone()
+
+        if row is None:
+            raise KeyError(entry)
+
+        return bytes(row[0])
+
+    def patch(self, entry):
+        """Return an ESQ1Patch of a patch, given its LibraryEntry or id."""
+        patch = ESQ1Patch()
+        patch.deserialize(iter(self.record(entry)))
+
+        return patch
+
+    def __len__(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM library_patches').fetchone()[0]
@@ -0,0 +1,660 @@
+"""Approximate audio previews of ESQ-1 patches.
+
+This is not an emulation of the ESQ-1 - the waveforms, the curves of the
+envelopes and LFOs, and the filter are simple approximations - but it plays
+each patch's oscillators through its envelopes, LFOs, filter and modulation
+routing, which is enough to audition large numbers of patches. Each part of
+the voice is computed for the whole note at once with numpy. Requires numpy.
+
+Example:
+
+    samples = render(patch, note=60, velocity=100)
+    write_wav('patch.wav', samples)
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import os
+import re
+import wave
+
+from esq1 import (ESQ1PatchView, Envelope, LFO, ModulationSource, Oscillator,
+                  PatchBank, np, section_columns)
+
+
+SAMPLE_RATE = 44100
+
+# the number of samples in each single-cycle oscillator waveform.
+TABLE_SIZE = 2048
+
+# envelopes and LFOs are evaluated once every CONTROL_PERIOD samples, and
+# interpolated between.
+CONTROL_PERIOD = 32
+
+# the filter is applied to overlapping blocks of this many samples, each with
+# its own cut-off frequency.
+FILTER_BLOCK_SIZE = 256
+
+# the values of the modulation sources that are not part of the patch
+# (WHEEL, PEDAL, XCTRL and PRESS), from 0 to 1.
+DEFAULT_CONTROLLERS = {
+    ModulationSource.WHEEL: 0.0,
+    ModulationSource.PEDAL: 0.0,
+    ModulationSource.XCTRL: 0.0,
+    ModulationSource.PRESS: 0.0,
+}
+
+
+def envelope_seconds(time):
+    """Return the approximate length in seconds of an envelope time (0 to
+    63), from instant to around 30 seconds.
+    """
+    time = np.asarray(time, dtype=float)
+
+    return np.where(time > 0, 0.005 * 2 ** (time / 5.0), 0.0)
+
+
+def lfo_hertz(frequency):
+    """Return the approximate rate in Hz of an LFO frequency (0 to 63)."""
+    return 0.05 * 2 ** (np.asarray(frequency, dtype=float) / 7.0)
+
+
+def filter_hertz(frequency):
+    """Return the approximate cut-off in Hz of a filter frequency (0 to 127,
+    although modulation can take it beyond either end).
+    """
+    return 20.0 * 2 ** (np.asarray(frequency, dtype=float) * 10 / 127.0)
+
+
+def _harmonics(amplitudes):
+    """Return a single cycle made from harmonics with amplitudes (the first
+    being the fundamental).
+    """
+    phase = np.arange(TABLE_SIZE) * 2 * np.pi / TABLE_SIZE
+    table = np.zeros(TABLE_SIZE)
+
+    for harmonic, amplitude in enumerate(amplitudes, 1):
+        if amplitude:
+            table += amplitude * np.sin(harmonic * phase)
+
+    return table
+
+
+def _noise(smoothing):
+    rng = np.random.default_rng(smoothing)
+    table = rng.uniform(-1, 1, TABLE_SIZE)
+    kernel = np.ones(smoothing) / smoothing
+
+    # smooth circularly, so the table loops without a click.
+    return np.convolve(np.concatenate([table, table[:smoothing - 1]]),
+                       kernel, 'valid')
+
+
+def _formant(center, count=32):
+    return [np.exp(-((k - center) / 1.5) ** 2) + 0.3 / k
+            for k in range(1, count + 1)]
+
+
+def _power(exponent, count=64, odd=False):
+    return [0 if odd and not k % 2 else k ** -exponent
+            for k in range(1, count + 1)]
+
+
+def _pulse(duty, count=64):
+    return [np.sin(np.pi * k * duty) / k for k in range(1, count + 1)]
+
+
+# approximations of each of the ESQ-1's waveforms.
+_WAVEFORMS = {
+    Oscillator.SAW: lambda: _harmonics(_power(1)),
+    Oscillator.BELL: lambda: _harmonics([1, 0, 0.5, 0, 0.2, 0.4, 0, 0.3]),
+    Oscillator.SINE: lambda: _harmonics([1]),
+    Oscillator.SQUARE: lambda: _harmonics(_power(1, odd=True)),
+    Oscillator.PULSE: lambda: _harmonics(_pulse(0.25)),
+    Oscillator.NOISE_1: lambda: _noise(1),
+    Oscillator.NOISE_2: lambda: _noise(4),
+    Oscillator.NOISE_3: lambda: _noise(16),
+    Oscillator.BASS: lambda: _harmonics(_power(1.5)),
+    Oscillator.PIANO: lambda: _harmonics(_power(2)),
+    Oscillator.EL_PNO: lambda: _harmonics([1, 0.1, 0.3, 0, 0.1]),
+    Oscillator.VOICE_1: lambda: _harmonics(_formant(3)),
+    Oscillator.VOICE_2: lambda: _harmonics(_formant(5)),
+    Oscillator.VOICE_3: lambda: _harmonics(_formant(8)),
+    Oscillator.KICK: lambda: _harmonics([1, 0.2]),
+    Oscillator.REED: lambda: _harmonics([k ** -1 * (1 if k % 2 else 0.3)
+                                         for k in range(1, 33)]),
+    Oscillator.ORGAN: lambda: _harmonics([1, 0.8, 0.6, 0.5, 0, 0.4, 0,
+                                          0.3]),
+    Oscillator.SYNTH_1: lambda: _harmonics(_power(0.8)),
+    Oscillator.SYNTH_2: lambda: _harmonics(_power(1.2, odd=True)),
+    Oscillator.SYNTH_3: lambda: _harmonics(_pulse(0.4)),
+    Oscillator.FORMT_1: lambda: _harmonics(_formant(2)),
+    Oscillator.FORMT_2: lambda: _harmonics(_formant(4)),
+    Oscillator.FORMT_3: lambda: _harmonics(_formant(6)),
+    Oscillator.FORMT_4: lambda: _harmonics(_formant(10)),
+    Oscillator.FORMT_5: lambda: _harmonics(_formant(14)),
+    Oscillator.PULSE2: lambda: _harmonics(_pulse(0.125)),
+    Oscillator.SQR_2: lambda: _harmonics(_power(1, count=8, odd=True)),
+    Oscillator.FOUR_OCTS: lambda: _harmonics([1, 1, 0, 1, 0, 0, 0, 1]),
+    Oscillator.PRIME: lambda: _harmonics([0, 1, 1, 0, 1, 0, 1, 0, 0, 0,
+                                          1, 0, 1]),
+    Oscillator.BASS_2: lambda: _harmonics(_power(2, odd=True)),
+    Oscillator.E_PNO2: lambda: _harmonics([1, 0.3, 0, 0.2, 0, 0.1]),
+    Oscillator.OCTAVE: lambda: _harmonics([1, 1]),
+    Oscillator.OCT_5: lambda: _harmonics([1, 1, 1]),
+}
+
+_wavetables = {}
+
+
+def wavetable(waveform):
+    """Return the single cycle (TABLE_SIZE samples, peaking at 1) used for an
+    oscillator waveform.
+    """
+    try:
+        return _wavetables[waveform]
+    except KeyError:
+        pass
+
+    table = _WAVEFORMS[waveform]()
+    table = _wavetables[waveform] = table / np.abs(table).max()
+
+    return table
+
+
+def _section_records(sections, cls):
+    """Return sections (a uint8 array of PCB bytes with a row per section, a
+    section instance, or a list of them) as a uint8 array.
+    """
+    if hasattr(sections, 'serialize'):
+        sections = [sections]
+
+    if not isinstance(sections, np.ndarray):
+        sections = np.frombuffer(b''.join(
+            [bytes(section.serialize()) for section in sections]),
+            dtype=np.uint8)
+
+    return sections.reshape(-1, cls.PCB_LENGTH)
+
+
+def _mix(values):
+    """Return the SplitMix64 hash of each of an array of uint64 values."""
+    values = values + np.uint64(0x9E3779B97F4A7C15)
+    values = (values ^ (values >> np.uint64(30))) * \
+        np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * \
+        np.uint64(0x94D049BB133111EB)
+
+    return values ^ (values >> np.uint64(31))
+
+
+def _unit(hashes):
+    """Return a float from 0 (inclusive) to 1 (exclusive) for each of an
+    array of uint64 hashes.
+    """
+    return (hashes >> np.uint64(11)) * (1.0 / (1 << 53))
+
+
+def _segments(t, points, values):
+    """Return the piecewise linear curves through points (times, with a row
+    of breakpoints per curve) and values, at times t, held at the last value
+    after the last point.
+    """
+    last = values[:, -1:]
+    curves = np.broadcast_to(last, np.broadcast_shapes(last.shape,
+                                                       np.shape(t)))
+
+    for k in range(points.shape[1] - 2, -1, -1):
+        start, end = points[:, k:k + 1], points[:, k + 1:k + 2]
+        fraction = np.clip((t - start) / np.maximum(end - start, 1e-9), 0, 1)
+        segment = (values[:, k:k + 1] +
+                   (values[:, k + 1:k + 2] - values[:, k:k + 1]) * fraction)
+        curves = np.where(t < end, segment, curves)
+
+    return curves
+
+
+class CurveEvaluator(object):
+    """Evaluates the curves of many Envelopes and LFOs at once, over a fixed
+    set of times.
+
+    Each curve is computed for every section at once with numpy, rather than
+    one section at a time, and is cached by the section's PCB bytes (and the
+    note's settings), so sections shared by many patches, or evaluated
+    again, are only computed once.
+
+    t -- the times to evaluate curves at, in seconds after the note starts.
+
+    max_size -- the number of curves to cache. The cache is emptied when it
+      is full.
+
+    Attributes:
+
+    hits -- the number of curves found in the cache.
+
+    misses -- the number of curves computed.
+    """
+
+    def __init__(self, t, max_size=4096):
+        self.t = np.asarray(t, dtype=float)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = {}
+
+    def _cached(self, keys, compute):
+        """Return an array of the curve for each of keys, calling compute
+        with the indexes of the keys that are not cached.
+        """
+        missing = OrderedDict()
+
+        for i, key in enumerate(keys):
+            if key not in self._cache and key not in missing:
+                missing[key] = i
+
+        self.misses += len(missing)
+        self.hits += len(keys) - len(missing)
+
+        if not keys:
+            return np.zeros((0, len(self.t)))
+
+        computed = {}
+
+        if missing:
+            computed = dict(zip(missing, compute(np.fromiter(
+                missing.values(), dtype=np.intp, count=len(missing)))))
+
+        curves = np.array([computed[key] if key in computed else
+                           self._cache[key] for key in keys])
+
+        if len(self._cache) + len(computed) > self.max_size:
+            self._cache.clear()
+
+        if len(computed) <= self.max_size:
+            self._cache.update(computed)
+
+        return curves
+
+    def envelopes(self, sections, note=60, velocity=100, hold=1.0,
+                  cycle=False):
+        """Return an array of the level (-1 to 1) of each Envelope at each
+        time, with the shape (number of sections, number of times).
+
+        The envelope moves from 0 to each of its levels in turn over its
+        first three times, and from the sustained level back to 0 over its
+        fourth, once the key is released after hold seconds (or, if cycle is
+        True, once the first three times have passed, if that is later).
+
+        sections -- the Envelopes' PCB bytes, as returned by
+          PatchBank.section(), or an Envelope, or a list of Envelopes.
+
+        note, velocity, hold, cycle -- a value for every section, or an array
+          with a value for each.
+        """
+        sections = _section_records(sections, Envelope)
+        count = len(sections)
+        settings = [np.broadcast_to(np.asarray(value), (count,))
+                    for value in (note, velocity, hold, cycle)]
+        keys = list(zip([section.tobytes() for section in sections],
+                        *[values.tolist() for values in settings]))
+
+        def compute(indexes):
+            note, velocity, hold, cycle = [values[indexes]
+                                           for values in settings]
+            columns = section_columns(sections[indexes], Envelope)
+            velocity = velocity / 127.0
+            scale = (1 - columns['velocity_level'] / 63.0 *
+                     (1 - velocity))[:, np.newaxis]
+            levels = np.column_stack(
+                [np.zeros(len(indexes))] +
+                [columns['levels[%d]' % i] / 63.0 for i in range(3)]) * scale
+            durations = envelope_seconds(np.column_stack(
+                [columns['times[%d]' % i] for i in range(4)]))
+
+            durations[:, 0] *= (1 - columns['velocity_attack_control'] /
+                                63.0 * velocity)
+            durations[:, 1:3] *= 2 ** (
+                -columns['keyboard_decay_scaling'] / 63.0 *
+                (note - 60) / 12.0)[:, np.newaxis]
+
+            points = np.column_stack([np.zeros(len(indexes)),
+                                      np.cumsum(durations[:, :3], axis=1)])
+            release = np.where(cycle, np.maximum(hold, points[:, -1]),
+                               hold)[:, np.newaxis]
+            sustained = _segments(release, points, levels)
+            held = _segments(self.t, points, levels)
+            fade = durations[:, 3:]
+            released = sustained * np.clip(
+                1 - (self.t - release) / np.maximum(fade, 1e-9), 0, 1)
+            released = np.where(fade > 0, released, 0)
+
+            return np.where(self.t < release, held, released)
+
+        return self._cached(keys, compute)
+
+    def lfos(self, sections, seed=0):
+        """Return an array of the output (-1 to 1) of each LFO at each time,
+        with the shape (number of sections, number of times), before any
+        modulation of its depth by its modulation source.
+
+        Its depth moves from levels[0] to levels[1] at a rate set by its
+        delay.
+
+        sections -- the LFOs' PCB bytes, as returned by PatchBank.section(),
+          or an LFO, or a list of LFOs.
+
+        seed -- a seed for the starting phase of LFOs that do not reset each
+          note, and the values of the NOISE waveform. These are hashed from
+          the seed, each section's PCB bytes and (for noise) the cycle, so
+          different sections get different phases and noise, and a section's
+          curve does not depend on the other sections evaluated with it.
+        """
+        sections = _section_records(sections, LFO)
+        keys = [(section.tobytes(), seed) for section in sections]
+        entropy = np.random.SeedSequence(seed).entropy
+        seed_hash = np.zeros(1, dtype=np.uint64)
+
+        # fold the seed's entropy into 64 bits, 64 bits at a time.
+        while True:
+            seed_hash = _mix(seed_hash ^ np.array(
+                entropy & 0xFFFFFFFFFFFFFFFF, dtype=np.uint64))
+            entropy >>= 64
+
+            if not entropy:
+                break
+
+        def compute(indexes):
+            # a hash of the seed and each section's bytes.
+            section_hashes = seed_hash ^ np.bitwise_or.reduce(
+                sections[indexes].astype(np.uint64) <<
+                (np.arange(LFO.PCB_LENGTH, dtype=np.uint64) * np.uint64(8)),
+                axis=1)
+            section_hashes = _mix(_mix(section_hashes))[:, np.newaxis]
+            columns = section_columns(sections[indexes], LFO)
+            start = (columns['levels[0]'] / 63.0)[:, np.newaxis]
+            end = (columns['levels[1]'] / 63.0)[:, np.newaxis]
+            delay = columns['delay'][:, np.newaxis]
+            ramp = envelope_seconds(64 - delay)
+            amount = np.where(delay > 0, start + (end - start) * np.clip(
+                self.t / ramp, 0, 1), start)
+
+            start = np.where(columns['reset'][:, np.newaxis], 0,
+                             _unit(section_hashes))
+            phase = (lfo_hertz(columns['frequency'])[:, np.newaxis] *
+                     self.t + start)
+            waveform = columns['waveform']
+            wave = np.empty(phase.shape)
+
+            # compute each waveform for only the sections that use it.
+            rows = waveform == LFO.TRIANGLE
+            wave[rows] = 1 - 4 * np.abs(((phase[rows] + 0.25) % 1) - 0.5)
+            rows = waveform == LFO.SAW
+            wave[rows] = 2 * (phase[rows] % 1) - 1
+            rows = waveform == LFO.SQR
+            wave[rows] = np.where(phase[rows] % 1 < 0.5, 1.0, -1.0)
+            rows = waveform == LFO.NOISE
+
+            if rows.any():
+                cycles = phase[rows].astype(np.int64)
+                # a random value for each cycle of each section.
+                counters = _mix(np.arange(1, cycles.max() + 2,
+                                          dtype=np.uint64))
+                noise = 2 * _unit(_mix(section_hashes[rows] ^ counters)) - 1
+                wave[rows] = np.take_along_axis(noise, cycles, axis=1)
+
+            return wave * amount
+
+        return self._cached(keys, compute)
+
+
+@lru_cache(maxsize=4)
+def curve_evaluator(duration, sample_rate=SAMPLE_RATE):
+    """Return the CurveEvaluator render() uses for notes of duration seconds,
+    which evaluates curves once every CONTROL_PERIOD samples.
+
+    Evaluators are kept for the four most recently used durations and sample
+    rates, as each one's cache of curves can take up a lot of memory.
+    """
+    count = int(duration * sample_rate)
+    t = np.arange(0, count + CONTROL_PERIOD, CONTROL_PERIOD)
+
+    return CurveEvaluator(t / float(sample_rate))
+
+
+def _modulation(sources, amounts, values):
+    """Return the sum of each of amounts (-63 to 63) times the value of its
+    modulation source.
+    """
+    total = 0.0
+
+    for source, amount in zip(sources, amounts):
+        if source.value != ModulationSource.OFF and amount.value:
+            total = total + amount.value / 63.0 * values[source.value]
+
+    return total
+
+
+def _filter(samples, cutoff, resonance, sample_rate):
+    """Apply a four pole low-pass filter to samples, with a cut-off (in Hz)
+    per sample and a resonance from 0 to 1.
+
+    The samples are split into overlapping windowed blocks, and each block is
+    filtered in the frequency domain using the cut-off at its center.
+    """
+    hop = FILTER_BLOCK_SIZE // 2
+    count = -(-len(samples) // hop) + 1
+    padded = np.zeros((count + 1) * hop)
+    padded[hop:hop + len(samples)] = samples
+
+    starts = np.arange(count) * hop
+    blocks = padded[starts[:, np.newaxis] + np.arange(FILTER_BLOCK_SIZE)]
+    blocks *= np.hanning(FILTER_BLOCK_SIZE + 1)[:-1]
+
+    centers = np.clip(starts, 0, len(samples) - 1)
+    fc = np.clip(cutoff[centers], 10, sample_rate * 0.45)[:, np.newaxis]
+    frequencies = np.fft.rfftfreq(FILTER_BLOCK_SIZE * 2, 1.0 / sample_rate)
+
+    # a four pole ladder filter, its gain at 0 Hz compensated for resonance.
+    feedback = resonance * 3.9
+    response = (1 + feedback) / ((1 + 1j * frequencies / fc) ** 4 + feedback)
+    spectra = np.fft.rfft(blocks, FILTER_BLOCK_SIZE * 2) * response
+    filtered = np.fft.irfft(spectra, FILTER_BLOCK_SIZE * 2)
+
+    output = np.zeros(len(padded) + FILTER_BLOCK_SIZE)
+    np.add.at(output, starts[:, np.newaxis] +
+              np.arange(FILTER_BLOCK_SIZE * 2), filtered)
+
+    return output[hop:hop + len(samples)]
+
+
+def render(patch, note=60, velocity=100, duration=2.0, hold=1.0,
+           sample_rate=SAMPLE_RATE, controllers=None, seed=0):
+    """Return an approximate rendering of one note of a patch, as a float
+    array of stereo samples with the shape (samples, 2).
+
+    patch -- an ESQ1Patch or ESQ1PatchView.
+
+    note -- the MIDI note number (60 is middle C).
+
+    velocity -- the note's velocity, from 1 to 127.
+
+    duration -- the length of the rendering, in seconds.
+
+    hold -- the number of seconds before the key is released.
+
+    controllers -- a dictionary of ModulationSource values (WHEEL, PEDAL,
+      XCTRL or PRESS) to their value from 0 to 1. See DEFAULT_CONTROLLERS.
+
+    seed -- a seed for the random parts of the rendering.
+    """
+    rng = np.random.default_rng(seed)
+    misc = patch.miscellaneous
+    bank = PatchBank(bytearray(patch.serialize()))
+    t = np.arange(int(duration * sample_rate)) / float(sample_rate)
+
+    if not len(t):
+        return np.zeros((0, 2))
+
+    evaluator = curve_evaluator(duration, sample_rate)
+
+    def upsample(curves):
+        return [np.interp(t, evaluator.t, curve) for curve in curves]
+
+    # the value of each modulation source at each sample.
+    values = np.zeros((ModulationSource.OFF + 1, len(t)))
+    values[ModulationSource.VEL] = velocity / 127.0
+    values[ModulationSource.VEL_2] = (velocity / 127.0) ** 2
+    values[ModulationSource.KYBD] = note / 127.0
+    values[ModulationSource.KYBD_2] = (note - 64) / 63.0
+
+    for source, value in DEFAULT_CONTROLLERS.items():
+        values[source] = (controllers or {}).get(source, value)
+
+    envelopes = np.concatenate([bank.section('envelopes[%d]' % i)
+                                for i in range(4)])
+    values[ModulationSource.ENV_1:ModulationSource.ENV_4 + 1] = upsample(
+        evaluator.envelopes(envelopes, note, velocity, hold,
+                            misc.cycle.value))
+
+    lfos = np.concatenate([bank.section('lfos[%d]' % i) for i in range(3)])
+    lfo_curves = upsample(evaluator.lfos(lfos, seed))
+
+    # an LFO's depth can only be modulated by sources computed before it.
+    for i, lfo in enumerate(patch.lfos):
+        source = lfo.modulation_source.value
+
+        if source != ModulationSource.OFF:
+            lfo_curves[i] = lfo_curves[i] * values[source]
+
+        values[ModulationSource.LFO_1 + i] = lfo_curves[i]
+
+    mix = np.zeros(len(t))
+    wraps = None
+
+    for i, oscillator in enumerate(patch.oscillators):
+        pitch = (note + oscillator.semitone.value - 36 +
+                 oscillator.fine_tune.value / 32.0 +
+                 12 * _modulation(oscillator.frequency_modulation_sources,
+                                  oscillator.frequency_modulation_amounts,
+                                  values))
+        hertz = 440.0 * 2 ** ((pitch - 69) / 12.0)
+        phase = np.cumsum(np.broadcast_to(hertz / sample_rate, t.shape))
+
+        if not misc.reset_oscillator.value:
+            phase += rng.random()
+
+        if i == 1 and misc.sync.value:
+            # restart the phase each time oscillator 1 starts a new cycle.
+            last = np.maximum.accumulate(np.where(wraps, np.arange(len(t)),
+                                                  0))
+            phase = phase - phase[last] * (last > 0)
+
+        if i == 0:
+            cycles = np.floor(phase)
+            wraps = np.concatenate([[False], cycles[1:] != cycles[:-1]])
+
+        table = wavetable(oscillator.waveform.value)
+        wave = table[(phase * TABLE_SIZE).astype(np.int64) % TABLE_SIZE]
+
+        if i == 0:
+            first = wave
+        elif i == 1 and misc.am.value:
+            wave = wave * first
+
+        if oscillator.dca_enable.value:
+            level = np.clip(oscillator.dca_level.value / 63.0 +
+                            _modulation(oscillator.dca_modulation_sources,
+                                        oscillator.dca_modulation_amounts,
+                                        values), 0, 1)
+            mix += wave * level / 3.0
+
+    cutoff = filter_hertz(
+        misc.frequency.value +
+        misc.filter_keyboard_tracking.value / 63.0 * (note - 60) +
+        63 * _modulation(misc.filter_modulation_sources,
+                         misc.filter_modulation_amount, values))
+    mix = _filter(mix, np.broadcast_to(cutoff, t.shape),
+                  misc.resonance.value / 31.0, sample_rate)
+
+    amplitude = (np.clip(values[ModulationSource.ENV_4], 0, 1) *
+                 misc.dca4_modulation_amount.value / 63.0)
+    pan = np.clip((misc.pan.value - 8) / 7.0 +
+                  _modulation([misc.pan_modulation_source],
+                              [misc.pan_modulation_amount], values), -1, 1)
+    angle = (pan + 1) * np.pi / 4
+
+    return np.column_stack([mix * amplitude * np.cos(angle),
+                            mix * amplitude * np.sin(angle)])
+
+
+def write_wav(filename, samples, sample_rate=SAMPLE_RATE, normalize=False):
+    """Write samples (as returned by render()) to a 16-bit WAV file.
+
+    normalize -- if True, scale the samples so the loudest is at full scale.
+    """
+    samples = np.asarray(samples, dtype=float)
+
+    if samples.ndim == 1:
+        samples = samples[:, np.newaxis]
+
+    if normalize and np.abs(samples).max() > 0:
+        samples = samples / np.abs(samples).max()
+
+    pcm = (np.clip(samples, -1, 1) * 32767).astype('<i2')
+
+    wav = wave.open(filename, 'wb')
+
+    try:
+        wav.setnchannels(samples.shape[1])
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    finally:
+        wav.close()
+
+
+def _render_file(job):
+    record, filename, options = job
+    sample_rate = options.get('sample_rate', SAMPLE_RATE)
+
+    write_wav(filename, render(ESQ1PatchView(record), **options),
+              sample_rate, normalize=True)
+
+    return filename
+
+
+def render_files(patches, directory, processes=None, **options):
+    """Render each of patches (a PatchBank, or a list of ESQ1Patches) to a
+    normalized WAV file in directory, named after its index and name, using
+    a pool of worker processes. Return a list of the filenames.
+
+    processes -- the number of worker processes. Defaults to the number of
+      CPUs.
+
+    options -- passed to render().
+    """
+    if isinstance(patches, PatchBank):
+        records = [record.tobytes() for record in patches.records]
+    else:
+        records = [bytes(patch.serialize()) for patch in patches]
+
+    jobs = []
+
+    for index, record in enumerate(records):
+        name = re.sub(r'[^A-Za-z0-9]+', '_',
+                      ESQ1PatchView(record).name).strip('_')
+        filename = '%04d %s.wav' % (index, name) if name else \
+            '%04d.wav' % index
+        jobs.append((record, os.path.join(directory, filename), options))
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    if processes == 1 or len(jobs) <= 1:
+        return [_render_file(job) for job in jobs]
+
+    with ProcessPoolExecutor(processes) as executor:
+        return list(executor.map(_render_file, jobs,
+                                 chunksize=max(1, len(jobs) //
+                                               (processes * 4))))
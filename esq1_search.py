@@ -0,0 +1,143 @@
+"""Similarity search over ESQ-1 patches.
+
+Patches are projected into feature vectors, with each parameter normalized
+to between 0 and 1 and each waveform and modulation source one-hot encoded,
+so that the distance between two vectors approximates how differently the
+patches are set up. Requires numpy.
+"""
+
+from esq1 import (ModulationSource, PatchBank, PARAMETER_PATHS, np,
+                  parameter_prototype)
+
+
+def _is_categorical(path):
+    """Return True if the values of the parameter at path are unordered
+    choices rather than amounts.
+    """
+    return (path.endswith('waveform') or
+            isinstance(parameter_prototype(path), ModulationSource))
+
+
+def _build_features():
+    """Return a list of (feature name, path, value) tuples. value is None for
+    normalized parameters, or the value a one-hot feature represents.
+    """
+    features = []
+
+    for path in PARAMETER_PATHS:
+        prototype = parameter_prototype(path)
+
+        if _is_categorical(path):
+            for value in range(prototype.minimum, prototype.maximum + 1):
+                features.append(('%s==%d' % (path, value), path, value))
+        else:
+            features.append((path, path, None))
+
+    return features
+
+
+_FEATURES = _build_features()
+
+# the name of each feature, in order.
+FEATURE_NAMES = tuple(name for name, path, value in _FEATURES)
+
+# two different one-hot values differ by 1 in two features, so scale them to
+# contribute the same distance as a parameter going from minimum to maximum.
+ONE_HOT_SCALE = 0.5 ** 0.5
+
+
+def _to_bank(patches):
+    if isinstance(patches, PatchBank):
+        return patches
+    elif hasattr(patches, 'serialize'):
+        patches = [patches]
+
+    return PatchBank.from_patches(patches)
+
+
+def patch_features(patches):
+    """Return a float32 array with a row of features (see FEATURE_NAMES) for
+    each patch.
+
+    patches -- a PatchBank, a list of ESQ1Patches, or one ESQ1Patch.
+    """
+    bank = _to_bank(patches)
+    features = np.zeros((len(bank), len(FEATURE_NAMES)), dtype=np.float32)
+    column = 0
+
+    for path in PARAMETER_PATHS:
+        prototype = parameter_prototype(path)
+        values = bank.column(path)
+
+        if _is_categorical(path):
+            count = prototype.maximum - prototype.minimum + 1
+            rows = np.arange(len(bank))
+
+            features[rows, column + values - prototype.minimum] = \
+                ONE_HOT_SCALE
+            column += count
+        else:
+            features[:, column] = ((values - prototype.minimum) /
+                                   float(prototype.maximum -
+                                         prototype.minimum))
+            column += 1
+
+    return features
+
+
+class SimilarityIndex(object):
+    """Finds the patches of a collection most similar to a given patch.
+
+    Queries compare the patch's features against every patch's features at
+    once (a vectorized brute-force search), which takes milliseconds for
+    100,000 patches.
+
+    patches -- a PatchBank or list of ESQ1Patches to search.
+
+    Attributes:
+
+    features -- the features of each patch (see patch_features()).
+    """
+
+    def __init__(self, patches):
+        self.features = patch_features(patches)
+        self._norms = np.einsum('ij,ij->i', self.features, self.features)
+
+    def __len__(self):
+        return len(self.features)
+
+    def query(self, patch, k=10):
+        """Return a list of up to k (index, distance) tuples for the patches
+        most similar to patch, nearest first.
+        """
+        return self.query_many([patch], k)[0]
+
+    def query_many(self, patches, k=10):
+        """Return a list of query() results for each of patches (a PatchBank
+        or list of ESQ1Patches).
+        """
+        queries = patch_features(patches)
+        k = min(k, len(self))
+
+        if not k:
+            return [[] for query in queries]
+
+        # squared euclidean distance, without building a difference matrix.
+        distances = (self._norms[np.newaxis, :] -
+                     2 * np.dot(queries, self.features.T) +
+                     np.einsum('ij,ij->i', queries, queries)[:, np.newaxis])
+        np.maximum(distances, 0, out=distances)
+
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        results = []
+
+        for query, indexes in zip(queries, nearest):
+            # the expanded form above loses precision for very close
+            # patches, so measure the distance to each candidate directly.
+            exact = np.sqrt(((self.features[indexes] - query) ** 2).sum(1))
+            order = np.argsort(exact, kind='stable')
+
+            results.append([(int(indexes[i]), float(exact[i]))
+                            for i in order])
+
+        return results
@@ -1,7 +1,5 @@
 #!/usr/bin/env python
 
-from copy import deepcopy
-
 from esq1 import (Oscillator, LFO, ModulationSource, simple_patch,
                   esq1_patches_to_sysex, sysex_to_esq1_patches)
 
@@ -28,7 +26,7 @@ patch.oscillators[0].waveform.value = Oscillator.SQUARE
 patch.lfos[1].randomize()
 
 # copy the first oscillator's values into the second oscillator.
-patch.oscillators[1] = deepcopy(patch.oscillators[0])
+patch.oscillators[1] = patch.oscillators[0].clone()
 # set some values on the second oscillator.
 patch.oscillators[1].waveform.value = Oscillator.FORMT_5
 patch.oscillators[1].set_octave(1)
@@ -1,9 +1,38 @@
 #!/usr/bin/env python
 
+from copy import copy as shallow_copy, deepcopy
+import json
+import os
+import pickle
+import random
+import shutil
+import tempfile
 import unittest
+import wave
 
-from esq1 import (Parameter, Envelope, LFO, Oscillator, Miscellaneous,
-                  ESQ1Patch)
+from esq1 import (Parameter, ModulationSource, ModulationAmount, Envelope,
+                  LFO, Oscillator, Miscellaneous, Boolean, ESQ1Patch,
+                  PatchBank, PCB_LENGTH, np,
+                  resolve_path, sysex_to_esq1_patches, esq1_patches_to_sysex,
+                  iter_sysex_dumps, ESQ1PatchView, PARAMETER_PATHS,
+                  pack_nibbles, unpack_nibbles, parse_path, diff,
+                  diff_banks, Difference,
+                  iter_random_patches, RANDOM_BLOCK_SIZE, InvalidField,
+                  iter_embedded_dumps,
+                  EmbeddedDump, load_sysex, LazyPatchList, section_columns,
+                  SharedPatchBank, validate_pcb, pcb_to_sysex,
+                  ALL_PROGRAM_DUMP, SINGLE_PROGRAM_DUMP, dump_length)
+from esq1_convert import (convert_sysex_file, convert_sysex_files,
+                          find_sysex_files)
+from esq1_export import (RECORD_DTYPE, iter_json_banks, iter_json_lines,
+                         iter_npy_records, read_json_lines, read_npy,
+                         write_json_lines, write_npy)
+from esq1_evolve import Evolution, SECTION_SPANS, crossover, mutate
+from esq1_generate import PatchGenerator, in_range, is_audible
+from esq1_library import LibraryEntry, PatchIndex, PatchLibrary
+from esq1_render import (CurveEvaluator, envelope_seconds, render,
+                         render_files, write_wav)
+from esq1_search import FEATURE_NAMES, SimilarityIndex, patch_features
 
 
 class TestParameter(unittest.TestCase):
@@ -40,6 +69,33 @@ class TestParameter(unittest.TestCase):
         with self.assertRaises(ValueError):
             Parameter(4, 3)
 
+    def test_set_range(self):
+        parameter = Parameter(0, 10)
+        other = Parameter(0, 10)
+        parameter.maximum = 20
+        parameter.default = 15
+        parameter.minimum = 5
+
+        self.assertEqual((parameter.minimum, parameter.maximum,
+                          parameter.default), (5, 20, 15))
+        self.assertEqual((other.minimum, other.maximum, other.default),
+                         (0, 10, 0))
+
+        parameter.value = 20
+
+        with self.assertRaises(ValueError):
+            parameter.value = 4
+
+    def test_compact(self):
+        # parameters have no instance dictionary, and share their specs.
+        for parameter in [Parameter(0, 63), ModulationSource(), Boolean(),
+                          ESQ1PatchView(bytearray(PCB_LENGTH)).lfos[0].reset]:
+            self.assertFalse(hasattr(parameter, '__dict__'))
+
+        self.assertIs(Parameter(0, 63).spec, Parameter(0, 63).spec)
+        self.assertIs(ESQ1Patch().envelopes[0].times[0].spec,
+                      ESQ1Patch().lfos[2].delay.spec)
+
 
 class TestParity(object):
     cls = None
@@ -80,5 +136,1759 @@ class TestESQ1PatchParity(TestParity, unittest.TestCase):
     cls = ESQ1Patch
 
 
+def temporary_filename(test_case, name):
+    """Return a filename in a directory removed when test_case finishes."""
+    directory = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, directory)
+
+    return os.path.join(directory, name)
+
+
+def sysex_bytes(patches):
+    """Return the SYSEX file written by esq1_patches_to_sysex()."""
+    with tempfile.NamedTemporaryFile(suffix='.syx') as sysex_file:
+        esq1_patches_to_sysex(patches, sysex_file.name)
+
+        return sysex_file.read()
+
+
+def smf_event(delta, data):
+    """Return a Standard MIDI File event with a one byte delta time."""
+    return bytes([delta]) + data
+
+
+def smf_sysex_event(status, data):
+    """Return an SMF SYSEX event (status 0xF0 or 0xF7) of data, with a delta
+    time of zero.
+    """
+    length = bytearray([len(data) & 0x7F])
+
+    for shift in (7, 14):
+        if len(data) >> shift:
+            length.insert(0, 0x80 | ((len(data) >> shift) & 0x7F))
+
+    return smf_event(0, bytes([status]) + bytes(length) + data)
+
+
+def smf(events):
+    """Return a Standard MIDI File with one track of events."""
+    track = b''.join(events) + smf_event(0, b'\xFF\x2F\x00')
+
+    return (b'MThd\x00\x00\x00\x06\x00\x00\x00\x01\x00\x60' +
+            b'MTrk' + len(track).to_bytes(4, 'big') + track)
+
+
+def filter_frequency(patch):
+    return patch.miscellaneous.frequency.value
+
+
+def audible_patch(waveform=Oscillator.SINE):
+    """Return a patch playing one oscillator at full level."""
+    patch = ESQ1Patch()
+    patch.oscillators[0].waveform.value = waveform
+    patch.oscillators[0].dca_enable.value = True
+    patch.oscillators[0].dca_level.value = 63
+    patch.miscellaneous.dca4_modulation_amount.value = 63
+    patch.miscellaneous.frequency.value = 127
+
+    for level in patch.envelopes[3].levels:
+        level.value = 63
+
+    return patch
+
+
+def set_filter_frequency(bank, index):
+    """Set a patch's filter frequency to its index, and return its name."""
+    view = bank.view(index)
+    view.miscellaneous.frequency.value = index
+
+    return view.name
+
+
+def random_patches(count):
+    patches = []
+
+    for i in range(count):
+        patch = ESQ1Patch()
+        patch.randomize()
+        patch.name = 'P%d' % i
+        patches.append(patch)
+
+    return patches
+
+
+class TestSeededRandomize(unittest.TestCase):
+    def test_seed(self):
+        a = ESQ1Patch()
+        b = ESQ1Patch()
+        a.randomize(42)
+        b.randomize(random.Random(42))
+
+        self.assertEqual(a.serialize(), b.serialize())
+
+        b.randomize(43)
+
+        self.assertNotEqual(a.serialize(), b.serialize())
+
+    def test_parameter_and_section(self):
+        a = Parameter(0, 1000)
+        b = Parameter(0, 1000)
+        a.randomize(1)
+        b.randomize(1)
+
+        self.assertEqual(a.value, b.value)
+
+        a = LFO()
+        b = LFO()
+        a.randomize(8)
+        b.randomize(8)
+
+        self.assertEqual(a, b)
+
+    def test_iter_random_patches(self):
+        run = list(iter_random_patches(6, seed=3))
+        part = list(iter_random_patches(2, seed=3, start=4))
+
+        self.assertEqual([patch.serialize() for patch in run[4:]],
+                         [patch.serialize() for patch in part])
+        self.assertNotEqual(run[0].serialize(), run[1].serialize())
+
+
+class TestSerializeCache(unittest.TestCase):
+    def setUp(self):
+        self.patch = random_patches(1)[0]
+        self.patch.name = 'CACHED'
+        self.serialized = self.patch.serialize()
+
+    def assertSerialized(self):
+        new = ESQ1Patch()
+        new.deserialize(iter(self.patch.serialize()))
+
+        self.assertEqual(new, self.patch)
+
+    def test_value_change(self):
+        self.patch.lfos[2].frequency.value = \
+            (self.patch.lfos[2].frequency.value + 1) % 64
+        self.patch.oscillators[0].dca_modulation_amounts[1].value = -63
+
+        self.assertNotEqual(self.patch.serialize(), self.serialized)
+        self.assertSerialized()
+
+    def test_deserialize(self):
+        other = random_patches(1)[0]
+        self.patch.deserialize(iter(other.serialize()))
+
+        self.assertEqual(self.patch.serialize(), other.serialize())
+
+    def test_replace_attribute(self):
+        self.patch.miscellaneous.resonance = Parameter(0, 31, 31)
+        self.patch.miscellaneous.resonance.value = 17
+
+        self.assertSerialized()
+
+        self.patch.envelopes[1].times = [Parameter(0, 63) for i in range(4)]
+        self.patch.envelopes[1].times[2].value = 5
+
+        self.assertSerialized()
+
+    def test_failed_deserialize(self):
+        misc = Miscellaneous()
+        pcb = misc.serialize()
+        pcb[1] = 100
+        pcb[2] = 0xFF
+
+        with self.assertRaises(ValueError):
+            misc.deserialize(iter(pcb))
+
+        self.assertEqual(misc.frequency.value, 100)
+        self.assertEqual(misc.serialize()[1], 100)
+
+    def test_replace_item(self):
+        self.patch.envelopes[0].levels[0] = ModulationAmount()
+        self.patch.envelopes[0].levels[0].value = 20
+
+        self.assertSerialized()
+
+        self.patch.envelopes[0].levels[1:] = [ModulationAmount(),
+                                              ModulationAmount()]
+        self.patch.envelopes[0].levels[2].value = -20
+
+        self.assertSerialized()
+
+        self.patch.envelopes[0].times.reverse()
+
+        self.assertSerialized()
+
+    def test_shared_parameter(self):
+        lfos = self.patch.lfos
+        lfos[1].frequency = lfos[0].frequency
+        self.patch.serialize()
+        lfos[0].frequency.value = (lfos[0].frequency.value + 1) % 64
+
+        self.assertSerialized()
+
+        other = random_patches(1)[0]
+        lfos[0].deserialize(iter(other.lfos[0].serialize()))
+
+        self.assertEqual(lfos[1].frequency.value,
+                         other.lfos[0].frequency.value)
+        self.assertSerialized()
+
+    def test_copy(self):
+        envelope = self.patch.envelopes[0]
+        envelope.serialize()
+        copy = shallow_copy(envelope)
+        envelope.times[0].value = (envelope.times[0].value + 1) % 64
+
+        self.assertEqual(copy.serialize(), envelope.serialize())
+
+        copy.levels[0].value = -envelope.levels[0].value or 1
+
+        self.assertEqual(envelope.serialize(), copy.serialize())
+        self.assertSerialized()
+
+    def test_pickle(self):
+        self.patch = pickle.loads(pickle.dumps(self.patch))
+        self.patch.serialize()
+        self.patch.envelopes[3].levels[2] = ModulationAmount()
+        self.patch.envelopes[3].levels[2].value = 33
+
+        self.assertSerialized()
+
+    def test_result_is_a_copy(self):
+        self.patch.serialize()[10] = 0xFF
+
+        self.assertEqual(self.patch.serialize(), self.serialized)
+
+    def test_deepcopy(self):
+        copy = deepcopy(self.patch)
+        copy.envelopes[0].times[0].value = \
+            (self.patch.envelopes[0].times[0].value + 1) % 64
+
+        self.assertEqual(self.patch.serialize(), self.serialized)
+        self.assertNotEqual(copy.serialize(), self.serialized)
+
+        parameter = deepcopy(self.patch.envelopes[0].times[0])
+
+        self.assertIsNone(parameter.owner)
+
+
+class TestClone(unittest.TestCase):
+    def setUp(self):
+        self.patch = random_patches(1)[0]
+
+    def test_clone(self):
+        clone = self.patch.clone()
+
+        self.assertEqual(clone, self.patch)
+        self.assertEqual(clone.serialize(), self.patch.serialize())
+        self.assertIsNot(clone.envelopes[0], self.patch.envelopes[0])
+        self.assertIsNot(clone.envelopes[0].levels[0],
+                         self.patch.envelopes[0].levels[0])
+
+    def test_clone_is_independent(self):
+        self.patch.serialize()
+        clone = self.patch.clone()
+        clone.oscillators[2].semitone.value = \
+            (self.patch.oscillators[2].semitone.value + 1) % 97
+
+        self.assertNotEqual(clone.serialize(), self.patch.serialize())
+        self.assertIs(clone.oscillators[2].semitone.owner,
+                      clone.oscillators[2])
+
+    def test_clone_section(self):
+        lfo = self.patch.lfos[1].clone()
+
+        self.assertEqual(lfo, self.patch.lfos[1])
+        self.assertIs(lfo.levels[1].owner, lfo)
+
+    def test_clone_many(self):
+        clones = self.patch.clone_many(3)
+
+        self.assertEqual(len(clones), 3)
+        self.assertEqual(len(set(id(clone) for clone in clones)), 3)
+        self.assertTrue(all(clone == self.patch for clone in clones))
+
+
+class TestDiff(unittest.TestCase):
+    def setUp(self):
+        self.a = random_patches(1)[0]
+        self.b = deepcopy(self.a)
+
+    def test_equal(self):
+        self.assertEqual(diff(self.a, self.b), [])
+        self.assertEqual(hash(self.a), hash(self.b))
+        self.assertEqual(len(set([self.a, self.b])), 1)
+        self.assertEqual(self.a.fingerprint(), self.b.fingerprint())
+
+    def test_differences(self):
+        self.b.name = 'OTHER'
+        self.b.oscillators[1].waveform.value = \
+            (self.a.oscillators[1].waveform.value + 1) % 33
+        self.b.lfos[2].modulation_source.value = \
+            (self.a.lfos[2].modulation_source.value + 4) % 16
+
+        self.assertEqual(diff(self.a, self.b), [
+            Difference('name', self.a.clean_name().decode(), 'OTHER '),
+            Difference('lfos[2].modulation_source',
+                       self.a.lfos[2].modulation_source.value,
+                       self.b.lfos[2].modulation_source.value),
+            Difference('oscillators[1].waveform',
+                       self.a.oscillators[1].waveform.value,
+                       self.b.oscillators[1].waveform.value),
+        ])
+        self.assertNotEqual(self.a.fingerprint(), self.b.fingerprint())
+
+    def test_fingerprint_without_name(self):
+        self.b.name = 'OTHER'
+
+        self.assertNotEqual(self.a.fingerprint(), self.b.fingerprint())
+        self.assertEqual(self.a.fingerprint(include_name=False),
+                         self.b.fingerprint(include_name=False))
+
+    def test_sections(self):
+        level = self.a.envelopes[3].levels[1].value
+        self.b.envelopes[3].levels[1].value = 1 if level == 0 else -level
+
+        self.assertEqual([d.path for d in diff(self.a.envelopes[3],
+                                               self.b.envelopes[3])],
+                         ['levels[1]'])
+
+        with self.assertRaises(TypeError):
+            diff(self.a.envelopes[0], self.a.oscillators[0])
+
+    def test_diff_banks(self):
+        a = random_patches(40)
+        b = deepcopy(a)
+        b[12].miscellaneous.cycle.value = not a[12].miscellaneous.cycle.value
+
+        differences = diff_banks(a, b)
+
+        self.assertEqual([index for index, changes in differences], [12])
+        self.assertEqual(differences[0][1][0].path, 'miscellaneous.cycle')
+
+        if np is not None:
+            self.assertEqual(diff_banks(PatchBank.from_patches(a),
+                                        PatchBank.from_patches(b)),
+                             differences)
+
+
+class TestESQ1PatchView(unittest.TestCase):
+    def setUp(self):
+        self.patch = random_patches(1)[0]
+        self.buffer = bytearray(self.patch.serialize())
+        self.view = ESQ1PatchView(self.buffer)
+
+    def test_values(self):
+        for path in PARAMETER_PATHS:
+            self.assertEqual(resolve_path(self.view, path).value,
+                             resolve_path(self.patch, path).value)
+
+        self.assertEqual(self.view.name, self.patch.clean_name().decode())
+
+    def test_set_value(self):
+        self.view.lfos[1].modulation_source.value = ModulationSource.KYBD
+        self.view.oscillators[-1].dca_modulation_amounts[0].value = -7
+        self.patch.lfos[1].modulation_source.value = ModulationSource.KYBD
+        self.patch.oscillators[-1].dca_modulation_amounts[0].value = -7
+
+        self.assertEqual(self.buffer, self.patch.serialize())
+
+        with self.assertRaises(ValueError):
+            self.view.miscellaneous.resonance.value = 32
+
+    def test_set_name(self):
+        self.view.name = 'viewed'
+
+        self.assertEqual(self.view.to_patch().name, 'VIEWED')
+
+    def test_lists(self):
+        self.assertEqual(len(self.view.envelopes), 4)
+        self.assertEqual(len(list(self.view.envelopes[0].times)), 4)
+
+        with self.assertRaises(IndexError):
+            self.view.lfos[3]
+
+        with self.assertRaises(AttributeError):
+            self.view.miscellaneous.missing
+
+    def test_randomize(self):
+        self.view.randomize(5)
+        self.patch.randomize(5)
+
+        self.assertEqual(self.buffer, self.patch.serialize())
+
+        self.view.lfos[2].randomize(6)
+        self.patch.lfos[2].randomize(6)
+        self.view.envelopes[1].levels.randomize(7)
+        rng = random.Random(7)
+
+        for level in self.patch.envelopes[1].levels:
+            level.randomize(rng)
+
+        self.assertEqual(self.buffer, self.patch.serialize())
+        self.assertEqual(self.view.lfos[2], self.patch.lfos[2])
+        self.assertEqual(self.view.lfos[2].reset.value,
+                         self.patch.lfos[2].reset.value)
+
+    def test_equal(self):
+        other = ESQ1PatchView(bytearray(self.buffer))
+
+        self.assertEqual(self.view, self.patch)
+        self.assertEqual(self.view, other)
+        self.assertEqual(self.view.oscillators, self.patch.oscillators)
+
+        other.envelopes[2].times[1].value = \
+            (self.view.envelopes[2].times[1].value + 1) % 64
+
+        self.assertNotEqual(self.view, other)
+        self.assertNotEqual(self.view.envelopes[2], other.envelopes[2])
+        self.assertEqual(self.view.envelopes[1], other.envelopes[1])
+        self.assertNotEqual(self.view.envelopes[0], self.view.lfos[0])
+
+        other.envelopes[2].times[1].value = \
+            self.view.envelopes[2].times[1].value
+        other.name = 'other'
+
+        self.assertNotEqual(self.view, other)
+
+    def test_parameter_value(self):
+        parameter = self.view.miscellaneous.resonance
+        parameter._value = 3
+
+        self.assertEqual(self.patch.miscellaneous.resonance._value,
+                         self.patch.miscellaneous.resonance.value)
+        self.assertEqual(parameter._value, 3)
+        self.assertEqual(self.view.to_patch().miscellaneous.resonance.value,
+                         3)
+
+
+class TestLoadSysex(unittest.TestCase):
+    def setUp(self):
+        self.patches = random_patches(40)
+        self.filename = temporary_filename(self, 'bank.syx')
+        esq1_patches_to_sysex(self.patches, self.filename)
+
+    def test_names(self):
+        patches = load_sysex(self.filename)
+
+        self.assertIsInstance(patches, LazyPatchList)
+        self.assertEqual(len(patches), 40)
+        self.assertEqual(patches.names,
+                         [patch.name.ljust(6) for patch in self.patches])
+        self.assertEqual(patches.name(-1), 'P39   ')
+
+    def test_patches(self):
+        patches = load_sysex(self.filename)
+
+        self.assertEqual([patch.serialize() for patch in patches],
+                         [patch.serialize() for patch in self.patches])
+        self.assertEqual(patches.record(3),
+                         bytes(self.patches[3].serialize()))
+
+    def test_cache(self):
+        patches = load_sysex(self.filename)
+
+        self.assertIs(patches[5], patches[5])
+        self.assertIs(patches[5], patches[4:8][1])
+
+    def test_slice(self):
+        patches = load_sysex(self.filename)[30:2:-10]
+
+        self.assertEqual(patches.names, ['P30   ', 'P20   ', 'P10   '])
+        self.assertEqual(patches[1].serialize(),
+                         self.patches[20].serialize())
+
+        with self.assertRaises(IndexError):
+            patches[3]
+
+    def test_single(self):
+        esq1_patches_to_sysex(self.patches[:1], self.filename)
+
+        self.assertEqual(load_sysex(self.filename).names, ['P0    '])
+
+    def test_repair(self):
+        pcb = bytearray(b''.join(patch.serialize() for patch in self.patches))
+        pcb[PCB_LENGTH * 3 + 90] = 0xFF
+
+        with open(self.filename, 'wb') as sysex_file:
+            sysex_file.write(pcb_to_sysex(pcb, ALL_PROGRAM_DUMP))
+
+        with self.assertRaises(ValueError):
+            sysex_to_esq1_patches(self.filename)
+
+        patches = load_sysex(self.filename)
+
+        self.assertEqual(patches.validate(), [
+            InvalidField(3, 'miscellaneous.resonance', 0xFF)])
+        self.assertEqual(len(patches.names), 40)
+
+        with self.assertRaises(ValueError):
+            patches[3]
+
+        repaired = load_sysex(self.filename, repair=True)[2:5]
+        patch = sysex_to_esq1_patches(self.filename, repair=True)[3]
+
+        self.assertEqual(repaired[1].miscellaneous.resonance.value, 31)
+        self.assertEqual(patch.serialize(), repaired[1].serialize())
+        self.assertEqual(repaired.record(1)[90], 0xFF)
+
+    def test_invalid(self):
+        with open(self.filename, 'rb') as sysex_file:
+            sysex = sysex_file.read()
+
+        for data in [b'\x00' + sysex[1:], sysex[:-1],
+                     sysex[:-1] + b'\x00', sysex[:4], b'']:
+            with open(self.filename, 'wb') as sysex_file:
+                sysex_file.write(data)
+
+            with self.assertRaises(ValueError):
+                load_sysex(self.filename)
+
+            with self.assertRaises(ValueError):
+                sysex_to_esq1_patches(self.filename)
+
+
+class TestNibbles(unittest.TestCase):
+    def test_pack(self):
+        self.assertEqual(pack_nibbles(bytearray([0x00, 0x5A, 0xFF])),
+                         bytearray([0x0, 0x0, 0xA, 0x5, 0xF, 0xF]))
+
+    def test_unpack(self):
+        pcb = bytearray(range(256))
+
+        self.assertEqual(unpack_nibbles(pack_nibbles(pcb)), pcb)
+        self.assertEqual(unpack_nibbles(b''), bytearray())
+
+    def test_unpack_invalid(self):
+        with self.assertRaises(ValueError):
+            unpack_nibbles(b'\x01\x10')
+
+        with self.assertRaises(ValueError):
+            unpack_nibbles(b'\x01')
+
+    def test_sysex_parity(self):
+        patches = random_patches(40)
+        filename = temporary_filename(self, 'bank.syx')
+        esq1_patches_to_sysex(patches, filename)
+
+        self.assertEqual([patch.serialize() for patch in patches],
+                         [patch.serialize()
+                          for patch in sysex_to_esq1_patches(filename)])
+
+
+class TestIterSysexDumps(unittest.TestCase):
+    def setUp(self):
+        self.single = random_patches(1)
+        self.bank = random_patches(40)
+        self.archive = (b'garbage\xF0\x0F\x02' + sysex_bytes(self.single) +
+                        b'\x00\xF7' + sysex_bytes(self.bank))
+
+    def assertDumps(self, dumps):
+        self.assertEqual(
+            [[patch.serialize() for patch in dump] for dump in dumps],
+            [[patch.serialize() for patch in dump]
+             for dump in [self.single, self.bank]])
+
+    def test_bytes(self):
+        self.assertDumps(iter_sysex_dumps(self.archive, chunk_size=7))
+
+    def test_file(self):
+        filename = temporary_filename(self, 'archive.syx')
+
+        with open(filename, 'wb') as archive_file:
+            archive_file.write(self.archive)
+
+        self.assertDumps(iter_sysex_dumps(filename, chunk_size=100))
+
+        with open(filename, 'rb') as archive_file:
+            self.assertDumps(iter_sysex_dumps(archive_file))
+
+    def test_details(self):
+        archive = self.archive + pcb_to_sysex(
+            self.single[0].serialize(), SINGLE_PROGRAM_DUMP, channel=9)
+        dumps = list(iter_sysex_dumps(archive, raw=True, chunk_size=50,
+                                      details=True))
+
+        self.assertEqual([(dump.channel, dump.dump_type, len(dump.patches))
+                          for dump in dumps],
+                         [(0, SINGLE_PROGRAM_DUMP, 1),
+                          (0, ALL_PROGRAM_DUMP, 40),
+                          (9, SINGLE_PROGRAM_DUMP, 1)])
+
+        for dump in dumps:
+            self.assertEqual(archive[dump.offset:dump.offset + 3],
+                             b'\xF0\x0F\x02')
+
+        self.assertEqual(dumps[2].offset,
+                         len(archive) - dump_length(SINGLE_PROGRAM_DUMP))
+
+    def test_raw(self):
+        dumps = list(iter_sysex_dumps(self.archive, raw=True))
+
+        self.assertEqual([len(dump) for dump in dumps], [1, 40])
+        self.assertEqual(dumps[0][0], bytes(self.single[0].serialize()))
+
+    def test_truncated(self):
+        dumps = list(iter_sysex_dumps(self.archive[:-1]))
+
+        self.assertEqual(len(dumps), 1)
+
+        # a truncated bank, followed by a single dump at the end.
+        archive = sysex_bytes(self.bank)[:200] + sysex_bytes(self.single)
+        dumps = list(iter_sysex_dumps(archive, chunk_size=64))
+
+        self.assertEqual([[patch.serialize() for patch in dump]
+                          for dump in dumps],
+                         [[self.single[0].serialize()]])
+
+    def test_out_of_range(self):
+        pcb = bytearray(b''.join(patch.serialize() for patch in self.bank))
+        pcb[PCB_LENGTH * 5 + 90] = 0xFF
+        archive = pcb_to_sysex(pcb, ALL_PROGRAM_DUMP) + self.archive
+
+        dumps = list(iter_sysex_dumps(archive))
+
+        self.assertEqual(len(dumps), 3)
+        self.assertIsNone(dumps[0][5])
+        self.assertEqual(dumps[0][6].serialize(), self.bank[6].serialize())
+
+        patch = next(iter_sysex_dumps(archive, repair=True))[5]
+
+        self.assertEqual(patch.miscellaneous.resonance.value, 31)
+
+
+class TestIterEmbeddedDumps(unittest.TestCase):
+    def setUp(self):
+        self.single = random_patches(1)
+        self.bank = random_patches(40)
+        self.single_sysex = sysex_bytes(self.single)
+        self.bank_sysex = sysex_bytes(self.bank)
+
+    def assertDumps(self, dumps, offsets):
+        dumps = list(dumps)
+
+        self.assertEqual([dump.offset for dump in dumps], offsets)
+        self.assertEqual(
+            [[patch.serialize() for patch in dump.patches]
+             for dump in dumps],
+            [[patch.serialize() for patch in dump]
+             for dump in [self.single, self.bank]])
+
+    def test_binary(self):
+        data = (b'\x00' * 10 + self.single_sysex + b'\xF0\x0F\x02\x00' +
+                self.bank_sysex + b'\xF7\xF0')
+
+        self.assertDumps(iter_embedded_dumps(data),
+                         [10, 10 + len(self.single_sysex) + 4])
+
+    def test_file(self):
+        filename = temporary_filename(self, 'capture.bin')
+
+        with open(filename, 'wb') as capture_file:
+            capture_file.write(b'abc' + self.single_sysex + self.bank_sysex)
+
+        self.assertDumps(iter_embedded_dumps(filename),
+                         [3, 3 + len(self.single_sysex)])
+
+        with open(filename, 'wb'):
+            pass
+
+        self.assertEqual(list(iter_embedded_dumps(filename)), [])
+
+    def test_smf(self):
+        body = self.bank_sysex[1:]
+        data = smf([
+            smf_event(0, b'\x90\x40\x40'),
+            smf_event(0x60, b'\x40\x00'),
+            smf_sysex_event(0xF0, self.single_sysex[1:]),
+            smf_event(0, b'\xFF\x01\x04text'),
+            # a dump split across three events.
+            smf_sysex_event(0xF0, body[:1000]),
+            smf_sysex_event(0xF7, body[1000:5000]),
+            smf_sysex_event(0xF7, body[5000:]),
+            smf_event(0, b'\xC0\x05'),
+        ])
+
+        # the header chunk, the track header, and the first two events.
+        offset = 14 + 8 + 4 + 3
+
+        # offsets are of each dump's first SYSEX event, after its delta time.
+        self.assertDumps(iter_embedded_dumps(data),
+                         [offset + 1,
+                          offset + 1 + 2 + len(self.single_sysex) + 8 + 1])
+
+    def test_smf_events_in_binary(self):
+        data = b'\x01' + smf([
+            smf_sysex_event(0xF0, self.single_sysex[1:]),
+            smf_sysex_event(0xF0, self.bank_sysex[1:]),
+        ])
+
+        self.assertDumps(iter_embedded_dumps(data),
+                         [1 + 22 + 1,
+                          1 + 22 + 1 + 2 + len(self.single_sysex) + 1])
+
+    def test_out_of_range(self):
+        pcb = bytearray(self.single[0].serialize())
+        pcb[90] = 0xFF
+        data = pcb_to_sysex(pcb, SINGLE_PROGRAM_DUMP) + self.bank_sysex
+
+        dumps = list(iter_embedded_dumps(data))
+
+        self.assertEqual(dumps[0].patches, [None])
+        self.assertEqual(len(dumps[1].patches), 40)
+
+        dump = next(iter_embedded_dumps(data, repair=True))
+
+        self.assertEqual(dump.patches[0].miscellaneous.resonance.value, 31)
+
+    def test_raw(self):
+        dump, = iter_embedded_dumps(self.single_sysex, raw=True)
+
+        self.assertEqual(dump, EmbeddedDump(0, 0, 1, [
+            bytes(self.single[0].serialize())]))
+
+
+class TestConvertSysexFiles(unittest.TestCase):
+    def setUp(self):
+        self.directory = os.path.dirname(temporary_filename(self, ''))
+        self.output_directory = os.path.join(self.directory, 'output')
+        self.patches = random_patches(40)
+
+        esq1_patches_to_sysex(self.patches[:1], os.path.join(self.directory,
+                                                             'a.syx'))
+        os.mkdir(os.path.join(self.directory, 'b'))
+        esq1_patches_to_sysex(self.patches, os.path.join(self.directory, 'b',
+                                                         'c.syx'))
+
+        with open(os.path.join(self.directory, 'd.syx'), 'wb') as invalid:
+            invalid.write(b'\xF0\x43\xF7')
+
+    def convert(self, processes):
+        sources = find_sysex_files(self.directory)
+        results = convert_sysex_files(sources, self.output_directory,
+                                      self.directory, processes, 1)
+
+        self.assertEqual([result.source for result in results], sources)
+        self.assertEqual([result.patch_count for result in results],
+                         [1, 40, 0])
+        self.assertIsNone(results[0].error)
+        self.assertIsNotNone(results[2].error)
+
+        converted = sysex_to_esq1_patches(results[1].destination)
+
+        self.assertEqual(results[1].destination,
+                         os.path.join(self.output_directory, 'b', 'c.syx'))
+        self.assertEqual([patch.serialize() for patch in converted],
+                         [patch.serialize() for patch in self.patches])
+
+    def test_convert(self):
+        self.convert(1)
+
+    def test_convert_in_parallel(self):
+        self.convert(2)
+
+    def test_same_base_name(self):
+        os.mkdir(os.path.join(self.directory, 'e'))
+        esq1_patches_to_sysex(self.patches[1:2],
+                              os.path.join(self.directory, 'e', 'c.syx'))
+
+        sources = find_sysex_files(self.directory)
+        results = convert_sysex_files(sources, self.output_directory,
+                                      processes=1)
+
+        self.assertEqual([result.source for result in results], sources)
+        self.assertEqual([result.patch_count for result in results],
+                         [1, 40, 0, 0])
+        self.assertIn('overwrite', results[3].error)
+        self.assertEqual(len(sysex_to_esq1_patches(os.path.join(
+            self.output_directory, 'c.syx'))), 40)
+
+    def test_channel(self):
+        source = os.path.join(self.directory, 'a.syx')
+        destination = os.path.join(self.output_directory, 'a.syx')
+        esq1_patches_to_sysex(self.patches[:1], source, channel=5)
+
+        self.assertIsNone(convert_sysex_file(source, destination).error)
+
+        with open(destination, 'rb') as sysex_file:
+            self.assertEqual(sysex_file.read(5), b'\xF0\x0F\x02\x05' +
+                             bytes([SINGLE_PROGRAM_DUMP]))
+
+    def test_unexpected_error(self):
+        result = convert_sysex_file(12345.5)
+
+        self.assertEqual(result.patch_count, 0)
+        self.assertIn('TypeError', result.error)
+
+    def test_out_of_range(self):
+        pcb = bytearray(self.patches[0].serialize())
+        pcb[90] = 0xFF
+        filename = os.path.join(self.directory, 'a.syx')
+
+        with open(filename, 'wb') as sysex_file:
+            sysex_file.write(pcb_to_sysex(pcb, SINGLE_PROGRAM_DUMP))
+
+        result = convert_sysex_file(filename)
+
+        self.assertEqual(result.patch_count, 0)
+        self.assertIn('out-of-range', result.error)
+
+
+class TestPatchIndex(unittest.TestCase):
+    def setUp(self):
+        self.patches = random_patches(40)
+        self.filename = temporary_filename(self, 'bank.syx')
+        esq1_patches_to_sysex(self.patches, self.filename)
+
+    def test_add_sysex(self):
+        index = PatchIndex()
+
+        self.assertEqual(index.add_sysex(self.filename), 40)
+        # unchanged files are not read again.
+        self.assertEqual(index.add_sysex(self.filename), 0)
+        self.assertEqual(len(index), 40)
+        self.assertIn(self.patches[3], index)
+        self.assertNotIn(ESQ1Patch(), index)
+
+        location = index.locations(self.patches[3])
+        self.assertEqual(location, [(os.path.abspath(self.filename), 0, 3,
+                                     'P3    ')])
+
+    def test_duplicates(self):
+        index = PatchIndex()
+        renamed = random_patches(1)[0]
+        renamed.name = 'COPY'
+        renamed.envelopes = self.patches[0].envelopes
+        renamed.lfos = self.patches[0].lfos
+        renamed.oscillators = self.patches[0].oscillators
+        renamed.miscellaneous = self.patches[0].miscellaneous
+
+        index.add_sysex(self.filename)
+
+        self.assertEqual(index.add_records([renamed.serialize()], 'copy'), 0)
+        self.assertEqual([len(locations)
+                          for locations in index.duplicates()], [2])
+
+        index = PatchIndex(include_name=True)
+        index.add_sysex(self.filename)
+
+        self.assertNotIn(renamed, index)
+
+    def test_persistence(self):
+        filename = temporary_filename(self, 'index.sqlite')
+
+        with PatchIndex(filename) as index:
+            index.add_sysex(self.filename)
+
+        with PatchIndex(filename) as index:
+            self.assertFalse(index.include_name)
+            self.assertIn(self.patches[39], index)
+
+        with self.assertRaises(ValueError):
+            PatchIndex(filename, include_name=True)
+
+    def test_changed_file(self):
+        index = PatchIndex()
+        index.add_sysex(self.filename)
+
+        self.assertEqual(index.add_records([self.patches[1].serialize()] * 2,
+                                           'copy'), 0)
+
+        # rewrite the file without patch 0, and with two copies of a new
+        # patch.
+        patches = random_patches(2)
+        patches[0].name = patches[1].name = 'NEW'
+        patches[1].envelopes = patches[0].envelopes
+        patches[1].lfos = patches[0].lfos
+        patches[1].oscillators = patches[0].oscillators
+        patches[1].miscellaneous = patches[0].miscellaneous
+        esq1_patches_to_sysex(patches + self.patches[1:38], self.filename)
+        os.utime(self.filename, (0, 0))
+
+        # the file's old patches are removed first, so only patch 1 (also
+        # added as 'copy') has been seen: 36 old, 1 new and 1 blank patch.
+        self.assertEqual(index.add_sysex(self.filename), 38)
+        self.assertEqual(len(index), 39)
+        self.assertNotIn(self.patches[0], index)
+        self.assertIn(self.patches[1], index)
+
+
+@unittest.skipUnless(np, 'numpy is not installed')
+class TestPatchLibrary(unittest.TestCase):
+    def setUp(self):
+        self.bank = PatchBank.random(200, rng=8)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        for i in range(5):
+            self.bank[i * 40:(i + 1) * 40].to_sysex(
+                os.path.join(self.directory, 'bank%d.syx' % i))
+
+    def test_find(self):
+        library = PatchLibrary()
+        library.add_records(self.bank, 'bank')
+
+        bell = np.zeros(len(self.bank), dtype=bool)
+
+        for i in range(3):
+            bell |= (self.bank.column('oscillators[%d].waveform' % i) ==
+                     Oscillator.BELL)
+
+        expected = np.flatnonzero(
+            bell & (self.bank.column('miscellaneous.resonance') > 20))
+        entries = library.find([
+            ('oscillators[*].waveform', '==', Oscillator.BELL),
+            ('miscellaneous.resonance', '>', 20)])
+
+        self.assertEqual([entry.position for entry in entries],
+                         expected.tolist())
+        self.assertEqual(library.count([('envelopes[2].levels[1]', '<', 0)]),
+                         (self.bank.column('envelopes[2].levels[1]') < 0)
+                         .sum())
+        self.assertEqual(library.count(), 200)
+
+        entry = entries[0]
+        self.assertIsInstance(entry, LibraryEntry)
+        self.assertEqual(library.record(entry),
+                         self.bank.records[entry.position].tobytes())
+        self.assertEqual(library.patch(entry.id).serialize(),
+                         bytearray(self.bank.records[entry.position]))
+
+    def test_uses_indexes(self):
+        library = PatchLibrary()
+        plan = library.connection.execute(
+            'EXPLAIN QUERY PLAN SELECT id FROM library_patches WHERE '
+            'miscellaneous_resonance > 20').fetchall()
+
+        self.assertIn('INDEX library_miscellaneous_resonance', plan[0][-1])
+
+    def test_invalid_conditions(self):
+        library = PatchLibrary()
+
+        with self.assertRaises(ValueError):
+            library.find([('miscellaneous.resonance', 'LIKE', 1)])
+
+        with self.assertRaises(ValueError):
+            library.find([('miscellaneous.missing', '==', 1)])
+
+        with self.assertRaises(ValueError):
+            library.find([('miscellaneous[*].resonance', '==', 1)])
+
+    def test_wildcards(self):
+        library = PatchLibrary()
+        library.add_records(self.bank, 'bank')
+        levels = np.zeros(len(self.bank), dtype=bool)
+
+        for i in range(4):
+            for j in range(3):
+                levels |= self.bank.column(
+                    'envelopes[%d].levels[%d]' % (i, j)) == 63
+
+        self.assertEqual(
+            library.count([('envelopes[*].levels[*]', '==', 63)]),
+            levels.sum())
+
+    def test_add_directory(self):
+        library = PatchLibrary()
+
+        self.assertEqual(library.add_directory(self.directory), 200)
+        self.assertEqual(len(library), 200)
+        # unchanged files are not read again.
+        self.assertEqual(library.add_directory(self.directory), 0)
+
+        self.bank[:40].to_sysex(os.path.join(self.directory, 'new.syx'))
+
+        self.assertEqual(library.add_directory(self.directory), 40)
+
+        pan = self.bank.column('miscellaneous.pan')
+
+        self.assertEqual(
+            library.count([('miscellaneous.pan', '==', int(pan[0]))]),
+            (pan == pan[0]).sum() + (pan[:40] == pan[0]).sum())
+
+    def test_out_of_range(self):
+        records = self.bank[:40].records.copy()
+        records[3, 6] = 64 << 1  # envelopes[0].levels[0] stored as 64.
+        records[5, 90] = 0xFF  # miscellaneous.resonance above 31.
+        PatchBank(records).to_sysex(os.path.join(self.directory, 'a.syx'))
+        library = PatchLibrary()
+
+        self.assertEqual(library.add_directory(self.directory), 238)
+        self.assertEqual(library.skipped, 2)
+        self.assertEqual(
+            [entry.position for entry in library.find()
+             if entry.source.endswith('a.syx')],
+            [i for i in range(40) if i not in (3, 5)])
+
+    def test_bulk(self):
+        filename = temporary_filename(self, 'library.sqlite')
+
+        with PatchLibrary(filename) as library:
+            with library.bulk():
+                library.add_records(self.bank)
+
+            self.assertEqual(library.count([('lfos[0].frequency', '>=', 0)]),
+                             200)
+
+        with PatchLibrary(filename) as library:
+            self.assertEqual(len(library), 200)
+
+            indexes = library.connection.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' "
+                "AND tbl_name = 'library_patches'").fetchone()[0]
+
+            self.assertEqual(indexes, len(PARAMETER_PATHS) + 1)
+
+
+@unittest.skipUnless(np, 'numpy is not installed')
+class TestSimilarityIndex(unittest.TestCase):
+    def test_features(self):
+        patch = ESQ1Patch()
+        patch.oscillators[1].waveform.value = Oscillator.BELL
+        patch.miscellaneous.frequency.set_maximum()
+        features = dict(zip(FEATURE_NAMES, patch_features(patch)[0]))
+
+        self.assertEqual(features['miscellaneous.frequency'], 1)
+        self.assertEqual(features['miscellaneous.resonance'], 0)
+        self.assertGreater(features['oscillators[1].waveform==1'], 0)
+        self.assertEqual(features['oscillators[1].waveform==0'], 0)
+
+    def test_query(self):
+        patches = random_patches(50)
+        index = SimilarityIndex(patches)
+        similar = deepcopy(patches[7])
+        similar.envelopes[2].times[0].value = \
+            (similar.envelopes[2].times[0].value + 1) % 64
+
+        [(nearest, distance)] = index.query(patches[7], k=1)
+
+        self.assertEqual(nearest, 7)
+        self.assertAlmostEqual(distance, 0, places=3)
+
+        nearest = index.query(similar, k=3)
+
+        self.assertEqual(nearest[0][0], 7)
+        self.assertEqual(len(nearest), 3)
+        self.assertLessEqual(nearest[1][1], nearest[2][1])
+
+
+@unittest.skipUnless(np, 'numpy is not installed')
+class TestPatchBank(unittest.TestCase):
+    def test_records_match_serialize(self):
+        patches = random_patches(20)
+        bank = PatchBank.from_patches(patches)
+
+        for record, patch in zip(bank.records, patches):
+            self.assertEqual(record.tobytes(), bytes(patch.serialize()))
+
+    def test_parity(self):
+        patches = random_patches(20)
+        bank = PatchBank.from_patches(patches)
+
+        for original, new in zip(patches, bank.to_patches()):
+            self.assertEqual(original.serialize(), new.serialize())
+
+    def test_column(self):
+        patches = random_patches(10)
+        bank = PatchBank.from_patches(patches)
+
+        for path in ['lfos[2].modulation_source', 'envelopes[1].levels[0]',
+                     'miscellaneous.pan_modulation_amount']:
+            self.assertEqual(
+                bank.column(path).tolist(),
+                [resolve_path(patch, path).value for patch in patches])
+
+    def test_set_column(self):
+        bank = PatchBank.blank(3)
+        bank.set_column('oscillators[2].frequency_modulation_amounts[1]',
+                        [-63, 0, 12])
+
+        values = [patch.oscillators[2].frequency_modulation_amounts[1].value
+                  for patch in bank.to_patches()]
+
+        self.assertEqual(values, [-63, 0, 12])
+
+        with self.assertRaises(ValueError):
+            bank.set_column('miscellaneous.pan', [0, 16, 3])
+
+    def test_random(self):
+        bank = PatchBank.random(500, rng=1)
+
+        self.assertEqual(len(bank), 500)
+        self.assertTrue((bank.column('oscillators[0].waveform') <=
+                         Oscillator.OCT_5).all())
+        self.assertTrue((bank.column('lfos[1].modulation_source') <=
+                         ModulationSource.OFF).all())
+        self.assertEqual(
+            bank.column('envelopes[0].levels[0]').min(), -63)
+
+        # every record can be deserialized into a valid patch.
+        bank.to_patches()
+
+    def test_random_is_seeded(self):
+        self.assertTrue((PatchBank.random(10, rng=5).records ==
+                         PatchBank.random(10, rng=5).records).all())
+
+    def test_random_split(self):
+        run = PatchBank.random(5000, rng=9).records
+        part = PatchBank.random(1000, rng=9, start=4000).records
+
+        self.assertTrue((run[4000:] == part).all())
+
+    def test_random_prefix(self):
+        run = PatchBank.random(RANDOM_BLOCK_SIZE + 20, rng=9).records
+
+        self.assertTrue((PatchBank.random(5, rng=9).records == run[:5]).all())
+        self.assertTrue((PatchBank.random(10, rng=9, start=RANDOM_BLOCK_SIZE)
+                         .records == run[RANDOM_BLOCK_SIZE:][:10]).all())
+
+    def test_random_string_seed(self):
+        self.assertTrue((PatchBank.random(10, rng='abc').records ==
+                         PatchBank.random(10, rng=b'abc').records).all())
+        self.assertFalse((PatchBank.random(10, rng='abc').records ==
+                          PatchBank.random(10, rng='abd').records).all())
+
+    def test_random_in_parallel(self):
+        count = RANDOM_BLOCK_SIZE * 2 + 10
+
+        self.assertTrue((PatchBank.random(count, rng=4).records ==
+                         PatchBank.random(count, rng=4, processes=2).records)
+                        .all())
+
+        start = RANDOM_BLOCK_SIZE // 2
+        self.assertTrue(
+            (PatchBank.random(count, rng=4, start=start).records ==
+             PatchBank.random(count, rng=4, start=start, processes=2).records)
+            .all())
+
+    def test_to_sysex(self):
+        bank = PatchBank.random(41, rng=2)
+        filename = temporary_filename(self, 'bank.syx')
+        bank.to_sysex(filename)
+
+        with open(filename, 'rb') as sysex_file:
+            sysex = sysex_file.read()
+
+        dump_length = 5 + 40 * PCB_LENGTH * 2 + 1
+
+        self.assertEqual(len(sysex), dump_length * 2)
+
+        with open(filename, 'wb') as sysex_file:
+            sysex_file.write(sysex[:dump_length])
+
+        patches = sysex_to_esq1_patches(filename)
+
+        self.assertEqual([patch.serialize() for patch in patches],
+                         [bytearray(record) for record in bank.records[:40]])
+
+    def test_view(self):
+        bank = PatchBank.blank(2)
+        bank.view(1).miscellaneous.frequency.value = 99
+
+        self.assertEqual(bank.column('miscellaneous.frequency').tolist(),
+                         [0, 99])
+
+    def test_validate(self):
+        bank = PatchBank.random(10, rng=6)
+
+        self.assertEqual(bank.validate(), [])
+
+        # a signed value of 64, and a value above the maximum.
+        bank.records[7, 6] = (bank.records[7, 6] & 0x01) | (64 << 1)
+        bank.records[3, 90] = 0xFF
+        invalid = bank.validate()
+
+        self.assertEqual(invalid, [
+            InvalidField(3, 'miscellaneous.resonance', 0xFF),
+            InvalidField(7, 'envelopes[0].levels[0]', 64),
+        ])
+
+        with self.assertRaises(ValueError):
+            bank.to_patches()
+
+    def test_validate_pcb(self):
+        bank = PatchBank.random(20, rng=8)
+        bank.records[4, 6] = (bank.records[4, 6] & 0x01) | (64 << 1)
+        bank.records[9, 90] = 0xFF
+        bank.records[9, 7] = 64 << 1
+        invalid = [field for i, record in enumerate(bank.records)
+                   for field in validate_pcb(record.tobytes(), index=i)]
+
+        self.assertEqual(len(invalid), 3)
+        self.assertEqual(sorted(invalid), sorted(bank.validate()))
+
+        view = bank.view(4)
+
+        with self.assertRaises(ValueError):
+            view.to_patch()
+
+        patch = view.to_patch(repair=True)
+
+        self.assertEqual(patch.envelopes[0].levels[0].value, -63)
+        self.assertEqual(len(view.validate()), 1)
+        self.assertEqual(len(view.validate(repair=True)), 1)
+        self.assertEqual(view.validate(), [])
+        self.assertEqual(bank.validate(repair=True),
+                         [field for field in invalid if field.index == 9])
+        self.assertEqual(bank.validate(), [])
+
+    def test_column_signed_64(self):
+        bank = PatchBank.blank(3)
+        bank.records[2, 6] = (bank.records[2, 6] & 0x01) | (64 << 1)
+
+        with self.assertRaisesRegex(ValueError, 'record 2'):
+            bank.column('envelopes[0].levels[0]')
+
+        self.assertEqual(bank.raw_column('envelopes[0].levels[0]')[2], 64)
+
+    def test_repair(self):
+        bank = PatchBank.random(3, rng=7)
+        bank.records[1, 6] = (bank.records[1, 6] & 0x01) | (64 << 1)
+        bank.records[2, 90] = 0xFF
+
+        self.assertEqual(len(bank.validate(repair=True)), 2)
+        self.assertEqual(bank.validate(), [])
+        self.assertEqual(bank.column('envelopes[0].levels[0]')[1], -63)
+        self.assertEqual(bank.column('miscellaneous.resonance')[2], 31)
+
+    def test_section(self):
+        patches = random_patches(5)
+        bank = PatchBank.from_patches(patches)
+        sections = bank.section('lfos[2]')
+
+        self.assertEqual([section.tobytes() for section in sections],
+                         [bytes(patch.lfos[2].serialize())
+                          for patch in patches])
+        self.assertEqual(
+            section_columns(sections, LFO)['modulation_source'].tolist(),
+            bank.column('lfos[2].modulation_source').tolist())
+
+    def test_names(self):
+        bank = PatchBank.blank(2)
+        bank.names = ['first', 'secondpatch']
+
+        self.assertEqual(bank.names, ['FIRST ', 'SECOND'])
+        self.assertEqual(bank[1].name, 'SECOND')
+
+
+@unittest.skipUnless(np, 'numpy is not installed')
+class TestEvolution(unittest.TestCase):
+    def test_section_spans(self):
+        self.assertEqual(len(SECTION_SPANS), 4 + 3 + 3 + 1)
+        self.assertEqual(SECTION_SPANS[0], (6, Envelope.PCB_LENGTH))
+        self.assertEqual(sum(SECTION_SPANS[-1]), PCB_LENGTH)
+
+    def test_mutate(self):
+        bank = PatchBank.random(200, rng=1)
+        rng = np.random.default_rng(1)
+
+        unchanged = mutate(bank, 0, rng)
+        self.assertTrue((unchanged.records == bank.records).all())
+
+        mutated = mutate(bank, {'oscillators[0].waveform': 1}, rng)
+        paths = set(difference.path
+                    for index, differences in diff_banks(bank, mutated)
+                    for difference in differences)
+
+        self.assertEqual(paths, set(['oscillators[0].waveform']))
+
+        # every mutated record is still a valid patch.
+        mutate(bank, 1, rng).to_patches()
+
+    def test_crossover(self):
+        a = PatchBank.blank(50)
+        b = PatchBank.random(50, rng=2)
+        child = crossover(a, b, np.random.default_rng(2))
+
+        for record, other in zip(child.records, b.records):
+            for start, length in SECTION_SPANS:
+                section = record[start:start + length]
+                self.assertTrue(
+                    (section == a.records[0][start:start + length]).all() or
+                    (section == other[start:start + length]).all())
+
+        self.assertEqual(child.names, a.names)
+
+    def test_run(self):
+        evolution = Evolution(filter_frequency,
+                              PatchBank.random(40, rng=3), seed=3)
+        start = evolution.scores.max()
+        stats = evolution.run(10)
+
+        self.assertEqual(len(stats), 10)
+        self.assertEqual(evolution.generation, 10)
+        self.assertEqual(len(evolution.population), 40)
+        self.assertGreaterEqual(evolution.scores.max(), start)
+        self.assertGreater(evolution.generations_per_second, 0)
+
+        patch, score = evolution.best()
+        self.assertEqual(patch.miscellaneous.frequency.value, score)
+
+    def test_string_seed(self):
+        population = PatchBank.random(20, rng=5)
+        runs = [Evolution(filter_frequency, population, seed=seed)
+                for seed in ['x', b'x']]
+
+        for evolution in runs:
+            evolution.run(3)
+
+        self.assertTrue((runs[0].population.records ==
+                         runs[1].population.records).all())
+
+    def test_processes(self):
+        population = PatchBank.random(20, rng=4)
+
+        with Evolution(filter_frequency, population, processes=2) as parallel:
+            self.assertEqual(
+                parallel.scores.tolist(),
+                population.column('miscellaneous.frequency').tolist())
+
+
+@unittest.skipUnless(np, 'numpy is not installed')
+class TestPatchGenerator(unittest.TestCase):
+    def test_constraints(self):
+        generator = PatchGenerator(
+            constraints=[is_audible, in_range('miscellaneous.frequency', 40)],
+            rng=1, batch_size=256)
+        bank = generator.generate(1000)
+
+        self.assertEqual(len(bank), 1000)
+        self.assertTrue((bank.column('miscellaneous.frequency') >= 40).all())
+        self.assertTrue(is_audible(bank.columns()).all())
+        self.assertLess(generator.acceptance_rate, 1)
+
+    def test_is_audible(self):
+        bank = PatchBank.from_columns({
+            'oscillators[1].dca_enable': [1, 1, 1, 0],
+            'oscillators[1].dca_level': [63, 63, 63, 63],
+            'envelopes[3].levels[1]': [63, -63, 0, 63],
+            'miscellaneous.dca4_modulation_amount': [63, 63, 63, 63]},
+            count=4)
+
+        # a negative level is clipped at zero, so is silent.
+        self.assertEqual(is_audible(bank.columns()).tolist(),
+                         [True, False, False, False])
+
+    def test_distributions(self):
+        generator = PatchGenerator({
+            'oscillators[0].waveform': {Oscillator.SAW: 1,
+                                        Oscillator.SQUARE: 3},
+            'miscellaneous.resonance': (10, 12),
+        }, rng=2)
+        bank = generator.generate(1000)
+        waveforms = bank.column('oscillators[0].waveform')
+
+        self.assertEqual(set(waveforms.tolist()),
+                         set([Oscillator.SAW, Oscillator.SQUARE]))
+        self.assertGreater((waveforms == Oscillator.SQUARE).sum(), 600)
+        self.assertEqual(set(bank.column('miscellaneous.resonance').tolist()),
+                         set([10, 11, 12]))
+
+    def test_invalid_distributions(self):
+        with self.assertRaises(ValueError):
+            PatchGenerator({'miscellaneous.resonance': (0, 32)})
+
+        with self.assertRaises(ValueError):
+            PatchGenerator({'miscellaneous.pan': {16: 1}})
+
+        with self.assertRaises(ValueError):
+            PatchGenerator({'miscellaneous.missing': (0, 1)})
+
+    def test_impossible(self):
+        generator = PatchGenerator(
+            constraints=[in_range('miscellaneous.pan', 16)], batch_size=10)
+
+        with self.assertRaises(ValueError):
+            generator.generate(1, max_batches=3)
+
+    def test_iterate(self):
+        generator = PatchGenerator(constraints=[is_audible], rng=3,
+                                   batch_size=16)
+        patches = [patch for patch, i in zip(generator, range(40))]
+
+        self.assertEqual(len(patches), 40)
+
+        for patch in patches:
+            self.assertTrue(any(oscillator.dca_enable.value and
+                                oscillator.dca_level.value
+                                for oscillator in patch.oscillators))
+
+
+@unittest.skipUnless(np, 'numpy is not installed')
+class TestRender(unittest.TestCase):
+    def test_silent(self):
+        samples = render(ESQ1Patch(), duration=0.5)
+
+        self.assertEqual(samples.shape, (22050, 2))
+        self.assertEqual(abs(samples).max(), 0)
+
+    def test_no_samples(self):
+        for duration in [0, 1e-6]:
+            self.assertEqual(render(audible_patch(), duration=duration).shape,
+                             (0, 2))
+
+    def test_pitch(self):
+        samples = render(audible_patch(), note=69, duration=1.0)[:, 0]
+        crossings = ((samples[:-1] < 0) & (samples[1:] >= 0)).sum()
+
+        self.assertAlmostEqual(crossings, 440, delta=2)
+
+    def test_envelope(self):
+        patch = audible_patch()
+        patch.envelopes[3].times[3].value = 0
+        samples = render(patch, duration=1.0, hold=0.5)
+
+        self.assertGreater(abs(samples[:22000]).max(), 0.1)
+        self.assertEqual(abs(samples[22100:]).max(), 0)
+
+    def test_filter(self):
+        patch = audible_patch(Oscillator.SAW)
+        bright = render(patch, duration=0.5)
+        patch.miscellaneous.frequency.value = 40
+        dark = render(patch, duration=0.5)
+
+        def high_frequency_energy(samples):
+            return (np.diff(samples[:, 0]) ** 2).sum()
+
+        self.assertLess(high_frequency_energy(dark),
+                        high_frequency_energy(bright) / 10)
+
+    def test_random_patches(self):
+        for patch in random_patches(10):
+            self.assertTrue(np.isfinite(render(patch, duration=0.2)).all())
+
+    def test_write_wav(self):
+        filename = temporary_filename(self, 'patch.wav')
+        write_wav(filename, render(audible_patch(), duration=0.1))
+
+        wav = wave.open(filename, 'rb')
+
+        try:
+            self.assertEqual(wav.getnchannels(), 2)
+            self.assertEqual(wav.getsampwidth(), 2)
+            self.assertEqual(wav.getnframes(), 4410)
+        finally:
+            wav.close()
+
+    def test_render_files(self):
+        patches = [audible_patch() for i in range(3)]
+        patches[1].name = 'HORN'
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        filenames = render_files(patches, directory, processes=2,
+                                 duration=0.1)
+
+        self.assertEqual([os.path.basename(filename)
+                          for filename in filenames],
+                         ['0000.wav', '0001 HORN.wav', '0002.wav'])
+
+        for filename in filenames:
+            self.assertTrue(os.path.exists(filename))
+
+
+@unittest.skipUnless(np, 'numpy is not installed')
+class TestCurveEvaluator(unittest.TestCase):
+    def setUp(self):
+        self.t = np.linspace(0, 4, 401)
+        self.evaluator = CurveEvaluator(self.t)
+
+    def test_envelope(self):
+        envelope = Envelope()
+        envelope.levels[0].value = 63
+        envelope.levels[1].value = -63
+        envelope.levels[2].value = 21
+        envelope.times[0].value = 30
+        envelope.times[3].value = 30
+        curve, = self.evaluator.envelopes(envelope, hold=2.0)
+        attack = float(envelope_seconds(30))
+
+        self.assertEqual(curve[0], 0)
+        self.assertAlmostEqual(np.interp(attack / 2, self.t, curve), 0.5,
+                               places=2)
+        # times[1] and times[2] are instant.
+        self.assertAlmostEqual(curve[self.t.searchsorted(1.0)], 1 / 3.0)
+        self.assertEqual(curve[-1], 0)
+
+    def test_velocity(self):
+        envelope = Envelope()
+        envelope.levels[2].value = 63
+        envelope.velocity_level.value = 63
+        curves = self.evaluator.envelopes([envelope, envelope],
+                                          velocity=[127, 0])
+
+        self.assertAlmostEqual(curves[0, 50], 1)
+        self.assertAlmostEqual(curves[1, 50], 0)
+
+    def test_bank(self):
+        bank = PatchBank.random(50, rng=5)
+        curves = self.evaluator.envelopes(bank.section('envelopes[1]'),
+                                          note=np.arange(50) + 40)
+
+        self.assertEqual(curves.shape, (50, len(self.t)))
+        self.assertTrue((abs(curves) <= 1).all())
+
+        for i in [0, 17, 49]:
+            single = self.evaluator.envelopes(
+                bank[i].envelopes[1], note=40 + i)
+
+            self.assertTrue(np.allclose(single[0], curves[i]))
+
+    def test_cache(self):
+        bank = PatchBank.random(20, rng=6)
+        bank.records[10:] = bank.records[0]
+
+        # records 10 to 19 are copies of record 0.
+        self.evaluator.envelopes(bank.section('envelopes[0]'))
+        self.assertEqual(self.evaluator.misses, 10)
+
+        self.evaluator.envelopes(bank.section('envelopes[0]'))
+        self.assertEqual(self.evaluator.misses, 10)
+        self.assertEqual(self.evaluator.hits, 10 + 20)
+
+    def test_lfo(self):
+        lfo = LFO()
+        lfo.waveform.value = LFO.SQR
+        lfo.reset.value = True
+        lfo.frequency.value = 21
+        lfo.levels[0].value = 63
+        lfo.levels[1].value = 63
+        curve, = self.evaluator.lfos(lfo)
+
+        self.assertEqual(set(curve.tolist()), set([-1.0, 1.0]))
+        self.assertEqual(curve[0], 1)
+        # 0.4 Hz, so the first half cycle lasts 1.25 seconds.
+        self.assertEqual(curve[self.t.searchsorted(1.2)], 1)
+        self.assertEqual(curve[self.t.searchsorted(1.3)], -1)
+
+    def test_lfo_delay(self):
+        lfo = LFO()
+        lfo.waveform.value = LFO.SAW
+        lfo.frequency.value = 30
+        lfo.levels[1].value = 63
+        lfo.delay.value = 60
+        curves = self.evaluator.lfos(PatchBank.random(10, rng=7)
+                                     .section('lfos[0]'))
+
+        self.assertEqual(curves.shape, (10, len(self.t)))
+        self.assertEqual(self.evaluator.lfos(lfo)[0, 0], 0)
+        self.assertGreater(abs(self.evaluator.lfos(lfo)[0]).max(), 0.9)
+
+    def test_lfo_random_per_section(self):
+        lfos = [LFO() for i in range(3)]
+
+        for i, lfo in enumerate(lfos):
+            lfo.waveform.value = LFO.NOISE if i else LFO.SAW
+            lfo.frequency.value = 40
+            lfo.levels[0].value = 63 - i
+
+        curves = self.evaluator.lfos(lfos[:2], seed=3)
+        saw = LFO()
+        saw.deserialize(iter(lfos[0].serialize()))
+        saw.levels[0].value = 62
+
+        # each section has its own starting phase and noise.
+        self.assertNotAlmostEqual(
+            curves[0, 0], CurveEvaluator(self.t).lfos(saw, seed=3)[0, 0])
+        self.assertFalse(np.allclose(
+            curves[1] / 62.0, self.evaluator.lfos(lfos[2], seed=3)[0] / 61.0))
+
+        # and does not depend on the other sections evaluated with it.
+        evaluator = CurveEvaluator(self.t)
+        np.testing.assert_array_equal(
+            evaluator.lfos(lfos[1:], seed=3)[0], curves[1])
+
+
+@unittest.skipUnless(np, 'numpy is not installed')
+class TestSharedPatchBank(unittest.TestCase):
+    def setUp(self):
+        self.bank = SharedPatchBank.random(100, rng=9)
+        self.addCleanup(self.bank.unlink)
+        self.addCleanup(self.bank.close)
+
+    def test_attach(self):
+        records = self.bank.records.copy()
+        attached = SharedPatchBank(name=self.bank.name)
+
+        self.assertFalse(attached.owner)
+        self.assertTrue((attached.records == records).all())
+
+        attached.view(5).lfos[1].delay.value = 3
+        self.assertEqual(self.bank.column('lfos[1].delay')[5], 3)
+
+        attached.close()
+
+    def test_pickle(self):
+        data = pickle.dumps(self.bank)
+        copy = pickle.loads(data)
+
+        self.assertLess(len(data), 200)
+        self.assertEqual(copy.name, self.bank.name)
+        self.assertEqual(len(copy), 100)
+
+        copy.close()
+
+    def test_constructors(self):
+        with SharedPatchBank.from_columns({'miscellaneous.pan': [1, 2]},
+                                          names=['A', 'B']) as bank:
+            self.assertIsInstance(bank, SharedPatchBank)
+            self.assertEqual(bank.column('miscellaneous.pan').tolist(),
+                             [1, 2])
+            self.assertEqual(bank.names, ['A     ', 'B     '])
+
+        with SharedPatchBank() as bank:
+            self.assertEqual(len(bank), 0)
+
+    def test_slice(self):
+        part = self.bank[10:20]
+        part.records[0, 0] = ord('Z')
+
+        self.assertIsInstance(part, PatchBank)
+        self.assertEqual(self.bank.names[10][0], 'Z')
+
+        del part
+
+    def test_map(self):
+        self.bank.names = ['P%d' % i for i in range(100)]
+        names = self.bank.map(set_filter_frequency, processes=2)
+
+        self.assertEqual(names, ['P%-5d' % i for i in range(100)])
+        self.assertEqual(self.bank.column('miscellaneous.frequency').tolist(),
+                         list(range(100)))
+        self.assertEqual(self.bank.map(set_filter_frequency, [3, 1],
+                                       processes=1), ['P3    ', 'P1    '])
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.bank = PatchBank.random(50, rng=10)
+        self.bank.names = ['P%d' % i for i in range(50)]
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def assertBanksEqual(self, banks, bank):
+        self.assertTrue((np.concatenate([b.records for b in banks]) ==
+                         bank.records).all())
+
+    def test_json_lines(self):
+        lines = list(iter_json_lines(self.bank, chunk_size=16))
+        patch = self.bank[7]
+        tree = json.loads(lines[7])
+
+        self.assertEqual(len(lines), 50)
+        self.assertTrue(all(line.endswith('}\n') for line in lines))
+        self.assertEqual(tree['name'], 'P7    ')
+        self.assertEqual(sorted(tree), ['envelopes', 'lfos', 'miscellaneous',
+                                        'name', 'oscillators'])
+
+        for path in PARAMETER_PATHS:
+            value = tree
+
+            for part in parse_path(path):
+                value = value[part]
+
+            self.assertEqual(value, resolve_path(patch, path).value)
+
+    def test_json_lines_round_trip(self):
+        filename = os.path.join(self.directory, 'patches.jsonl')
+
+        self.assertEqual(write_json_lines(self.bank, filename), 50)
+
+        banks = list(read_json_lines(filename, chunk_size=16))
+
+        self.assertEqual([len(bank) for bank in banks], [16, 16, 16, 2])
+        self.assertBanksEqual(banks, self.bank)
+
+    def test_json_lines_sources(self):
+        patches = self.bank.to_patches()
+        sources = [patches[:3], [self.bank.view(3), self.bank.records[4]],
+                   [self.bank[5:50]]]
+        lines = [line for source in sources
+                 for line in iter_json_lines(iter(source), chunk_size=2)]
+
+        self.assertEqual(lines, list(iter_json_lines(self.bank)))
+
+    def test_json_lines_defaults(self):
+        lines = ['{"name": "a", "oscillators": [{}, {"semitone": 7}]}', '',
+                 '{}']
+        bank, = iter_json_banks(lines)
+
+        self.assertEqual(bank.names, ['A     ', '      '])
+        self.assertEqual(bank.column('oscillators[1].semitone').tolist(),
+                         [7, 36])
+        self.assertTrue((bank.records[1] == PatchBank.blank(1).records[0])
+                        .all())
+
+    def test_json_lines_invalid(self):
+        with self.assertRaisesRegex(ValueError, 'Line 2'):
+            list(iter_json_banks(['{}', '{']))
+
+        with self.assertRaisesRegex(ValueError, 'Line 1'):
+            list(iter_json_banks(['[]']))
+
+        with self.assertRaisesRegex(ValueError,
+                                    'Line 3: miscellaneous.resonance'):
+            list(iter_json_banks(['{}', '{}', '{"miscellaneous": '
+                                              '{"resonance": 99}}']))
+
+        with self.assertRaisesRegex(ValueError,
+                                    'Line 1: miscellaneous.frequency'):
+            list(iter_json_banks(['{"miscellaneous": '
+                                  '{"frequency": 100000}}']))
+
+        for value in ['1.7', '"12"', 'true', 'null']:
+            with self.assertRaisesRegex(ValueError,
+                                        'Line 2: miscellaneous.resonance'):
+                list(iter_json_banks(['{}', '{"miscellaneous": '
+                                            '{"resonance": %s}}' % value]))
+
+        with self.assertRaisesRegex(ValueError, 'Line 1: name'):
+            list(iter_json_banks(['{"name": 5}']))
+
+    def test_npy_records(self):
+        records, = iter_npy_records(self.bank)
+
+        self.assertEqual(records.dtype, RECORD_DTYPE)
+        self.assertEqual(records['name'][3], b'P3    ')
+        self.assertEqual(records['lfos[2].waveform'].tolist(),
+                         self.bank.column('lfos[2].waveform').tolist())
+
+    def test_npy_round_trip(self):
+        filename = os.path.join(self.directory, 'patches.npy')
+
+        self.assertEqual(write_npy(iter(self.bank.to_patches()), filename,
+                                   chunk_size=16), 50)
+
+        records = np.load(filename)
+
+        self.assertEqual(records.shape, (50,))
+        self.assertEqual(records['miscellaneous.resonance'].tolist(),
+                         self.bank.column('miscellaneous.resonance').tolist())
+        self.assertBanksEqual(list(read_npy(filename, chunk_size=16)),
+                              self.bank)
+
+        self.assertEqual(write_npy([], filename), 0)
+        self.assertEqual(np.load(filename).shape, (0,))
+        self.assertEqual(list(read_npy(filename)), [])
+
+    def test_npy_fields(self):
+        filename = os.path.join(self.directory, 'patches.npy')
+        records = np.zeros(2, dtype=[('oscillators[0].semitone', np.int8)])
+        records['oscillators[0].semitone'] = [3, 70]
+        np.save(filename, records)
+
+        bank, = read_npy(filename)
+
+        self.assertEqual(bank.column('oscillators[0].semitone').tolist(),
+                         [3, 70])
+        self.assertEqual(bank.names, ['      '] * 2)
+
+        np.save(filename, np.zeros(2, dtype=[('volume', np.int8)]))
+
+        with self.assertRaisesRegex(ValueError, 'volume'):
+            list(read_npy(filename))
+
+
 if __name__ == '__main__':
     unittest.main()